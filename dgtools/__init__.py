@@ -2,23 +2,51 @@
 
 Basic imports to make Digirule and DGB_Archive available to other programs.
 
+Modules that depend on heavy third party packages (the pygments lexer, the HTML renderers and the makefile parser) 
+or that only some tools need (bundles of archives) are only imported when one of their names is first accessed.
+
 :author: Athanasios Anastasiou
 :date: May 2020
 """
-from .digirule import Digirule, Digirule2U
+
+__version__ = "1.0.4"
+
+import importlib
+
+from .digirule import Digirule, Digirule2U, DigiruleRunResult, DigiruleSnapshot
 from .dgb_archive import DGB_Archive
-from .lexer import DigiruleASMLexer
-from .assembler import DgAssembler
+from .assembler import DgAssembler, DgIncrementalAssembler
 from .exceptions import (DgtoolsErrorSymbolUndefined, DgtoolsErrorSymbolAlreadyDefined, 
                          DgtoolsErrorOpcodeNotSupported, DgtoolsErrorDgbarchiveCorrupted, 
                          DgtoolsErrorDgbarchiveVersionIncompatible, DgtoolsErrorProgramHalt,
                          DgtoolsErrorOutOfMemory, DgtoolsErrorASMSyntaxError, DgtoolsErrorStackUnderflow, 
-                         DgtoolsErrorStackOverflow, DgtoolsError)
-from .output_render_html import Output_Render_HTML
+                         DgtoolsErrorStackOverflow, DgtoolsErrorDgtTraceCorrupted, DgtoolsErrorDgbBundleCorrupted,
+                         DgtoolsErrorInfiniteLoop, DgtoolsError)
+from .dgt_trace import DGT_TraceWriter, DGT_TraceReader, DGT_State
+from .result_cache import DGB_ResultCache, DGB_ResultStore
 from .callbacks import (DigiruleCallbackComOutStdout, DigiruleCallbackComOutStoreMem, 
                         DigiruleCallbackComInUserInteraction, DigiruleCallbackInputUserInteraction,
-                        DigiruleCallbackPinInUserInteraction)
-from .lexer import DigiruleASMLexer
-from .makefile_rw import DgToolsMakefileParser
-                                
+                        DigiruleCallbackPinInUserInteraction, DigiruleCallbackInputSequence, 
+                        DigiruleCallbackInputRecorder)
+
 BUILTIN_MODELS = {"2A":Digirule, "2U":Digirule2U}
+
+# Names that are imported from their module the first time they are accessed.
+_LAZY_IMPORTS = {"DigiruleASMLexer":"lexer",
+                 "Output_Render_HTML":"output_render_html",
+                 "Output_Trace_HTML":"output_render_html",
+                 "DgToolsMakefileParser":"makefile_rw",
+                 "DGB_BundleWriter":"dgb_bundle",
+                 "DGB_BundleReader":"dgb_bundle"}
+
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_LAZY_IMPORTS[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
@@ -8,15 +8,95 @@ Digirule assembler support.
 
 from .digirule import Digirule
 from .exceptions import DgtoolsErrorSymbolAlreadyDefined, DgtoolsErrorSymbolUndefined, DgtoolsErrorASMSyntaxError
-import pyparsing
 import functools
+import re
+
+# The tokens of the assembly language. Each one is matched exactly as the grammar of DgAssembler._get_grammar()
+# matches it, so that both split the source the same way.
+_QUOTED_STRING = r'"(?:[^"\n\r\\]|(?:"")|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*"|' \
+                 r"'(?:[^'\n\r\\]|(?:'')|(?:\\(?:[^x]|x[0-9a-fA-F]+)))*'"
+_LITERAL_CHAR = r"\"[ -~]\"|'[ -~]'"
+_TOKEN_RE = re.compile(r"[ \t\r]*(?:"
+                       r"(?P<comment>#.*)|"
+                       rf"(?P<string>{_QUOTED_STRING})|"
+                       rf"(?P<char>{_LITERAL_CHAR})|"
+                       r"(?P<xuchar>0x[0-9A-F][0-9A-F]?)|"
+                       r"(?P<buchar>0b[01]+)|"
+                       r"(?P<uchar>[-]?[0-9][0-9]?[0-9]?)|"
+                       r"(?P<directive>\.DB|\.EQU)|"
+                       r"(?P<identifier>[a-zA-Z_][a-zA-Z0-9_]*)|"
+                       r"(?P<punctuation>[:,=]))?")
+_LITERAL_CHAR_RE = re.compile(_LITERAL_CHAR)
+
+# The mnemonics and the grammar of each Digirule model are built once and shared by every DgAssembler of the model.
+_MODEL_CACHE = {}
+
 
 class DgAssembler:
-    
+    """
+    Assembles Digirule ASM to Digirule binaries.
+
+    Notes:
+        * Text is parsed by a table driven tokenizer (see ``get_asm_mnemonics`` of each Digirule model). The
+          pyparsing grammar of the language is only built for text that the tokenizer cannot parse, to
+          report syntax errors or parse the rare constructs that the tokenizer does not handle (for example
+          mnemonics that are not separated from their operands).
+        * Parsed statements are tuples of (command, arguments, (line, column)). The command is ``def_label``,
+          ``def_db``, ``def_equ`` or the opcode of an instruction.
+        * The mnemonics and the grammar of a model are cached, constructing assemblers is cheap.
+    """
     def __init__(self, digirule_cls):
         if not issubclass(digirule_cls, Digirule):
             raise TypeError(f"Expected Digirule, received {type(digirule_cls)}")
+        if digirule_cls not in _MODEL_CACHE:
+            _MODEL_CACHE[digirule_cls] = {"mnemonics":digirule_cls.get_asm_mnemonics(), "grammar":None}
+        self._digirule_cls = digirule_cls
+        self._model_cache = _MODEL_CACHE[digirule_cls]
+        self._mnemonics = self._model_cache["mnemonics"]
         
+    @staticmethod
+    def enable_packrat(cache_size_limit=128):
+        """
+        Turns on packrat memoisation of the pyparsing grammars.
+
+        Notes:
+            * Packrat memoisation is a pyparsing setting, it applies to every grammar in the process and cannot be 
+              turned off once on.
+            * Only text that the tokenizer cannot parse goes through the grammar.
+
+        :param cache_size_limit: The maximum number of parse results to keep.
+        :type cache_size_limit: int (>0)
+        """
+        if type(cache_size_limit) is not int or cache_size_limit < 1:
+            raise ValueError(f"Expected cache_size_limit as int>0, received {cache_size_limit}")
+        import pyparsing
+        pyparsing.ParserElement.enablePackrat(cache_size_limit)
+
+    @staticmethod
+    def clear_cache():
+        """
+        Drops the cached mnemonics and grammars of every model (for example, after changing a model's instruction 
+        set).
+        """
+        _MODEL_CACHE.clear()
+
+    @property
+    def grammar(self):
+        """
+        The pyparsing grammar of the Digirule ASM that the model understands, built the first time it is needed.
+
+        :rtype: pyparsing.ParserElement
+        """
+        if self._model_cache["grammar"] is None:
+            self._model_cache["grammar"] = self._get_grammar()
+        return self._model_cache["grammar"]
+
+    def _get_grammar(self):
+        """
+        Builds the pyparsing grammar of the Digirule ASM that the model understands.
+        """
+        # pyparsing is only imported for the (few) programs that the tokenizer cannot parse.
+        import pyparsing
         # Action functions to convert valid string literals to numbers
         char2num = lambda toks:ord(toks[0][1:-1]) & 0xFF
         uchar2num = lambda toks:int(toks[0]) & 0xFF
@@ -47,7 +127,7 @@ class DgAssembler:
                          "literal":literal,
                          "literal_or_identifier":literal_or_identifier}
         # Existing defs are passed down in case the digirule ASM code needs to specialise instructions
-        asm_statement = digirule_cls.get_asm_statement_def(existing_defs)
+        asm_statement = self._digirule_cls.get_asm_statement_def(existing_defs)
         
         # Assembler directives
         # label: Defines a label
@@ -71,72 +151,228 @@ class DgAssembler:
         # Comments
         # A line of ASM code is either a comment or code with an optional inline comment
         prog_or_dir_statement = pyparsing.Group(asm_statement ^ dir_statement)("prog_dir_statement")
+        # The line and column a statement starts at, so that every byte of the object code can be traced back to its 
+        # source.
+        src_pos = pyparsing.Empty().setParseAction(lambda s, loc, toks:[(pyparsing.lineno(loc, s), 
+                                                                         pyparsing.col(loc, s))])("src_pos")
         dir_comment = pyparsing.Group(pyparsing.Suppress("#") + pyparsing.restOfLine("text"))("def_comment")
-        dir_code_comment = pyparsing.Group(dir_comment ^ (prog_or_dir_statement + pyparsing.Optional(dir_comment)))
+        dir_code_comment = pyparsing.Group(dir_comment ^ (src_pos + prog_or_dir_statement + \
+                                                          pyparsing.Optional(dir_comment)))
         program = pyparsing.OneOrMore(dir_code_comment)
         # In the end, ignore the comments.
         program.ignore(dir_comment)
         
-        self._parser = program
+        return program
         
-    
-    def text_to_ast(self, asm_code_text):
+    @staticmethod
+    def _tokenize_line(asm_line, line_number):
+        """
+        Splits a line of ASM code to tokens.
+
+        :param asm_line: A line of ASM code.
+        :type asm_line: str
+        :param line_number: The number of the line (starting at 1).
+        :type line_number: int
+        :returns: The tokens of the line as (kind, value, (line, column)) or None if the line contains text that is
+                  not a token.
+        :rtype: list<tuple<str, object, tuple<int, int>>>
+        """
+        # Columns are counted with tabs expanded, as pyparsing counts them.
+        asm_line = asm_line.expandtabs()
+        tokens = []
+        pos = 0
+        line_length = len(asm_line)
+        while True:
+            a_match = _TOKEN_RE.match(asm_line, pos)
+            kind = a_match.lastgroup
+            if kind is None:
+                # Only whitespace could be matched
+                return tokens if a_match.end() == line_length else None
+            text = a_match.group(kind)
+            start = a_match.start(kind)
+            pos = a_match.end()
+            if kind == "comment":
+                return tokens
+            if kind == "string":
+                # A quoted single character is a literal, unless the string it starts is longer.
+                a_char = _LITERAL_CHAR_RE.match(asm_line, start)
+                if a_char is not None and len(text) <= 3:
+                    kind, text, pos = "char", a_char.group(0), a_char.end()
+            if kind == "string":
+                value = [(ord(u) & 0xFF) for u in text[1:-1]]
+            elif kind == "char":
+                value = ord(text[1:-1]) & 0xFF
+            elif kind == "uchar":
+                value = int(text) & 0xFF
+            elif kind == "buchar":
+                value = int(text, 2) & 0xFF
+            elif kind == "xuchar":
+                value = int(text, 16) & 0xFF
+            elif kind == "punctuation":
+                kind = value = text
+            else:
+                value = text
+            tokens.append((kind, value, (line_number, start + 1)))
+
+    def _tokenize(self, asm_code_text):
+        """
+        Splits ASM code to tokens.
+
+        :param asm_code_text: The ASM code.
+        :type asm_code_text: str
+        :returns: The tokens of the code (see _tokenize_line) or None if it contains text that is not a token.
+        :rtype: list<tuple<str, object, tuple<int, int>>>
+        """
+        tokens = []
+        for line_number, asm_line in enumerate(asm_code_text.split("\n"), start=1):
+            line_tokens = self._tokenize_line(asm_line, line_number)
+            if line_tokens is None:
+                return None
+            tokens.extend(line_tokens)
+        return tokens
+
+    def _tokens_to_ast(self, tokens):
+        """
+        Groups tokens to statements.
+
+        :param tokens: The tokens of a program (as returned by _tokenize_line).
+        :type tokens: list<tuple<str, object, tuple<int, int>>>
+        :returns: The statements of the program, or None if the tokens do not form a valid program.
+        :rtype: list<tuple<object, object, tuple<int, int>>>
+        """
+        # Tokens that can be used as the value of a literal or the operand of an instruction
+        literal_kinds = ("uchar", "buchar", "xuchar", "char")
+        operand_kinds = literal_kinds + ("identifier",)
+        mnemonics = self._mnemonics
+        statements = []
+        # A sentinel marks the end of the program
+        tokens = tokens + [(None, None, None)]
+        k = 0
+        n_tokens = len(tokens) - 1
+        while k < n_tokens:
+            kind, value, position = tokens[k]
+            if kind == "identifier" and tokens[k + 1][0] == ":":
+                statements.append(("def_label", value, position))
+                k += 2
+            elif kind == "identifier" and value in mnemonics:
+                opcode, operands = mnemonics[value]
+                operand_tokens = tokens[(k + 1):(k + 1 + len(operands))]
+                if not all(map(lambda x:x[0] in operand_kinds, operand_tokens)) or \
+                   len(operand_tokens) < len(operands):
+                    return None
+                statements.append((opcode, [x[1] for x in operand_tokens], position))
+                k += 1 + len(operands)
+            elif kind == "directive" and value == ".DB":
+                values = []
+                k += 1
+                while True:
+                    if tokens[k][0] in operand_kinds:
+                        values.append([tokens[k][1]])
+                    elif tokens[k][0] == "string":
+                        values.append(tokens[k][1])
+                    else:
+                        return None
+                    if tokens[k + 1][0] != ",":
+                        break
+                    k += 2
+                statements.append(("def_db", values, position))
+                k += 1
+            elif kind == "directive" and value == ".EQU":
+                if tokens[k + 1][0] != "identifier" or tokens[k + 2][0] != "=" or \
+                   tokens[k + 3][0] not in literal_kinds:
+                    return None
+                statements.append(("def_equ", (tokens[k + 1][1], tokens[k + 3][1]), position))
+                k += 4
+            else:
+                return None
+        return statements if len(statements) > 0 else None
+
+    def _parse_with_grammar(self, asm_code_text):
+        """
+        Parses ASM code through the pyparsing grammar, to the same statements that the tokenizer produces.
+        """
+        import pyparsing
         try:
-            parsed_code = self._parser.parseString(asm_code_text, parseAll=True)
+            parsed_code = self.grammar.parseString(asm_code_text, parseAll=True)
         except pyparsing.ParseException as e:
             raise DgtoolsErrorASMSyntaxError(f"line {e.lineno}, col {e.col}: "
                                              f"    {e.line}: "
                                              f"Syntax Error: {e.args[2]}")
-                                             
-        return parsed_code
+        statements = []
+        for a_line in parsed_code:
+            command, arguments = list(a_line["prog_dir_statement"][0].items())[0]
+            if command == "def_label":
+                statements.append(("def_label", arguments["idf"], a_line["src_pos"]))
+            elif command == "def_db":
+                statements.append(("def_db", [list(a_val) for a_val in arguments["values"]], a_line["src_pos"]))
+            elif command == "def_equ":
+                statements.append(("def_equ", (arguments["idf"], arguments["value"]), a_line["src_pos"]))
+            else:
+                # It's an instruction tagged by opcode:num operands.
+                instruction_code, instruction_num_op = map(int, command.split(":"))
+                statements.append((instruction_code,
+                                   list(map(lambda x:x[0], arguments[1:(1+instruction_num_op)])),
+                                   a_line["src_pos"]))
+        return statements
 
+    def text_to_ast(self, asm_code_text):
+        """
+        Parses ASM code to a list of statements.
+
+        :param asm_code_text: The ASM code.
+        :type asm_code_text: str
+        :returns: The statements of the program as (command, arguments, (line, column)).
+        :rtype: list<tuple<object, object, tuple<int, int>>>
+        :raises DgtoolsErrorASMSyntaxError: If the code is not valid Digirule ASM.
+        """
+        tokens = self._tokenize(asm_code_text)
+        statements = self._tokens_to_ast(tokens) if tokens is not None else None
+        if statements is None:
+            return self._parse_with_grammar(asm_code_text)
+        return statements
     
     def asm_ast_to_obj(self, parsed_code):
         """
         Transforms the parsed AST to a binary for the Digirule target architecture
         
-        :param asm: Parsed ASM text, EXCLUDING COMMENT tags.
-        :type asm: list<pyparsing.ParseElement>
-        :returns: A dictionary of compiled code, symbols and variable offsets or the parsexception at failure
-        :rtype: dict<"program":list<uint8>, "labels":dict<str, int>>, "symbols":dict<str,int>>, pyparsing.ParseException
+        :param asm: Parsed ASM statements (as returned by text_to_ast).
+        :type asm: list<tuple<object, object, tuple<int, int>>>
+        :returns: A dictionary of compiled code, symbols and variable offsets and the source (line, column) of every 
+                  byte of compiled code or the parsexception at failure
+        :rtype: dict<"program":list<uint8>, "labels":dict<str, int>>, "source_map":list<tuple<int, int>>>, 
+                pyparsing.ParseException
         """
         mem = []
+        source_map = []
         labels = {}
         symbols = {}
         # Read through the code and load it to memory
         # While doing that, keep track of where labels and symbols appear. These will be substituted
         # in the second pass.
-        for a_line in parsed_code:
-            command, arguments = list(a_line["prog_dir_statement"][0].items())[0]
+        for command, arguments, position in parsed_code:
             if command == "def_label":
                 # Tie the label to where it points to
-                if arguments["idf"] not in labels:
-                    labels[arguments["idf"]] = len(mem)
+                if arguments not in labels:
+                    labels[arguments] = len(mem)
                 else:
-                    raise DgtoolsErrorSymbolAlreadyDefined(f"Label {arguments['idf']} is getting redefined.")
+                    raise DgtoolsErrorSymbolAlreadyDefined(f"Label {arguments} is getting redefined.")
             elif command == "def_db":
                 # .DB defines raw data that are simply dumped where they appear. If a label is not set to a 
                 # data block, it cannot be referenced.
-                #value_data = list(map(lambda x:x[0] if "string" not in x else [u for u in x],arguments["values"]))
-                #import pdb
-                #pdb.set_trace()
-                #mem.extend(value_data)
-                for a_val in arguments["values"]:
+                for a_val in arguments:
                     mem.extend(a_val)
+                source_map.extend([position] * (len(mem) - len(source_map)))
             elif command == "def_equ":
-                if arguments["idf"] not in symbols:
-                    symbols[arguments["idf"]] = arguments["value"]
+                symbol_name, symbol_value = arguments
+                if symbol_name not in symbols:
+                    symbols[symbol_name] = symbol_value
                 else:
-                    raise DgtoolsErrorSymbolAlreadyDefined(f"Symbol {arguments['idf']} is getting redefined")
+                    raise DgtoolsErrorSymbolAlreadyDefined(f"Symbol {symbol_name} is getting redefined")
             else:
-                # It's an instruction. The opcode of the instruction has already been recognised, 
-                # but we need to grab the operands wherever they are available
-                inst_data = command.split(":")
-                instruction_code = int(inst_data[0])
-                instruction_num_op = int(inst_data[1])
-                            
-                mem.append(instruction_code)
-                mem.extend(list(map(lambda x:x[0], arguments[1:(1+instruction_num_op)]))) 
+                # It's an instruction. The command is its opcode and the arguments its operands.
+                mem.append(command)
+                mem.extend(arguments)
+                source_map.extend([position] * (len(mem) - len(source_map)))
         # The first pass produces an intermediate object that still contains symbolic references.
         # This second pass here substitutes those references and produces the final object.
         symbol_offsets = {}
@@ -154,4 +390,66 @@ class DgAssembler:
                 mem[an_entry[0]] = symbols[an_entry[1]]
             else:
                 raise DgtoolsErrorSymbolUndefined(f"Symbol {an_entry[1]} not found.")
-        return {"program":mem, "labels":labels}
+        return {"program":mem, "labels":labels, "source_map":source_map}
+
+
+class DgIncrementalAssembler(DgAssembler):
+    """
+    Re-assembles successive versions of the same program (for example, every time it is saved while being edited).
+
+    Notes:
+        * The tokens of every line are kept, keyed by the content of the line. Only lines whose content was not 
+          in the previous version are tokenized again. Statements, labels and symbols are resolved from the tokens 
+          of every line, which is cheap.
+        * Text the tokenizer cannot parse is parsed by the grammar, as with DgAssembler.
+    """
+    def __init__(self, digirule_cls):
+        super().__init__(digirule_cls)
+        # Tokens of each line of the last version, with the line number left out (as (kind, value, column)).
+        self._line_tokens = {}
+        self._program = []
+
+    def _tokenize(self, asm_code_text):
+        line_tokens = {}
+        tokens = []
+        for line_number, asm_line in enumerate(asm_code_text.split("\n"), start=1):
+            if asm_line in line_tokens:
+                a_line_tokens = line_tokens[asm_line]
+            elif asm_line in self._line_tokens:
+                a_line_tokens = line_tokens[asm_line] = self._line_tokens[asm_line]
+            else:
+                a_line_tokens = self._tokenize_line(asm_line, 0)
+                if a_line_tokens is not None:
+                    a_line_tokens = [(kind, value, position[1]) for kind, value, position in a_line_tokens]
+                line_tokens[asm_line] = a_line_tokens
+            if a_line_tokens is None:
+                tokens = None
+            elif tokens is not None:
+                tokens.extend([(kind, value, (line_number, col)) for kind, value, col in a_line_tokens])
+        # Only the lines of this version are kept.
+        self._line_tokens = line_tokens
+        return tokens
+
+    def assemble(self, asm_code_text):
+        """
+        Assembles a new version of the program and compares it to the previous one.
+
+        :param asm_code_text: The ASM code.
+        :type asm_code_text: str
+        :returns: The compiled program (as returned by asm_ast_to_obj) and the bytes that changed since the last 
+                  version that was assembled successfully, as a list of (address, old value, new value). The old 
+                  (or new) value is None for addresses beyond the end of the previous (or new) program.
+        :rtype: dict<"program":list<uint8>, "labels":dict<str, int>>, "source_map":list<tuple<int, int>>>, 
+                "changed":list<tuple<int, int, int>>>
+        """
+        compiled_program = self.asm_ast_to_obj(self.text_to_ast(asm_code_text))
+        old_program = self._program
+        new_program = compiled_program["program"]
+        changed = [(an_addr, 
+                    old_program[an_addr] if an_addr < len(old_program) else None, 
+                    new_program[an_addr] if an_addr < len(new_program) else None) 
+                   for an_addr in range(max(len(old_program), len(new_program)))
+                   if an_addr >= len(old_program) or an_addr >= len(new_program) or 
+                      old_program[an_addr] != new_program[an_addr]]
+        self._program = new_program
+        return dict(compiled_program, changed=changed)
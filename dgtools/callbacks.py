@@ -19,6 +19,8 @@ class DigiruleCallbackBase:
           the Digirule.
         * Callbacks have a label that provides a brief description so that the user knows
           which interaction this is for.
+        * Callbacks that keep state between calls (e.g. how far through a sequence of inputs they are) expose it 
+          via get_state/set_state, so that it can be part of a Digirule snapshot.
     """
     
     def __init__(self, cb_label):
@@ -43,6 +45,18 @@ class DigiruleCallbackBase:
             raise TypeError(f"Callback labels are expected to be str, received {type(new_label)}.")
         self._cb_label = new_label
         
+    def get_state(self):
+        """
+        Returns the state of the callback as an immutable (hashable) value, or None if it has no state.
+        """
+        return None
+        
+    def set_state(self, state):
+        """
+        Sets the state of the callback to a value previously returned by get_state.
+        """
+        pass
+        
 
 
 class DigiruleCallbackInputBase(DigiruleCallbackBase):
@@ -101,6 +115,65 @@ class DigiruleCallbackInputUserInteraction(DigiruleCallbackInputBase):
         return user_input_numeric
         
 
+class DigiruleCallbackInputSequence(DigiruleCallbackInputBase):
+    """
+    Returns the values of a sequence, one per call, then 0 once the sequence is exhausted.
+    
+    Note:
+        * The state of the callback is its position within the sequence.
+    """
+    def __init__(self, values, cb_label="Sequence Input <-"):
+        super().__init__(cb_label)
+        self._values = tuple(values)
+        self._position = 0
+        
+    def get_input(self):
+        if self._position >= len(self._values):
+            return 0
+        self._position += 1
+        return self._values[self._position - 1]
+        
+    def validate_input(self, input_value):
+        return input_value & 0xFF
+        
+    def get_state(self):
+        return self._position
+        
+    def set_state(self, state):
+        self._position = state
+        
+
+class DigiruleCallbackInputRecorder(DigiruleCallbackInputBase):
+    """
+    Passes the values of another input callback on to the Digirule, keeping a record of them.
+
+    Note:
+        * The label is the label of the other callback, so that prompts are not affected.
+        * The recorded values can be replayed with DigiruleCallbackInputSequence.
+    """
+    def __init__(self, callback):
+        super().__init__(callback.label)
+        self._callback = callback
+        self._values = []
+
+    @property
+    def label(self):
+        return self._callback.label
+
+    @label.setter
+    def label(self, new_label):
+        self._callback.label = new_label
+
+    @property
+    def values(self):
+        return tuple(self._values)
+
+    def __call__(self):
+        input_value = self._callback()
+        self._values.append(input_value)
+        return input_value
+
+
 class DigiruleCallbackComInUserInteraction(DigiruleCallbackInputUserInteraction):
     """
     Prompts the user for serial port input.
@@ -131,6 +204,12 @@ class DigiruleCallbackComOutStoreMem(DigiruleCallbackOutputBase):
         
     def on_new_data(self, a_new_value):
         self._value.append(a_new_value)
+        
+    def get_state(self):
+        return tuple(self._value)
+        
+    def set_state(self, state):
+        self._value = list(state)
 
 
 # TODO: LOW, Rename DigiruleCallbackComOutStdout to a more generic name because it is more generally applicable.
@@ -1,18 +1,53 @@
 #!/usr/bin/env python
 """
 
-Usage: dgasm.py [OPTIONS] INPUT_FILE
+Usage: dgasm.py [OPTIONS] [INPUT_FILES]...
 
     Command line tool to produce Digirule binaries (.dgb).
 
-    The script produces a `.dgb` file with the same name as the `.asm` in its
-    input, see option `-o` to set the output file explicitly.
+    The script produces a `.dgb` file with the same name as each `.asm` in its
+    input, see option `-o` to set the output file explicitly (for a single
+    input).
+
+    Inputs can also be listed in a manifest file (option `--manifest`). Many
+    inputs are assembled in parallel (see option `--jobs`), errors are
+    reported per file and the exit status is non-zero if any file failed.
+
+    If a cache directory is set (option `--cache-dir` or the DGTOOLS_CACHE_DIR
+    environment variable), the binaries of sources that were assembled before
+    (for the same target and version of dgtools) are copied from it.
 
 Options:
     -o, --output-file PATH
-    
+
     -g, --target [2A|2U]    Selects the target digirule model to generate code for
 
+    -nsm, --no-source-map   If set, the source line and column of each byte
+                            of the program is not stored in the .dgb file.
+
+    -js, --json             If set, the .dgb file is exported to JSON rather
+                            than stored as a binary container.
+
+    -cd, --cache-dir DIRECTORY
+                            Directory of previously assembled binaries, keyed
+                            by the content of their source.
+
+    -b, --bundle FILE       Store the assembled binaries in a bundle (.dgbz),
+                            under the names of their inputs, rather than one
+                            .dgb (and .hex) file per input. The build cache is
+                            not used.
+
+    -bc, --bundle-compression [none|zlib|lzma]
+                            Compression of the bundle.  [default: zlib]
+
+    -m, --manifest FILE     A file that lists input files, one per line. Blank
+                            lines and lines starting with # are skipped,
+                            relative paths are relative to the manifest.
+
+    -j, --jobs INTEGER RANGE
+                            Number of worker processes for many inputs (0 for
+                            one per CPU).  [default: 0; x>=0]
+
     --help                  Show this message and exit.
 
 :author: Athanasios Anastasiou
@@ -21,68 +56,286 @@ Options:
 """
 import sys
 import os
+import shutil
+import hashlib
+import tempfile
+import contextlib
+import concurrent.futures
 import click
-import intelhex
 from dgtools import (DgtoolsError, DgtoolsErrorASMSyntaxError,
-                     DGB_Archive, Digirule, Digirule2U, BUILTIN_MODELS, DgAssembler)
-                     
+                     DGB_Archive, Digirule, Digirule2U, BUILTIN_MODELS, DgAssembler, __version__)
+
+
+def build_cache_key(asm_code_text, target, with_source_map=True, as_json=False):
+    """
+    Returns the key of a source in the build cache.
+
+    Notes:
+        * The key depends on everything that determines the output of dgasm: the source, the target model, whether
+          the source map is stored, the format of the .dgb file and the version of dgtools.
+
+    :param asm_code_text: The ASM code.
+    :type asm_code_text: str
+    :param target: The Digirule model to generate code for.
+    :type target: str
+    :param with_source_map: Whether the source map is stored in the .dgb file.
+    :type with_source_map: bool
+    :param as_json: Whether the .dgb file is exported to JSON.
+    :type as_json: bool
+    :rtype: str
+    """
+    return hashlib.sha1(f"{__version__}\n{target}\n{with_source_map:d}{as_json:d}\n{asm_code_text}"
+                        .encode("utf-8")).hexdigest()
+
+
+def output_files(output_file, target):
+    """
+    Returns the files that dgasm produces for a target (the .dgb and, for the 2U, the .hex too).
+    """
+    if target == "2U":
+        return [output_file, f"{os.path.splitext(output_file)[0]}.hex"]
+    return [output_file]
+
+
+def assemble_archive(asm_code_text, target, with_source_map=True):
+    """
+    Assembles ASM code to a DGB archive.
+
+    :param asm_code_text: The ASM code.
+    :type asm_code_text: str
+    :param target: The Digirule model to generate code for.
+    :type target: str
+    :param with_source_map: Whether to store the source map in the archive.
+    :type with_source_map: bool
+    :rtype: DGB_Archive
+    """
+    # Instantiate an assembler
+    assembler = DgAssembler(BUILTIN_MODELS[target])
+    # Parse and compile
+    asm_code_compiled = assembler.asm_ast_to_obj(assembler.text_to_ast(asm_code_text))
+    return DGB_Archive(asm_code_compiled["program"], asm_code_compiled["labels"], version=target,
+                       source_map=asm_code_compiled["source_map"] if with_source_map else None)
+
+
+def assemble_file(input_file, output_file, target, with_source_map=True, cache_dir=None, as_json=False):
+    """
+    Assembles an ASM file to a .dgb (and a .hex for the 2U).
+
+    Notes:
+        * If cache_dir is set, the outputs are copied from it when the same source has been assembled before and
+          stored in it otherwise. Entries are written atomically, so a cache can be shared by parallel builds.
+
+    :param input_file: The ASM file to process.
+    :type input_file: str<Path>
+    :param output_file: The assembled .dgb file.
+    :type output_file: str<Path>
+    :param target: The Digirule model to generate code for.
+    :type target: str
+    :param with_source_map: Whether to store the source map in the .dgb file.
+    :type with_source_map: bool
+    :param cache_dir: The directory of the build cache, or None.
+    :type cache_dir: str<Path>
+    :param as_json: Whether to export the .dgb file to JSON.
+    :type as_json: bool
+    :returns: Whether the outputs were copied from the cache.
+    :rtype: bool
+    """
+    with open(input_file, "rt") as fd:
+        asm_code_text = fd.read()
+
+    if cache_dir is not None:
+        cache_key = build_cache_key(asm_code_text, target, with_source_map, as_json)
+        cache_entry = os.path.join(cache_dir, cache_key[:2], f"{cache_key}.dgb")
+        cached_files = output_files(cache_entry, target)
+        if all(map(os.path.exists, cached_files)):
+            for a_cached_file, an_output_file in zip(cached_files, output_files(output_file, target)):
+                shutil.copyfile(a_cached_file, an_output_file)
+            return True
+
+    # Assemble and save
+    dgb_archive = assemble_archive(asm_code_text, target, with_source_map)
+    dgb_archive.save(output_file, as_json=as_json)
+
+    if target == "2U":
+        # Save the HEX binary too
+        import intelhex
+        ihex = intelhex.IntelHex()
+        for an_address, a_byte in enumerate(dgb_archive.program):
+            ihex[an_address] = a_byte
+        ihex.write_hex_file(f"{os.path.splitext(output_file)[0]}.hex")
+
+    if cache_dir is not None:
+        os.makedirs(os.path.dirname(cache_entry), exist_ok=True)
+        for an_output_file, a_cached_file in zip(output_files(output_file, target), cached_files):
+            fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(cache_entry))
+            os.close(fd)
+            shutil.copyfile(an_output_file, temp_file)
+            os.replace(temp_file, a_cached_file)
+    return False
+
+
+def _assemble_task(task):
+    """
+    Assembles one file of a batch to its .dgb file.
+
+    :param task: The parameters of assemble_file.
+    :type task: tuple<str, str, str, bool, str, bool>
+    :returns: None (the archive is saved to a file) and the error the file failed with (or None).
+    :rtype: tuple<None, str>
+    """
+    try:
+        assemble_file(*task)
+    except (DgtoolsError, OSError, UnicodeDecodeError) as e:
+        return None, f"dgasm: File {task[0]}: {e}"
+    return None, None
+
+
+def _bundle_task(task):
+    """
+    Assembles one file of a batch for a bundle.
+
+    :param task: The input file, the target and whether to store the source map.
+    :type task: tuple<str, str, bool>
+    :returns: The binary container of the archive (or None) and the error the file failed with (or None).
+    :rtype: tuple<bytes, str>
+    """
+    input_file, target, with_source_map = task
+    try:
+        with open(input_file, "rt") as fd:
+            return assemble_archive(fd.read(), target, with_source_map).to_bytes(), None
+    except (DgtoolsError, OSError, UnicodeDecodeError) as e:
+        return None, f"dgasm: File {input_file}: {e}"
+
+
+def read_manifest(manifest):
+    """
+    Returns the input files listed in a manifest.
+
+    :param manifest: The manifest file, one input per line.
+    :type manifest: str<Path>
+    :rtype: list<str>
+    """
+    manifest_dir = os.path.dirname(manifest)
+    with open(manifest, "rt") as fd:
+        return [os.path.join(manifest_dir, a_line.strip()) for a_line in fd
+                if len(a_line.strip()) > 0 and not a_line.strip().startswith("#")]
+
+
 @click.command()
-@click.argument("input-file",type=click.Path(exists=True))
+@click.argument("input-files", nargs=-1, type=click.Path(exists=True, dir_okay=False))
 @click.option("--output-file","-o", type=click.Path())
 @click.option("--target", "-g", type=click.Choice(["2A", "2U"],case_sensitive=False), default="2A",
               help="Selects the target digirule model to generate code for")
-def dgasm(input_file, output_file, target):
+@click.option("--no-source-map", "-nsm", is_flag=True,
+              help="If set, the source line and column of each byte of the program is not stored in the .dgb file.")
+@click.option("--json", "-js", "as_json", is_flag=True,
+              help="If set, the .dgb file is exported to JSON rather than stored as a binary container.")
+@click.option("--cache-dir", "-cd", type=click.Path(file_okay=False), envvar="DGTOOLS_CACHE_DIR",
+              help="Directory of previously assembled binaries, keyed by the content of their source.")
+@click.option("--bundle", "-b", type=click.Path(dir_okay=False),
+              help="Store the assembled binaries in a bundle (.dgbz), under the names of their inputs, rather than "
+                   "one .dgb (and .hex) file per input. The build cache is not used.")
+@click.option("--bundle-compression", "-bc", type=click.Choice(["none", "zlib", "lzma"]), default="zlib",
+              show_default=True, help="Compression of the bundle.")
+@click.option("--manifest", "-m", type=click.Path(exists=True, dir_okay=False),
+              help="A file that lists input files, one per line. Blank lines and lines starting with # are skipped, "
+                   "relative paths are relative to the manifest.")
+@click.option("--jobs", "-j", type=click.IntRange(min=0), default=0, show_default=True,
+              help="Number of worker processes for many inputs (0 for one per CPU).")
+def dgasm(input_files, output_file, target, no_source_map, as_json, cache_dir, bundle, bundle_compression, manifest,
+          jobs):
     """
     Command line tool to produce Digirule binaries (.dgb).
-    
-    The script produces a `.dgb` file with the same name as the `.asm` in its input,
-    see option `-o` to set the output file explicitly.
-    
+
+    The script produces a `.dgb` file with the same name as each `.asm` in its input,
+    see option `-o` to set the output file explicitly (for a single input).
+
+    Inputs can also be listed in a manifest file (option `--manifest`). Many inputs are assembled in parallel (see
+    option `--jobs`), errors are reported per file and the exit status is non-zero if any file failed.
+
+    If a cache directory is set (option `--cache-dir` or the DGTOOLS_CACHE_DIR environment variable), the binaries
+    of sources that were assembled before (for the same target and version of dgtools) are copied from it.
+
     \f
-    :param input_file: The ASM file to process
-    :type input_file: str<Path>
-    
-    :param output_file: The assembled .dgb file.
+    :param input_files: The ASM files to process
+    :type input_files: tuple<str<Path>>
+
+    :param output_file: The assembled .dgb file (for a single input file).
     :type output_file:str<Path>
-    
+
     :param target: The Digirule model to generate code for, default is 2A.
     :type target: str [2A,2B,2U]
+
+    :param no_source_map: Whether to omit the source map from the .dgb file.
+    :type no_source_map: bool
+
+    :param as_json: Whether to export the .dgb file to JSON.
+    :type as_json: bool
+
+    :param cache_dir: The directory of the build cache.
+    :type cache_dir: str<Path>
+
+    :param bundle: The bundle to store the assembled binaries in.
+    :type bundle: str<Path>
+
+    :param bundle_compression: The compression of the bundle.
+    :type bundle_compression: str [none, zlib, lzma]
+
+    :param manifest: A file that lists input files.
+    :type manifest: str<Path>
+
+    :param jobs: The number of worker processes (0 for one per CPU).
+    :type jobs: int
     """
-    # Pick up the digirule model
-    target_digirule = BUILTIN_MODELS[target]
-    # Instantiate an assembler
-    assembler = DgAssembler(target_digirule)
-    
-    if output_file is None:
-        output_file = f"{os.path.splitext(input_file)[0]}.dgb"
-    
-    with open(input_file, "rt") as fd:
-        asm_code_text = fd.read()
-        
-    # Parse
-    try:
-        asm_code_ast = assembler.text_to_ast(asm_code_text)
-    except DgtoolsError as deas:
-        print(f"dgasm: File {input_file}: {deas}")
-        sys.exit(-1)
-    
-    # Compile    
+    input_files = list(input_files)
+    if manifest is not None:
+        input_files.extend(read_manifest(manifest))
+    if len(input_files) == 0:
+        raise click.UsageError("Expected at least one INPUT_FILE or a --manifest.")
+    if output_file is not None and (len(input_files) > 1 or bundle is not None):
+        raise click.UsageError("--output-file can only be set for a single input file (and no --bundle).")
+
+    if bundle is None:
+        task_function = _assemble_task
+        tasks = [(an_input_file, output_file or f"{os.path.splitext(an_input_file)[0]}.dgb", target.upper(),
+                  not no_source_map, cache_dir, as_json) for an_input_file in input_files]
+    else:
+        # Inputs are the names of the archives in the bundle, each one is assembled once.
+        input_files = list(dict.fromkeys(input_files))
+        task_function = _bundle_task
+        tasks = [(an_input_file, target.upper(), not no_source_map) for an_input_file in input_files]
+    n_workers = min(jobs or os.cpu_count() or 1, len(tasks))
+    executor = None
+    if n_workers == 1:
+        results = map(task_function, tasks)
+    else:
+        # Every worker builds the tokenizer of the target once and reuses it for the files it assembles.
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=n_workers)
+        results = executor.map(task_function, tasks, chunksize=max(1, len(tasks) // (n_workers * 4)))
+
+    n_failed = 0
     try:
-        asm_code_compiled = assembler.asm_ast_to_obj(asm_code_ast)
-    except DgtoolsError as dge:
-        print(f"dgasm: File {input_file}: {dge}")
+        with contextlib.ExitStack() as stack:
+            bundle_writer = None
+            if bundle is not None:
+                from dgtools import DGB_BundleWriter
+                bundle_writer = stack.enter_context(DGB_BundleWriter(bundle, None if bundle_compression == "none" 
+                                                                             else bundle_compression))
+            for an_input_file, (archive_data, an_error) in zip(input_files, results):
+                if an_error is not None:
+                    print(an_error)
+                    n_failed += 1
+                elif bundle_writer is not None:
+                    bundle_writer.add(an_input_file, DGB_Archive.from_bytes(archive_data))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if n_failed > 0:
+        if len(tasks) > 1:
+            print(f"dgasm: {n_failed} of {len(tasks)} files failed.")
         sys.exit(-1)
-    
-    # Save     
-    dgb_archive = DGB_Archive(asm_code_compiled["program"], asm_code_compiled["labels"], version=target)
-    dgb_archive.save(output_file)
 
-    if target == "2U":
-        # Save the HEX binary too
-        ihex = intelhex.IntelHex()
-        for an_address, a_byte in enumerate(asm_code_compiled["program"]):
-            ihex[an_address] = a_byte
-        ihex.write_hex_file(f"{os.path.splitext(output_file)[0]}.hex")
-        
+
 if __name__ == "__main__":
     dgasm()
@@ -2,48 +2,333 @@
 
 Archive to store Digirule2 binaries
 
+Archives are stored in a binary container (little endian):
+
+* Header: ``DGB1``, version (uint8), model (8 bytes, zero padded ASCII), length of the program (uint16), and the
+  lengths of the labels, source map and metadata sections (uint32 each).
+* Program: the raw bytes of the program.
+* Labels: for every label, the length of its name (uint16), the name (UTF-8) and its offset (uint16).
+* Source map: runs of line, column and length (uint32 each).
+* Metadata: JSON (empty if there is no metadata).
+
+Archives can also be exported to (and are always loaded from) the JSON format of earlier versions of dgtools.
+
 :author: Athanasios Anastasiou
 :date: April 2020
 """
 
 import sys
 import json
-import copy
+import hashlib
+import mmap
+import struct
+import types
 from .exceptions import DgtoolsErrorDgbarchiveCorrupted
 
+DGB_MAGIC = b"DGB1"
+DGB_VERSION = 1
+
+_HEADER = struct.Struct("<4sB8sHIII")
+_LABEL_NAME = struct.Struct("<H")
+_LABEL_OFFSET = struct.Struct("<H")
+_SOURCE_RUN = struct.Struct("<III")
+
+
+def encode_labels(labels):
+    """
+    Returns the labels section of a binary container.
+
+    :param labels: Lookup of labels and their offsets within the memory space.
+    :type labels: dict<str:int>
+    :rtype: bytes
+    """
+    encoded_labels = bytearray()
+    for a_label, an_offset in labels.items():
+        encoded_label = a_label.encode("utf-8")
+        encoded_labels += _LABEL_NAME.pack(len(encoded_label)) + encoded_label + _LABEL_OFFSET.pack(an_offset)
+    return bytes(encoded_labels)
+
+
+def decode_labels(data):
+    """
+    Decodes the labels section of a binary container.
+
+    :param data: The labels section (as returned by encode_labels).
+    :type data: bytes-like
+    :rtype: dict<str:int>
+    :raises DgtoolsErrorDgbarchiveCorrupted: If the section is not valid.
+    """
+    labels = {}
+    k = 0
+    try:
+        while k < len(data):
+            (name_len,) = _LABEL_NAME.unpack_from(data, k)
+            k += _LABEL_NAME.size
+            a_label = bytes(data[k:k + name_len]).decode("utf-8")
+            k += name_len
+            (labels[a_label],) = _LABEL_OFFSET.unpack_from(data, k)
+            k += _LABEL_OFFSET.size
+    except (struct.error, UnicodeDecodeError):
+        raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+    return labels
+
+
 class DGB_Archive:
     """
     Implements functionality to store, modify and retrieve DGB archives.
+    
+    Notes:
+        * The source map is an optional section that holds the (line, column) of the statement that produced each 
+          byte of the program. It is stored as runs of ``[line, column, length]``, one per statement.
+        * The labels, source map and metadata of an archive loaded from a binary container are only decoded when 
+          they are first accessed, tools that only run the program never decode them.
+        * Archives are immutable: the program is stored as bytes and the labels and metadata as read-only mappings.
+          Archives that derive from others (see with_program) share all their other sections.
     """
-    def __init__(self, compiled_program, labels, version="2A"):
+    def __init__(self, compiled_program, labels, version="2A", source_map=None, metadata=None):
         """
         Initialisation
         
         :param compiled_program: The result of the assembling process
-        :type compiled_program: list<int>
+        :type compiled_program: list<int> or bytes-like (stored as bytes)
         :param labels: Lookup of labels and their offsets within the memory space
         :type labels: dict<str:int>
         :param version: The version of hardware this program is compiled for
         :type version: str
+        :param source_map: The source (line, column) of every byte of the program, or None
+        :type source_map: list<tuple<int, int>>
+        :param metadata: Any other information to store with the program, or None
+        :type metadata: dict (JSON serialisable)
         """
-        self._sections = {"program":compiled_program,"labels":labels, "version":version}
+        self._sections = {"program":self._to_program(compiled_program),"labels":self._read_only(labels), "version":version}
+        if source_map is not None:
+            self._sections["source_map"] = tuple(map(tuple, source_map))
+        if metadata:
+            self._sections["metadata"] = self._read_only(metadata)
+        # Sections of a binary container and the ones of them that have been decoded (shared by derived archives)
+        self._encoded_sections = {}
+        self._decoded_sections = {}
         
-    def save(self, filename):
+    @staticmethod
+    def _to_program(compiled_program):
+        """
+        Returns a program (list of int or bytes-like) as bytes.
+        """
+        if type(compiled_program) is bytes:
+            return compiled_program
+        try:
+            return bytes(compiled_program)
+        except (TypeError, ValueError):
+            raise DgtoolsErrorDgbarchiveCorrupted("Expected program values to be uint8.")
+
+    @staticmethod
+    def _read_only(a_mapping):
+        """
+        Returns a read-only view of a copy of a mapping (or a mapping that is read-only already, or None).
+        """
+        if a_mapping is None or type(a_mapping) is types.MappingProxyType:
+            return a_mapping
+        return types.MappingProxyType(dict(a_mapping))
+
+    @staticmethod
+    def _encode_source_map(source_map):
+        """
+        Compacts a source map to runs of [line, column, length].
+        """
+        runs = []
+        for a_position in source_map:
+            if len(runs) > 0 and runs[-1][:2] == list(a_position):
+                runs[-1][2] += 1
+            else:
+                runs.append([a_position[0], a_position[1], 1])
+        return runs
+        
+    @staticmethod
+    def _decode_source_map(runs):
+        """
+        Expands runs of [line, column, length] to a source map.
+        """
+        if type(runs) is not list or \
+           not all(map(lambda x:type(x) is list and len(x) == 3 and all(map(lambda y:type(y) is int, x)), runs)):
+            raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+        source_map = []
+        for a_line, a_col, a_length in runs:
+            source_map.extend([(a_line, a_col)] * a_length)
+        return tuple(source_map)
+
+    def _section(self, name):
+        """
+        Returns a section of the archive, decoding it first if it was loaded from a binary container.
+        """
+        if name in self._encoded_sections:
+            if name not in self._decoded_sections:
+                value = self._decode_section(name, self._encoded_sections[name])
+                self._decoded_sections[name] = self._read_only(value) if name != "source_map" else value
+            return self._decoded_sections[name]
+        return self._sections.get(name)
+
+    @classmethod
+    def _decode_section(cls, name, data):
+        """
+        Decodes the labels, source map or metadata section of a binary container.
+        """
+        if name == "labels":
+            return decode_labels(data)
+        try:
+            if len(data) == 0:
+                return None
+            if name == "source_map":
+                if len(data) % _SOURCE_RUN.size != 0:
+                    raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+                return cls._decode_source_map([list(a_run) for a_run in _SOURCE_RUN.iter_unpack(data)])
+            metadata = json.loads(data)
+            if type(metadata) is not dict:
+                raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+            return metadata
+        except (struct.error, UnicodeDecodeError, ValueError):
+            raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+
+    def section_bytes(self, name):
+        """
+        Returns the labels, source map or metadata section of the archive, as stored in a binary container.
+
+        Notes:
+            * Sections of an archive loaded from a binary container are returned as they were loaded.
+        """
+        if name in self._encoded_sections:
+            return self._encoded_sections[name]
+        if name == "labels":
+            return encode_labels(self.labels)
+        if name == "source_map":
+            if self.source_map is None:
+                return b""
+            return b"".join(_SOURCE_RUN.pack(*a_run) for a_run in self._encode_source_map(self.source_map))
+        return json.dumps(dict(self.metadata)).encode("utf-8") if self.metadata else b""
+
+    def to_bytes(self, with_labels=True):
+        """
+        Returns the archive as a binary container.
+
+        :param with_labels: Whether to store the labels in the container (bundles store them separately).
+        :type with_labels: bool
+        :rtype: bytes
+        """
+        program = bytes(self.program)
+        labels = self.section_bytes("labels") if with_labels else b""
+        source_map = self.section_bytes("source_map")
+        metadata = self.section_bytes("metadata")
+        return _HEADER.pack(DGB_MAGIC, DGB_VERSION, self.version.encode("ascii"), len(program), len(labels), 
+                            len(source_map), len(metadata)) + program + labels + source_map + metadata
+
+    @classmethod
+    def from_bytes(cls, data, labels=None):
+        """
+        Creates an archive from a binary container (as returned by to_bytes).
+
+        :param data: The binary container.
+        :type data: bytes-like
+        :param labels: The labels of the program, if they are not stored in the container.
+        :type labels: dict<str:int>
+        :rtype: DGB_Archive
+        :raises DgtoolsErrorDgbarchiveCorrupted: If the data is not a valid container.
+        """
+        if len(data) < _HEADER.size:
+            raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+        magic, version, model, program_len, labels_len, source_map_len, metadata_len = _HEADER.unpack_from(data, 0)
+        if magic != DGB_MAGIC or version != DGB_VERSION or \
+           len(data) != _HEADER.size + program_len + labels_len + source_map_len + metadata_len:
+            raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+        try:
+            model = model.rstrip(b"\0").decode("ascii")
+        except UnicodeDecodeError:
+            raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+        k = _HEADER.size
+        archive = cls(bytes(data[k:k + program_len]), labels, model)
+        k += program_len
+        for a_section, a_section_len in [("labels", labels_len), ("source_map", source_map_len), 
+                                         ("metadata", metadata_len)]:
+            if a_section != "labels" or labels is None:
+                archive._encoded_sections[a_section] = bytes(data[k:k + a_section_len])
+            k += a_section_len
+        return archive
+        
+    def save(self, filename, as_json=False):
+        """
+        Saves the archive to a file.
+
+        :param filename: The .dgb file to write.
+        :type filename: str<Path>
+        :param as_json: Whether to export the archive to JSON, rather than a binary container.
+        :type as_json: bool
+        """
+        if not as_json:
+            with open(filename, "wb") as fd:
+                fd.write(self.to_bytes())
+            return self
         with open(filename, "wt") as fd:
-            json.dump(self._sections, fd, indent=4)
+            # The program is always stored as a JSON list, whatever its type in memory.
+            sections = {"program":list(self.program), "labels":dict(self.labels), "version":self.version}
+            if self.source_map is not None:
+                sections["source_map"] = self._encode_source_map(self.source_map)
+            if self.metadata:
+                sections["metadata"] = dict(self.metadata)
+            json.dump(sections, fd, indent=4)
         return self
 
     @classmethod
     def from_archive(cls, other_archive):
-        copied_sections = copy.deepcopy(other_archive._sections)
-        if "version" in copied_sections:
-            return cls(copied_sections["program"],copied_sections["labels"], copied_sections["version"])
-        else:
-            return cls(copied_sections["program"],copied_sections["labels"])
+        """
+        Returns a copy of an archive, that shares all of its (immutable) sections.
+
+        :param other_archive: The archive to copy.
+        :type other_archive: DGB_Archive
+        :rtype: DGB_Archive
+        """
+        archive = cls.__new__(cls)
+        archive._sections = dict(other_archive._sections)
+        archive._encoded_sections = other_archive._encoded_sections
+        archive._decoded_sections = other_archive._decoded_sections
+        return archive
+
+    def with_program(self, new_program):
+        """
+        Returns a copy of the archive with a different program (for example, the memory of a machine after running
+        the program), that shares all other sections.
+
+        :param new_program: The new program.
+        :type new_program: list<int> or bytes-like
+        :rtype: DGB_Archive
+        """
+        archive = self.from_archive(self)
+        archive._sections["program"] = self._to_program(new_program)
+        return archive
         
+    @staticmethod
+    def is_binary(filename):
+        """
+        Returns whether a .dgb file is a binary container (rather than JSON).
+
+        :param filename: The .dgb file.
+        :type filename: str<Path>
+        :rtype: bool
+        """
+        with open(filename, "rb") as fd:
+            return fd.read(len(DGB_MAGIC)) == DGB_MAGIC
+
     @classmethod    
     def load(cls,filename):
-        with open(filename, "rt") as fd:
+        """
+        Loads an archive from a binary container (through mmap) or a JSON file.
+
+        :param filename: The .dgb file to read.
+        :type filename: str<Path>
+        :rtype: DGB_Archive
+        """
+        with open(filename, "rb") as fd:
+            if fd.read(len(DGB_MAGIC)) == DGB_MAGIC:
+                with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as archive_data:
+                    return cls.from_bytes(archive_data)
+            fd.seek(0)
             archive_sections = json.load(fd)
 
         if type(archive_sections) is not dict:
@@ -54,16 +339,84 @@ class DGB_Archive:
                            
         if "version" not in archive_sections:
             archive_sections.update({"version":"2A"})
-        return cls(archive_sections["program"], archive_sections["labels"], archive_sections["version"]) 
+        if type(archive_sections["program"]) is not list:
+            raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+        source_map = None
+        if "source_map" in archive_sections:
+            source_map = cls._decode_source_map(archive_sections["source_map"])
+        if type(archive_sections.get("metadata", {})) is not dict:
+            raise DgtoolsErrorDgbarchiveCorrupted("DGB archive corrupted.")
+        return cls(archive_sections["program"], archive_sections["labels"], archive_sections["version"], source_map,
+                   archive_sections.get("metadata"))
         
     @property
     def program(self):
+        """
+        The program.
+
+        :rtype: bytes
+        """
         return self._sections["program"]
         
+    @property
+    def program_view(self):
+        """
+        A read-only, zero-copy view of the program.
+        
+        :rtype: memoryview
+        """
+        return memoryview(self._sections["program"]).toreadonly()
+        
+    @property
+    def content_hash(self):
+        """
+        SHA1 of the model and the program, the same for archives that hold the same image whatever else they hold or
+        the format they were stored in.
+
+        :rtype: str
+        """
+        return hashlib.sha1(self._sections["version"].encode("utf-8") + b"\0" + self._sections["program"]).hexdigest()
+
     @property
     def labels(self):
-        return self._sections["labels"]
+        """
+        Lookup of labels and their offsets within the memory space.
+
+        :rtype: types.MappingProxyType<str:int>
+        """
+        return self._section("labels")
         
     @property
     def version(self):
         return self._sections["version"]
+        
+    @property
+    def source_map(self):
+        """
+        The source (line, column) of every byte of the program, or None if the archive has no source map.
+        
+        :rtype: tuple<tuple<int, int>>
+        """
+        return self._section("source_map")
+
+    @property
+    def metadata(self):
+        """
+        Any other information stored with the program (an empty dict if there is none).
+
+        :rtype: types.MappingProxyType
+        """
+        return self._section("metadata") or types.MappingProxyType({})
+        
+    def source_position(self, addr):
+        """
+        Returns the source (line, column) of the byte at addr, or None if it is not known.
+        
+        :param addr: An address within the program.
+        :type addr: int
+        :rtype: tuple<int, int>
+        """
+        source_map = self.source_map
+        if source_map is None or not 0 <= addr < len(source_map):
+            return None
+        return source_map[addr]
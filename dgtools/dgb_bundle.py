@@ -0,0 +1,326 @@
+"""
+
+Bundles of DGB archives (.dgbz).
+
+A bundle stores many archives in one file, each under a name. Archives that have the same labels share a single
+copy of them and every record can be compressed (zlib or lzma). Archives can be streamed in the order they were
+written, or read by name through the index at the end of the bundle.
+
+Layout (little endian):
+
+* Header: ``DGBZ``, version (uint8) and compression (uint8, 0:none, 1:zlib, 2:lzma, as raw LZMA2).
+* Records, each starting with a one byte tag:
+    * ``L`` (labels): length (uint32) and the (compressed) labels section of a binary DGB archive. Label tables are
+      numbered in the order they are written, a table is always written before the first archive that uses it.
+    * ``A`` (archive): length of the name (uint16), name (UTF-8), label table (uint32), length (uint32) and the
+      (compressed) binary container of the archive, without its labels.
+* Footer: ``F``, number of label tables (uint32), label table offsets (uint64 each), number of archives (uint32)
+  and, for every archive, the length of its name (uint16), its name (UTF-8) and the offset of its record (uint64),
+  followed by the offset of the footer (uint64) and ``DGZE``.
+
+:author: Athanasios Anastasiou
+:date: Oct 2026
+"""
+import functools
+import lzma
+import struct
+import types
+import zlib
+from .dgb_archive import DGB_Archive, decode_labels
+from .exceptions import DgtoolsErrorDgbarchiveCorrupted, DgtoolsErrorDgbBundleCorrupted
+
+DGBZ_MAGIC = b"DGBZ"
+DGBZ_END_MAGIC = b"DGZE"
+DGBZ_VERSION = 1
+
+# The compression methods of a bundle and their codes in its header
+DGBZ_COMPRESSION = {None:0, "zlib":1, "lzma":2}
+
+_HEADER = struct.Struct("<4sBB")
+_NAME = struct.Struct("<H")
+_ARCHIVE = struct.Struct("<II")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_FOOTER_END = struct.Struct("<Q4s")
+
+_TAG_LABELS = b"L"
+_TAG_ARCHIVE = b"A"
+_TAG_FOOTER = b"F"
+
+# Records are small, lzma records are raw LZMA2 streams (without the headers of the xz format) and the fastest preset
+# compresses them as well as the others.
+_LZMA_FILTERS = [{"id":lzma.FILTER_LZMA2, "preset":0}]
+
+_COMPRESS = {0:bytes, 1:zlib.compress,
+             2:functools.partial(lzma.compress, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)}
+_DECOMPRESS = {0:bytes, 1:zlib.decompress,
+               2:functools.partial(lzma.decompress, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)}
+
+
+class DGB_BundleWriter:
+    """
+    Writes archives to a bundle.
+    """
+    def __init__(self, filename, compression="zlib"):
+        """
+        Initialisation
+
+        :param filename: The .dgbz file to write.
+        :type filename: str<Path>
+        :param compression: The compression of the records of the bundle.
+        :type compression: str [None, zlib, lzma]
+        """
+        if compression not in DGBZ_COMPRESSION:
+            raise ValueError(f"Expected compression as one of None, zlib, lzma, received {compression}")
+        self._filename = filename
+        self._compression = DGBZ_COMPRESSION[compression]
+        self._fd = None
+        # Label tables (by their labels section) and their offsets
+        self._label_tables = {}
+        self._label_offsets = []
+        # The labels of the last archive and their table (archives derived from one another share their labels)
+        self._last_labels = (None, None)
+        # Archives and the offsets of their records
+        self._index = {}
+
+    def __enter__(self):
+        self._fd = open(self._filename, "wb", buffering=1 << 20)
+        self._fd.write(_HEADER.pack(DGBZ_MAGIC, DGBZ_VERSION, self._compression))
+        return self
+
+    def __exit__(self, type, value, traceback):
+        footer_offset = self._fd.tell()
+        self._fd.write(_TAG_FOOTER + _U32.pack(len(self._label_offsets)))
+        self._fd.write(struct.pack(f"<{len(self._label_offsets)}Q", *self._label_offsets))
+        self._fd.write(_U32.pack(len(self._index)))
+        for a_name, an_offset in self._index.items():
+            encoded_name = a_name.encode("utf-8")
+            self._fd.write(_NAME.pack(len(encoded_name)) + encoded_name + _U64.pack(an_offset))
+        self._fd.write(_FOOTER_END.pack(footer_offset, DGBZ_END_MAGIC))
+        self._fd.close()
+        self._fd = None
+
+    @property
+    def n_archives(self):
+        return len(self._index)
+
+    def add(self, name, archive):
+        """
+        Adds an archive to the bundle.
+
+        :param name: The name of the archive, unique within the bundle.
+        :type name: str
+        :param archive: The archive.
+        :type archive: DGB_Archive
+        """
+        if name in self._index:
+            raise ValueError(f"Expected a unique archive name, received {name}")
+        compress = _COMPRESS[self._compression]
+        labels, label_table = self._last_labels
+        if archive.labels is not labels:
+            encoded_labels = archive.section_bytes("labels")
+            label_table = self._label_tables.get(encoded_labels)
+            if label_table is None:
+                label_table = len(self._label_offsets)
+                self._label_tables[encoded_labels] = label_table
+                self._label_offsets.append(self._fd.tell())
+                payload = compress(encoded_labels)
+                self._fd.write(_TAG_LABELS + _U32.pack(len(payload)) + payload)
+            self._last_labels = (archive.labels, label_table)
+        self._index[name] = self._fd.tell()
+        encoded_name = name.encode("utf-8")
+        payload = compress(archive.to_bytes(with_labels=False))
+        self._fd.write(_TAG_ARCHIVE + _NAME.pack(len(encoded_name)) + encoded_name +
+                       _ARCHIVE.pack(label_table, len(payload)) + payload)
+        return self
+
+
+class DGB_BundleReader:
+    """
+    Reads the archives of a bundle, by name or in the order they were written.
+
+    Notes:
+        * Archives that share a label table also share a single (read-only) copy of their labels.
+        * A bundle that was not closed properly (no footer) is scanned once, to find its archives.
+    """
+    def __init__(self, filename):
+        """
+        Initialisation
+
+        :param filename: The .dgbz file to read.
+        :type filename: str<Path>
+        """
+        self._filename = filename
+        self._fd = open(filename, "rb")
+        try:
+            header = self._fd.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+            magic, version, compression = _HEADER.unpack(header)
+            if magic != DGBZ_MAGIC or version != DGBZ_VERSION or compression not in _DECOMPRESS:
+                raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+            self._decompress = _DECOMPRESS[compression]
+            self._records_offset = self._fd.tell()
+            self._label_tables = {}
+            if not self._read_footer():
+                self._scan()
+        except Exception:
+            self._fd.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        self._fd.close()
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __getitem__(self, name):
+        """
+        Returns the archive stored under a name.
+
+        :param name: The name of the archive.
+        :type name: str
+        :rtype: DGB_Archive
+        :raises KeyError: If the bundle does not contain the archive.
+        """
+        self._fd.seek(self._index[name])
+        if self._fd.read(1) != _TAG_ARCHIVE:
+            raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+        name, label_table, payload = self._read_archive(self._fd)
+        return self._to_archive(payload, self._labels(label_table))
+
+    def __iter__(self):
+        """
+        Streams the (name, archive) of every archive in the order they were written.
+        """
+        label_tables = []
+        with open(self._filename, "rb", buffering=1 << 20) as fd:
+            fd.seek(self._records_offset)
+            for a_tag in iter(lambda:fd.read(1), b""):
+                if a_tag == _TAG_LABELS:
+                    label_tables.append(self._read_labels(fd))
+                elif a_tag == _TAG_ARCHIVE:
+                    name, label_table, payload = self._read_archive(fd)
+                    if label_table >= len(label_tables):
+                        raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+                    yield name, self._to_archive(payload, label_tables[label_table])
+                elif a_tag == _TAG_FOOTER:
+                    return
+                else:
+                    raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+
+    @property
+    def names(self):
+        """
+        The names of the archives, in the order they were written.
+
+        :rtype: list<str>
+        """
+        return list(self._index)
+
+    def _read(self, fd, n_bytes):
+        data = fd.read(n_bytes)
+        if len(data) != n_bytes:
+            raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+        return data
+
+    def _read_labels(self, fd):
+        """
+        Reads a label table (after its tag).
+        """
+        (payload_len,) = _U32.unpack(self._read(fd, _U32.size))
+        try:
+            return types.MappingProxyType(decode_labels(self._decompress(self._read(fd, payload_len))))
+        except (zlib.error, lzma.LZMAError, DgtoolsErrorDgbarchiveCorrupted):
+            raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+
+    def _read_archive(self, fd):
+        """
+        Reads the name, label table and (compressed) binary container of an archive (after its tag).
+        """
+        (name_len,) = _NAME.unpack(self._read(fd, _NAME.size))
+        try:
+            name = self._read(fd, name_len).decode("utf-8")
+        except UnicodeDecodeError:
+            raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+        label_table, payload_len = _ARCHIVE.unpack(self._read(fd, _ARCHIVE.size))
+        return name, label_table, self._read(fd, payload_len)
+
+    def _to_archive(self, payload, labels):
+        try:
+            return DGB_Archive.from_bytes(self._decompress(payload), labels=labels)
+        except (zlib.error, lzma.LZMAError):
+            raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+
+    def _labels(self, label_table):
+        """
+        Returns a label table, reading it the first time it is needed.
+        """
+        if label_table not in self._label_tables:
+            if label_table >= len(self._label_offsets):
+                raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+            self._fd.seek(self._label_offsets[label_table])
+            if self._fd.read(1) != _TAG_LABELS:
+                raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+            self._label_tables[label_table] = self._read_labels(self._fd)
+        return self._label_tables[label_table]
+
+    def _read_footer(self):
+        self._fd.seek(0, 2)
+        file_size = self._fd.tell()
+        if file_size < self._records_offset + _FOOTER_END.size:
+            return False
+        self._fd.seek(file_size - _FOOTER_END.size)
+        footer_offset, end_magic = _FOOTER_END.unpack(self._fd.read(_FOOTER_END.size))
+        if end_magic != DGBZ_END_MAGIC or not self._records_offset <= footer_offset < file_size:
+            return False
+        self._fd.seek(footer_offset)
+        if self._fd.read(1) != _TAG_FOOTER:
+            return False
+        (n_label_tables,) = _U32.unpack(self._read(self._fd, _U32.size))
+        self._label_offsets = list(struct.unpack(f"<{n_label_tables}Q", self._read(self._fd, 8 * n_label_tables)))
+        (n_archives,) = _U32.unpack(self._read(self._fd, _U32.size))
+        self._index = {}
+        for k in range(n_archives):
+            (name_len,) = _NAME.unpack(self._read(self._fd, _NAME.size))
+            try:
+                name = self._read(self._fd, name_len).decode("utf-8")
+            except UnicodeDecodeError:
+                raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+            (self._index[name],) = _U64.unpack(self._read(self._fd, _U64.size))
+        return True
+
+    def _scan(self):
+        """
+        Finds the label tables and archives of a bundle that has no footer.
+
+        Notes:
+            * The scan stops at the first record that was not completely written (the last one of a bundle that was
+              not closed).
+        """
+        self._label_offsets = []
+        self._index = {}
+        self._fd.seek(self._records_offset)
+        try:
+            for a_tag in iter(lambda:self._fd.read(1), b""):
+                offset = self._fd.tell() - 1
+                if a_tag == _TAG_LABELS:
+                    (payload_len,) = _U32.unpack(self._read(self._fd, _U32.size))
+                    self._read(self._fd, payload_len)
+                    self._label_offsets.append(offset)
+                elif a_tag == _TAG_ARCHIVE:
+                    name = self._read_archive(self._fd)[0]
+                    self._index[name] = offset
+                else:
+                    raise DgtoolsErrorDgbBundleCorrupted("DGB bundle corrupted.")
+        except DgtoolsErrorDgbBundleCorrupted:
+            pass
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+"""
+
+Usage: dgbatch.py [OPTIONS] [INPUTS]...
+
+  Simulates many Digirule binaries (.dgb) in parallel.
+
+  INPUTS can be .dgb files, bundles of them (.dgbz), directories (searched
+  recursively for .dgb and .dgbz files) or glob patterns. Memory dumps
+  (*_memdump.dgb, *_memdump.dgbz) are skipped. The memdumps of the programs
+  of a bundle are stored in a bundle too.
+
+Options:
+  -od, --output-dir DIRECTORY  Directory to write memdumps and traces to,
+                               under the path of each input relative to the
+                               directory that is common to all inputs. By
+                               default, they are written next to each input.
+
+  -mn, --max-n INTEGER         Maximum number of time steps to allow each
+                               program to run for.
+
+  -T, --with-trace             Whether to produce the HTML trace of each
+                               program.
+
+  -wd, --with-dump             Whether to include a complete dump of memory at
+                               every time step of a trace.
+
+  -j, --jobs INTEGER RANGE     Number of worker processes (default: the number
+                               of CPUs).  [x>=1]
+
+  -s, --summary-file FILE      Filename of a JSON summary of the results.
+  -ls, --loop-stride INTEGER RANGE
+                               Stop programs that return to a state they have
+                               been in before (infinite loops), checking the
+                               state every that many steps.  [x>=1]
+
+  -cd, --cache-dir DIRECTORY   Directory of a cache of simulation results.
+                               Programs that have been run before (same image,
+                               same --max-n and --loop-stride) are not
+                               simulated again.
+
+  --help                       Show this message and exit.
+
+
+:author: Athanasios Anastasiou
+:date: Oct 2026
+
+"""
+import sys
+import os
+import glob
+import json
+import hashlib
+import re
+import itertools
+import collections
+import contextlib
+import click
+import concurrent.futures
+
+from dgtools import DGB_Archive, DGB_BundleReader, DGB_BundleWriter, DGB_ResultCache, DgtoolsError
+from dgtools.dgsim import trace_program, run_program
+
+
+def collect_inputs(inputs):
+    """
+    Expands files, directories and glob patterns to the list of .dgb (and .dgbz) files to simulate.
+
+    :param inputs: Files, directories or glob patterns.
+    :type inputs: tuple<str>
+    :returns: The .dgb files in the order they were given (directories and patterns are sorted), without duplicates.
+    :rtype: list<str>
+    """
+    input_files = []
+    for an_input in inputs:
+        if os.path.isdir(an_input):
+            input_files.extend(sorted(glob.glob(os.path.join(an_input, "**", "*.dgb"), recursive=True) +
+                                      glob.glob(os.path.join(an_input, "**", "*.dgbz"), recursive=True)))
+        elif os.path.isfile(an_input):
+            input_files.append(an_input)
+        else:
+            input_files.extend(sorted(glob.glob(an_input, recursive=True)))
+    return list(dict.fromkeys(filter(lambda x:not x.endswith(("_memdump.dgb", "_memdump.dgbz")), input_files)))
+
+
+def simulate_archive(compiled_program, title, output_trace_file=None, max_n=200, with_dump=False, 
+                     loop_stride=None, cache_dir=None):
+    """
+    Simulates a program (and optionally writes its trace).
+
+    Notes:
+        * If cache_dir is set, programs whose image has been run before are not simulated again (see run_program). 
+          Programs that are traced are always simulated.
+
+    :param compiled_program: The program to simulate.
+    :type compiled_program: DGB_Archive
+    :param title: The title of the trace.
+    :type title: str
+    :param output_trace_file: The filename of the HTML trace, or None to skip the trace.
+    :type output_trace_file: str<Path>
+    :param max_n: Maximum number of steps to allow the VM to run for.
+    :type max_n: int
+    :param with_dump: Whether to include a complete memory dump at every step of the trace.
+    :type with_dump: bool
+    :param loop_stride: Number of steps between checks for infinite loops, or None to run up to max_n.
+    :type loop_stride: int
+    :param cache_dir: The directory of the result cache, or None.
+    :type cache_dir: str<Path>
+    :returns: The memdump of the program, number of steps, halt reason (None if max_n was reached) and SHA1 of the 
+              final memory space.
+    :rtype: tuple<DGB_Archive, int, str, str>
+    """
+    if output_trace_file is not None:
+        # The traced run is the simulation, its final state is the result.
+        machine, n_steps, halt_reason = trace_program(compiled_program, output_trace_file, max_n=max_n, 
+                                                      with_mem_dump=with_dump, trace_title=title, 
+                                                      loop_stride=loop_stride)
+        final_memory = bytes(machine.mem_view)
+        halt_reason = str(halt_reason) if halt_reason is not None else None
+    else:
+        final_memory, n_steps, halt_reason = run_program(compiled_program, max_n, loop_stride=loop_stride, 
+                                                         result_cache=DGB_ResultCache(cache_dir) 
+                                                                      if cache_dir is not None else None)
+    return (compiled_program.with_program(final_memory), n_steps, halt_reason, hashlib.sha1(final_memory).hexdigest())
+
+
+def simulate_dgb(input_file, output_memdump_file, output_trace_file=None, max_n=200, with_dump=False, 
+                 loop_stride=None, cache_dir=None):
+    """
+    Simulates one .dgb file and writes its memdump (and optionally its trace).
+
+    Notes:
+        * This is the function that is executed by each worker. It returns a short summary rather than the
+          machine, to keep what is sent back to the main process small.
+
+    :param input_file: The `.dgb` file to simulate.
+    :type input_file: str<Path>
+    :param output_memdump_file: The filename of the memdump.
+    :type output_memdump_file: str<Path>
+    :param output_trace_file: The filename of the HTML trace, or None to skip the trace.
+    :type output_trace_file: str<Path>
+    :param max_n: Maximum number of steps to allow the VM to run for.
+    :type max_n: int
+    :param with_dump: Whether to include a complete memory dump at every step of the trace.
+    :type with_dump: bool
+    :param loop_stride: Number of steps between checks for infinite loops, or None to run up to max_n.
+    :type loop_stride: int
+    :param cache_dir: The directory of the result cache, or None.
+    :type cache_dir: str<Path>
+    :returns: input_file, number of steps, halt reason (None if max_n was reached), SHA1 of the final memory space
+              and an error message (None if the simulation completed).
+    :rtype: tuple<str, int, str, str, str>
+    """
+    try:
+        memdump, n_steps, halt_reason, digest = simulate_archive(DGB_Archive.load(input_file), 
+                                                                 os.path.basename(input_file), output_trace_file,
+                                                                 max_n, with_dump, loop_stride, cache_dir)
+        memdump.save(output_memdump_file)
+        return (input_file, n_steps, halt_reason, digest, None)
+    except (DgtoolsError, OSError, ValueError) as e:
+        return (input_file, 0, None, None, str(e))
+
+
+def simulate_bundled_dgb(name, archive_data, output_trace_file=None, max_n=200, with_dump=False, loop_stride=None,
+                         cache_dir=None):
+    """
+    Simulates one program of a bundle (and optionally writes its trace).
+
+    Notes:
+        * The memdump is returned to the main process (as a binary container), that adds it to the bundle of 
+          memdumps.
+        * max_n, with_dump, loop_stride and cache_dir are as in simulate_archive.
+
+    :param name: The name of the program (the bundle and the name of the program in it).
+    :type name: str
+    :param archive_data: The program (as a binary container).
+    :type archive_data: bytes
+    :param output_trace_file: The filename of the HTML trace, or None to skip the trace.
+    :type output_trace_file: str<Path>
+    :returns: name, number of steps, halt reason (None if max_n was reached), SHA1 of the final memory space,
+              an error message (None if the simulation completed) and the memdump (None if it did not).
+    :rtype: tuple<str, int, str, str, str, bytes>
+    """
+    try:
+        memdump, n_steps, halt_reason, digest = simulate_archive(DGB_Archive.from_bytes(archive_data), name,
+                                                                 output_trace_file, max_n, with_dump, loop_stride,
+                                                                 cache_dir)
+        return (name, n_steps, halt_reason, digest, None, memdump.to_bytes())
+    except (DgtoolsError, OSError, ValueError) as e:
+        return (name, 0, None, None, str(e), None)
+
+
+def _bundle_error(input_file, error):
+    """
+    Reports a bundle that cannot be read, as the result of a simulation task.
+    """
+    return (input_file, 0, None, None, error)
+
+
+def _simulate_task(task):
+    """
+    Runs a simulation task (a function and its arguments) in a worker.
+    """
+    return task[0](*task[1:])
+
+
+def _simulate_chunk(chunk):
+    """
+    Runs a chunk of simulation tasks in a worker.
+
+    :param chunk: The tasks, each one along with the memdump bundle its result goes to (or None).
+    :type chunk: list<tuple<tuple<str, str>, tuple>>
+    :returns: The memdump bundle and the result of each task.
+    :rtype: list<tuple<tuple<str, str>, tuple>>
+    """
+    return [(a_bundled_memdump, _simulate_task(a_task)) for a_bundled_memdump, a_task in chunk]
+
+
+def _map_chunks(executor, tasks, chunk_size, max_pending):
+    """
+    Runs tasks in the workers of an executor, yielding their results in order.
+
+    Notes:
+        * Unlike Executor.map, tasks are taken from their iterator as workers become available, at most max_pending 
+          chunks ahead of the results that have been consumed. The programs of large bundles are not all held in 
+          memory at once.
+    """
+    pending = collections.deque()
+    for a_chunk in iter(lambda:list(itertools.islice(tasks, chunk_size)), []):
+        pending.append(executor.submit(_simulate_chunk, a_chunk))
+        if len(pending) >= max_pending:
+            yield from pending.popleft().result()
+    while len(pending) > 0:
+        yield from pending.popleft().result()
+
+
+@click.command()
+@click.argument("inputs", nargs=-1)
+@click.option("--output-dir", "-od", type=click.Path(file_okay=False),
+              help="Directory to write memdumps and traces to, under the path of each input relative to the "
+                   "directory that is common to all inputs. By default, they are written next to each input.")
+@click.option("--max-n", "-mn", type=int, default=200,
+              help="Maximum number of time steps to allow each program to run for.")
+@click.option("--with-trace", "-T", is_flag=True, help="Whether to produce the HTML trace of each program.")
+@click.option("--with-dump", "-wd", is_flag=True,
+              help="Whether to include a complete dump of memory at every time step of a trace.")
+@click.option("--jobs", "-j", type=click.IntRange(min=1),
+              help="Number of worker processes (default: the number of CPUs).")
+@click.option("--summary-file", "-s", type=click.Path(dir_okay=False), help="Filename of a JSON summary of the results.")
+@click.option("--loop-stride", "-ls", type=click.IntRange(min=1), 
+              help="Stop programs that return to a state they have been in before (infinite loops), checking the "
+                   "state every that many steps.")
+@click.option("--cache-dir", "-cd", type=click.Path(file_okay=False), envvar="DGTOOLS_CACHE_DIR",
+              help="Directory of a cache of simulation results. Programs that have been run before (same image, same "
+                   "--max-n and --loop-stride) are not simulated again.")
+def dgbatch(inputs, output_dir, max_n, with_trace, with_dump, jobs, summary_file, loop_stride, cache_dir):
+    """
+    Simulates many Digirule binaries (.dgb) in parallel.
+
+    INPUTS can be .dgb files, bundles of them (.dgbz), directories (searched recursively for .dgb and .dgbz files)
+    or glob patterns. Memory dumps (*_memdump.dgb, *_memdump.dgbz) are skipped. The memdumps of the programs of a 
+    bundle are stored in a bundle too.
+
+    \f
+    :param inputs: The `.dgb` files, directories or glob patterns to simulate.
+    :type inputs: tuple<str>
+    :param output_dir: The directory to write memdumps and traces to.
+    :type output_dir: str<Path>
+    :param max_n: The total number of timesteps to allow each program to run for.
+    :type max_n: int
+    :param with_trace: Whether to produce an HTML trace per program.
+    :type with_trace: bool
+    :param with_dump: Whether to produce a memory dump at each timestep of a trace.
+    :type with_dump: bool
+    :param jobs: The number of worker processes.
+    :type jobs: int
+    :param summary_file: The filename of the JSON summary.
+    :type summary_file: str<Path>
+    :param loop_stride: The number of steps between checks for infinite loops.
+    :type loop_stride: int
+    :param cache_dir: The directory of the result cache.
+    :type cache_dir: str<Path>
+    """
+    input_files = collect_inputs(inputs)
+    if len(input_files) == 0:
+        print("dgbatch: No .dgb files to simulate.")
+        sys.exit(1)
+
+    if output_dir is not None:
+        # Outputs keep the path of their input below the directory that is common to all inputs, so that inputs with 
+        # the same name in different directories do not overwrite each other's outputs.
+        input_root = os.path.commonpath([os.path.dirname(os.path.abspath(an_input_file)) 
+                                         for an_input_file in input_files])
+
+    def simulation_tasks():
+        # Yields the task of every program, along with the memdump bundle (and name) its result goes to. Bundles are 
+        # streamed, their programs are read as the tasks are dispatched.
+        for an_input_file in input_files:
+            output_prefix = os.path.splitext(an_input_file)[0]
+            if output_dir is not None:
+                output_prefix = os.path.join(output_dir, os.path.relpath(os.path.abspath(output_prefix), input_root))
+                os.makedirs(os.path.dirname(output_prefix), exist_ok=True)
+            if not an_input_file.endswith(".dgbz"):
+                yield None, (simulate_dgb, an_input_file, f"{output_prefix}_memdump.dgb",
+                             f"{output_prefix}_trace.html" if with_trace else None, max_n, with_dump, loop_stride,
+                             cache_dir)
+                continue
+            try:
+                with DGB_BundleReader(an_input_file) as bundle:
+                    for a_name, an_archive in bundle:
+                        trace_prefix = f"{output_prefix}_{re.sub(r'[^A-Za-z0-9_.-]', '_', a_name)}"
+                        yield (f"{output_prefix}_memdump.dgbz", a_name), \
+                              (simulate_bundled_dgb, f"{an_input_file}:{a_name}", an_archive.to_bytes(),
+                               f"{trace_prefix}_trace.html" if with_trace else None, max_n, with_dump, loop_stride, 
+                               cache_dir)
+            except (DgtoolsError, OSError) as e:
+                # Bundles that cannot be read are reported along with the programs that fail
+                yield None, (_bundle_error, an_input_file, str(e))
+
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if jobs == 1:
+        results = ((a_bundled_memdump, _simulate_task(a_task)) for a_bundled_memdump, a_task in simulation_tasks())
+        executor = None
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        # Send tasks in chunks, most programs take a few milliseconds to simulate.
+        results = _map_chunks(executor, simulation_tasks(), chunk_size=64, max_pending=jobs * 4)
+
+    summary = []
+    n_errors = 0
+    try:
+        with contextlib.ExitStack() as stack:
+            # The bundles of memdumps, by filename
+            memdump_bundles = {}
+            for a_bundled_memdump, a_result in results:
+                an_input_file, n_steps, halt_reason, digest, error = a_result[:5]
+                if error is not None:
+                    n_errors += 1
+                    print(f"{an_input_file}: ERROR {error}")
+                else:
+                    print(f"{an_input_file}: {n_steps} steps, {halt_reason or f'exceeded max_n={max_n}'}, "
+                          f"sha1:{digest}")
+                    if a_bundled_memdump is not None:
+                        memdump_file, a_name = a_bundled_memdump
+                        if memdump_file not in memdump_bundles:
+                            memdump_bundles[memdump_file] = stack.enter_context(DGB_BundleWriter(memdump_file))
+                        memdump_bundles[memdump_file].add(a_name, DGB_Archive.from_bytes(a_result[5]))
+                summary.append({"input_file":an_input_file, "n_steps":n_steps, "halt_reason":halt_reason,
+                                "mem_sha1":digest, "error":error})
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if summary_file is not None:
+        with open(summary_file, "wt") as fd:
+            json.dump(summary, fd, indent=4)
+
+    print(f"dgbatch: Simulated {len(summary) - n_errors} of {len(summary)} programs.")
+    if n_errors > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    dgbatch()
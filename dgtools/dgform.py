@@ -4,10 +4,19 @@
 Usage: dgform.py [OPTIONS] INPUT_FILE
 
   Generates an HTML file with code formatted through the DigiruleASM
-  pygments formatter.
+  pygments formatter. Output is sent to stdout.
+
+  With --coverage-file, the listing is annotated with the number of times the
+  bytes of each line were executed, read and written.
 
 Options:
-  --help  Show this message and exit.
+  -c, --coverage-file FILE  Annotate the listing with the coverage produced by
+                            dgsim.py --coverage-file.
+
+  -s, --summary-file FILE   Filename of a JSON summary of the coverage of each
+                            source line (requires --coverage-file).
+
+  --help                    Show this message and exit.
 
 \f
 :author: Athanasios Anastasiou
@@ -16,23 +25,132 @@ Options:
 from pygments import highlight
 from pygments.formatters import HtmlFormatter
 import sys
-import click 
-from dgtools import DigiruleASMLexer
+import json
+import html
+import click
+from dgtools import DigiruleASMLexer, DgAssembler, BUILTIN_MODELS, DgtoolsError
+
+
+def line_coverage(source_map, coverage):
+    """
+    Aggregates the coverage of each address to the source line that produced it.
+
+    Notes:
+        * The status of a line is "executed" if any of its bytes was executed as an opcode, "data" if any of its
+          bytes was fetched as an operand, read or written and "unused" otherwise.
+
+    :param source_map: The source (line, column) of every byte of the program (as returned by 
+                       DgAssembler.asm_ast_to_obj).
+    :type source_map: list<tuple<int, int>>
+    :param coverage: The coverage of the program (as produced by dgsim.py --coverage-file).
+    :type coverage: dict
+    :returns: The coverage of each line that produced object code, in line order.
+    :rtype: list<dict>
+    """
+    lines = {}
+    for an_addr, (a_line, a_col) in enumerate(source_map):
+        if a_line not in lines:
+            lines[a_line] = {"line":a_line, "addresses":[], "executed":0, "operand":0, "read":0, "written":0}
+        lines[a_line]["addresses"].append(an_addr)
+        for a_count in ["executed", "operand", "read", "written"]:
+            lines[a_line][a_count] += coverage[a_count][an_addr]
+    for a_line in lines.values():
+        if a_line["executed"] > 0:
+            a_line["status"] = "executed"
+        elif a_line["operand"] + a_line["read"] + a_line["written"] > 0:
+            a_line["status"] = "data"
+        else:
+            a_line["status"] = "unused"
+    return [lines[a_line] for a_line in sorted(lines)]
+
+
+def coverage_listing(title, source_text, lines, coverage):
+    """
+    Returns the HTML listing of a program, annotated with the coverage of each line.
+
+    :param title: A title for the listing.
+    :type title: str
+    :param source_text: The assembly source.
+    :type source_text: str
+    :param lines: The coverage of each line (as returned by line_coverage).
+    :type lines: list<dict>
+    :param coverage: The coverage of the program (as produced by dgsim.py --coverage-file).
+    :type coverage: dict
+    :rtype: str
+    """
+    formatter = HtmlFormatter(nowrap=True)
+    # The lexer does not produce tokens that span lines, so the highlighted code splits to the same lines as the source
+    highlighted_lines = highlight(source_text, DigiruleASMLexer(), formatter).split("\n")
+    lines_by_number = {a_line["line"]:a_line for a_line in lines}
+    n_status = {a_status:sum(1 for a_line in lines if a_line["status"] == a_status)
+                for a_status in ["executed", "data", "unused"]}
+    halt_reason = coverage["halt_reason"] or "Program exceeded max_n"
+    rows = ""
+    for a_line_number, a_highlighted_line in enumerate(highlighted_lines[:len(source_text.splitlines())], start=1):
+        a_line = lines_by_number.get(a_line_number)
+        if a_line is None:
+            rows += f"<tr><td>{a_line_number}</td><td></td><td></td><td></td><td></td>" \
+                    f"<td><pre>{a_highlighted_line}</pre></td></tr>\n"
+        else:
+            rows += f"<tr class=\"{a_line['status']}\"><td>{a_line_number}</td>" \
+                    f"<td>{a_line['addresses'][0]}</td><td>{a_line['executed']}</td>" \
+                    f"<td>{a_line['read']}</td><td>{a_line['written']}</td>" \
+                    f"<td><pre>{a_highlighted_line}</pre></td></tr>\n"
+    return f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>{html.escape(title)}</title>\n" \
+           f"<style>\n{formatter.get_style_defs('.highlight')}\n" \
+           f"table.coverage td {{padding:0 0.5em; text-align:right; vertical-align:top;}}\n" \
+           f"table.coverage td pre {{margin:0; text-align:left;}}\n" \
+           f"tr.executed {{background-color:#d4f7d4;}}\ntr.data {{background-color:#d4e4f7;}}\n" \
+           f"tr.unused {{background-color:#f7d4d4;}}\n</style>\n</head>\n<body>\n" \
+           f"<h1>{html.escape(title)}</h1>\n" \
+           f"<p>Steps: {coverage['n_steps']} ({html.escape(halt_reason)})<br/>\n" \
+           f"Lines executed: {n_status['executed']}, used as data: {n_status['data']}, " \
+           f"unused: {n_status['unused']}</p>\n" \
+           f"<table class=\"highlight coverage\">\n" \
+           f"<tr><th>Line</th><th>Addr</th><th>Executed</th><th>Read</th><th>Written</th><th>Source</th></tr>\n" \
+           f"{rows}</table>\n</body>\n</html>\n"
 
 
 @click.command()
 @click.argument("input_file", type=click.File("rb"))
-def dgform(input_file):
+@click.option("--coverage-file", "-c", type=click.Path(exists=True, dir_okay=False),
+              help="Annotate the listing with the coverage produced by dgsim.py --coverage-file.")
+@click.option("--summary-file", "-s", type=click.Path(dir_okay=False),
+              help="Filename of a JSON summary of the coverage of each source line (requires --coverage-file).")
+def dgform(input_file, coverage_file, summary_file):
     """
     Generates an HTML file with code formatted through the DigiruleASM pygments formatter.
     Output is sent to stdout.
+
+    With --coverage-file, the listing is annotated with the number of times the bytes of each line were executed,
+    read and written.
     """
-    sys.stdout.write(highlight(input_file.read(), 
-                               DigiruleASMLexer(), 
-                               HtmlFormatter(full=True,
-                                             cssfile="dgform_theme.css",
-                                             linenos="table")))
-    
+    if coverage_file is None:
+        sys.stdout.write(highlight(input_file.read(),
+                                   DigiruleASMLexer(),
+                                   HtmlFormatter(full=True,
+                                                 cssfile="dgform_theme.css",
+                                                 linenos="table")))
+        return
+
+    try:
+        source_text = input_file.read().decode("utf-8")
+        with open(coverage_file, "rt") as fd:
+            coverage = json.load(fd)
+        # The source is assembled again, to map every address back to its line.
+        assembler = DgAssembler(BUILTIN_MODELS[coverage["model"]])
+        compiled_program = assembler.asm_ast_to_obj(assembler.text_to_ast(source_text))
+        if compiled_program["program"] != coverage["program"]:
+            raise DgtoolsError(f"{coverage_file} is not the coverage of {input_file.name}.")
+        lines = line_coverage(compiled_program["source_map"], coverage)
+        sys.stdout.write(coverage_listing(f"Coverage of {input_file.name}", source_text, lines, coverage))
+        if summary_file is not None:
+            with open(summary_file, "wt") as fd:
+                json.dump(lines, fd, indent=4)
+    except Exception as e:
+        print(f"dgform: {str(e)}")
+        sys.exit(1)
+
 
 if __name__ == "__main__":
     dgform()
@@ -9,6 +9,10 @@ Usage: dginspect.py [OPTIONS] INPUT_FILE
   applying the modifications  is created automatically. To turn this
   functionality off, see option `--no-backup`
 
+  INPUT_FILE can also be a binary trace (.dgt), in which case the memory and
+  registers of the machine at step --at-step are inspected. Traces cannot be
+  modified.
+
 Options:
   -b, --list-binary               Produces a listing of the code in binary as
                                   ADDR:VALUE. This format makes keying the
@@ -35,6 +39,10 @@ Options:
                                   Set a memory value (as Address, Value).
 
   -nb, --no-backup                If set then no backup file is created.
+  -n, --at-step INTEGER RANGE     The step of a binary trace (.dgt) to
+                                  inspect. By default, the last step of the
+                                  trace.  [x>=0]
+
   --help                          Show this message and exit.
 
 
@@ -47,7 +55,8 @@ import os
 import pickle
 import click
 from dgtools.dgsim import validate_trace_symbol
-from dgtools import DgtoolsErrorSymbolUndefined, DgtoolsErrorDgbarchiveCorrupted, DGB_Archive
+from dgtools import (DgtoolsErrorSymbolUndefined, DgtoolsErrorDgbarchiveCorrupted, DgtoolsError, DGB_Archive, 
+                     DGT_TraceReader)
 
 
 def binary_listing(a_program):
@@ -77,13 +86,18 @@ def binary_listing(a_program):
               help="Set a memory value (as Address, Value).")
 @click.option("--no-backup", "-nb", is_flag=True, 
               help="If set then no backup file is created.")
-def dginspect(input_file, list_binary, get_mem, set_mem, no_backup):
+@click.option("--at-step", "-n", type=click.IntRange(min=0), 
+              help="The step of a binary trace (.dgt) to inspect. By default, the last step of the trace.")
+def dginspect(input_file, list_binary, get_mem, set_mem, no_backup, at_step):
     """
     Command line tool to inspect and modify .dgb files.
     
     If modifying the .dgb file, a backup (.bak) with the version prior to applying the modifications 
     is created automatically. To turn this functionality off, see option `--no-backup`
     
+    INPUT_FILE can also be a binary trace (.dgt), in which case the memory and registers of the machine at 
+    step --at-step are inspected. Traces cannot be modified.
+    
     \f
     :param input_file: The .dgb file to inspect
     :type input_file: str<Path>
@@ -95,10 +109,26 @@ def dginspect(input_file, list_binary, get_mem, set_mem, no_backup):
     :type set_mem: tuple<tuple<int,int>>
     :param no_backup: By default, this function creates a backup file if it were to modify memory. This option turns 
                      backups off.
+    :param at_step: The step of a binary trace to inspect.
+    :type at_step: int
     """
     # TODO: HIGH, Add a mode that only generates an update of the VM state when the state of one of the tracked symbols changes
     try:
-        compiled_program = DGB_Archive.load(input_file)       
+        machine_state = None
+        if os.path.splitext(input_file)[1] == ".dgt":
+            if len(set_mem) > 0:
+                raise DgtoolsError("Binary traces cannot be modified.")
+            with DGT_TraceReader(input_file) as dgt_trace:
+                if at_step is None:
+                    at_step = dgt_trace.first_step + dgt_trace.n_states - 1
+                # The state is reconstructed from the nearest full snapshot of the trace.
+                machine_state = dgt_trace.state_at(at_step)
+                compiled_program = DGB_Archive(bytearray(machine_state.mem), dgt_trace.labels, 
+                                               version=dgt_trace.model)
+        elif at_step is not None:
+            raise DgtoolsError("--at-step requires a binary trace (.dgt).")
+        else:
+            compiled_program = DGB_Archive.load(input_file)       
     
         if list_binary:
             sys.stdout.write(f"Inspecting {input_file}\n")
@@ -129,40 +159,46 @@ def dginspect(input_file, list_binary, get_mem, set_mem, no_backup):
                                      filter(lambda x:len(x)==3, symbols_to_trace)))
                                          
             sys.stdout.write(f"Inspecting {input_file}\n\n")
-            sys.stdout.write(f"Program:\n{compiled_program.program}\n\n")
+            sys.stdout.write(f"Program:\n{list(compiled_program.program)}\n\n")
             sys.stdout.write(f"Program Size:\n{len(compiled_program.program)} bytes\n\n")
-            sys.stdout.write(f"Label offsets:\n{compiled_program.labels}\n\n")
+            sys.stdout.write(f"Label offsets:\n{dict(compiled_program.labels)}\n\n")
             sys.stdout.write(f"Model:\n{compiled_program.version}\n\n")
             
+            if machine_state is not None:
+                sys.stdout.write(f"State at step {machine_state.step}:\n"
+                                 f"PC:{machine_state.pc}, ACC:{machine_state.acc}, Status:{machine_state.status}, "
+                                 f"Speed:{machine_state.speed}, Stack:{list(machine_state.ppc)}\n\n")
+            
             if len(get_mem)>0:
                 # Build the get mem symbols here
                 mem_vals = ""
                 for a_symbol in extra_symbols:
-                    mem_vals+=f"{a_symbol[0]}: {compiled_program.program[a_symbol[1]:(a_symbol[1]+a_symbol[2])]}\n"
+                    mem_vals+=f"{a_symbol[0]}: {compiled_program.program_view[a_symbol[1]:(a_symbol[1]+a_symbol[2])].tolist()}\n"
                 sys.stdout.write(f"Specific memory areas:\n{mem_vals}\n\n")
             
             if (len(set_mem)) > 0:
+                # Modified archives are saved in the format they were loaded from
+                as_json = not DGB_Archive.is_binary(input_file)
                 if not no_backup:
                     bak_file = f"{os.path.splitext(input_file)[0]}.bak"
                     # First create a backup
-                    compiled_program.save(bak_file)
+                    compiled_program.save(bak_file, as_json=as_json)
                 else:
                     sys.stdout.write("Skipping backup file.\n\n")
                         
-                # Create a copy archive
-                modified_program = DGB_Archive.from_archive(compiled_program)
-                
-                # Apply required modifications
+                # Apply required modifications to a copy of the program
                 # TODO: HIGH, the following operations can be "absorbed" into the DGB_Archive with appropriate validations too
+                modified_mem = bytearray(compiled_program.program)
                 if set_mem is not None:
                     for a_set_mem in set_mem:
-                        previous_value = modified_program.program[a_set_mem[0]]
-                        modified_program.program[a_set_mem[0] & 0xFF] = a_set_mem[1] & 0xFF
+                        previous_value = modified_mem[a_set_mem[0]]
+                        modified_mem[a_set_mem[0] & 0xFF] = a_set_mem[1] & 0xFF
                         sys.stdout.write(f"Modifying address {a_set_mem[0]} from {previous_value} to {a_set_mem[1]}\n")
                     sys.stdout.write("\n")
+                modified_program = compiled_program.with_program(modified_mem)
 
                 # Save the new dgb
-                modified_program.save(input_file)
+                modified_program.save(input_file, as_json=as_json)
                 sys.stdout.write(f"Saving changes to {input_file}\n\n")
     except Exception as e:
         print(f"ERROR:{str(e)}")
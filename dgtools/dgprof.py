@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+"""
+
+Usage: dgprof.py [OPTIONS] INPUT_FILE
+
+  Profiles the execution of a Digirule binary (.dgb) on simulated hardware.
+
+  Reports the number of instructions executed per opcode, per label (the label
+  that encloses each address) and per function of the call graph (the targets
+  of CALL), as well as the addresses executed most often. If the binary has a
+  source map, steps are also reported per source line.
+
+Options:
+  -o, --output-file FILE      Filename of the text report. By default, the
+                              report is written to stdout.
+
+  -cf, --collapsed-file FILE  Filename of the call stacks in collapsed form
+                              (one 'caller;callee count' line per stack), as
+                              expected by flamegraph tools.
+
+  -mn, --max-n INTEGER        Maximum number of time steps to allow the sim to
+                              run for.
+
+  -tn, --top-n INTEGER RANGE  Number of most executed addresses (and source
+                              lines) to report.  [x>=0]
+
+  --help                      Show this message and exit.
+
+
+:author: Athanasios Anastasiou
+:date: Oct 2026
+
+"""
+
+import sys
+import bisect
+import collections
+import click
+
+from dgtools import DGB_Archive, BUILTIN_MODELS
+from dgtools.exceptions import DgtoolsError
+from dgtools.dgsim import halt_message
+
+
+class ProgramProfile:
+    """
+    Counts of instructions executed by a program, per address, opcode, label and call stack.
+
+    Notes:
+        * Every instruction counts as one step, whatever it does.
+        * Call stacks are tracked through the program counter stack of the VM. A CALL pushes a frame named after
+          the label at the called address, a RETURN pops it and (on the 2U) INITSP clears every frame but the first.
+    """
+    def __init__(self, labels, source_map=None):
+        """
+        Initialisation
+
+        :param labels: Lookup of labels and their offsets within the memory space.
+        :type labels: dict<str:int>
+        :param source_map: The source (line, column) of every byte of the program.
+        :type source_map: list<tuple<int, int>>
+        """
+        # Labels sorted by offset (and name, for labels that share an offset)
+        sorted_labels = sorted(labels.items(), key=lambda x:(x[1], x[0]))
+        self._label_offsets = [an_offset for a_label, an_offset in sorted_labels]
+        self._label_names = [a_label for a_label, an_offset in sorted_labels]
+        self._source_map = source_map
+        self.n_steps = 0
+        self.halt_reason = None
+        self.by_address = collections.Counter()
+        self.by_opcode = collections.Counter()
+        self.by_stack = collections.Counter()
+        self.calls = collections.Counter()
+
+    def label_at(self, addr):
+        """
+        Returns the label that encloses an address (the nearest label at or before it), or the address in hex.
+        """
+        k = bisect.bisect_right(self._label_offsets, addr) - 1
+        return self._label_names[k] if k >= 0 else f"0x{addr:02X}"
+
+    def function_at(self, addr):
+        """
+        Returns the name of the function that starts at an address (its label, or the address in hex).
+        """
+        k = bisect.bisect_left(self._label_offsets, addr)
+        if k < len(self._label_offsets) and self._label_offsets[k] == addr:
+            return self._label_names[k]
+        return f"0x{addr:02X}"
+
+    @property
+    def by_label(self):
+        """
+        Number of steps per enclosing label.
+
+        :rtype: collections.Counter
+        """
+        by_label = collections.Counter()
+        for addr, count in self.by_address.items():
+            by_label[self.label_at(addr)] += count
+        return by_label
+
+    def line_at(self, addr):
+        """
+        Returns the source line of an address, or None if it is not known.
+        """
+        if self._source_map is None or addr >= len(self._source_map):
+            return None
+        return self._source_map[addr][0]
+
+    @property
+    def by_line(self):
+        """
+        Number of steps per source line (None for addresses outside the source map).
+
+        :rtype: collections.Counter
+        """
+        by_line = collections.Counter()
+        for addr, count in self.by_address.items():
+            by_line[self.line_at(addr)] += count
+        return by_line
+
+    @property
+    def by_function(self):
+        """
+        Exclusive (spent in the function itself) and inclusive (spent in the function and anything it calls) steps
+        per function.
+
+        :rtype: dict<str:tuple<int, int>>
+        """
+        exclusive = collections.Counter()
+        inclusive = collections.Counter()
+        for a_stack, count in self.by_stack.items():
+            exclusive[a_stack[-1]] += count
+            # Recursive functions count once per step
+            for a_function in set(a_stack):
+                inclusive[a_function] += count
+        return {a_function:(exclusive[a_function], inclusive[a_function]) for a_function in inclusive}
+
+    def collapsed_stacks(self):
+        """
+        Returns the call stacks in collapsed form (``caller;callee count`` per line).
+
+        :rtype: str
+        """
+        return "".join(f"{';'.join(a_stack)} {count}\n" for a_stack, count in sorted(self.by_stack.items()))
+
+    def report(self, title, mnemonics, top_n=20):
+        """
+        Returns the profile as human readable text.
+
+        :param title: A title for the report.
+        :type title: str
+        :param mnemonics: Lookup of opcodes to their mnemonics.
+        :type mnemonics: dict<int:str>
+        :param top_n: Number of most executed addresses (and source lines) to report.
+        :type top_n: int
+        :rtype: str
+        """
+        total = max(self.n_steps, 1)
+        halt_reason = str(self.halt_reason) if self.halt_reason is not None else "Program exceeded max_n"
+        to_ret = f"Profile of {title}\n\nSteps:\n{self.n_steps} ({halt_reason})\n\n"
+
+        to_ret += f"Steps per opcode:\n{'STEPS':>10} {'%':>6}  MNEMONIC\n"
+        for an_opcode, count in self.by_opcode.most_common():
+            to_ret += f"{count:10d} {100 * count / total:6.2f}  {mnemonics.get(an_opcode, an_opcode)}\n"
+
+        to_ret += f"\nSteps per label:\n{'STEPS':>10} {'%':>6}  LABEL\n"
+        for a_label, count in self.by_label.most_common():
+            to_ret += f"{count:10d} {100 * count / total:6.2f}  {a_label}\n"
+
+        if self._source_map is not None:
+            to_ret += f"\nSteps per source line:\n{'STEPS':>10} {'%':>6}  LINE\n"
+            for a_line, count in self.by_line.most_common(top_n):
+                to_ret += f"{count:10d} {100 * count / total:6.2f}  {a_line if a_line is not None else '-'}\n"
+
+        to_ret += f"\nCall graph:\n{'INCLUSIVE':>10} {'%':>6} {'EXCLUSIVE':>10} {'%':>6} {'CALLS':>8}  FUNCTION\n"
+        for a_function, (exclusive, inclusive) in sorted(self.by_function.items(), key=lambda x:-x[1][1]):
+            to_ret += f"{inclusive:10d} {100 * inclusive / total:6.2f} {exclusive:10d} {100 * exclusive / total:6.2f} " \
+                      f"{self.calls[a_function]:8d}  {a_function}\n"
+
+        to_ret += f"\nMost executed addresses:\n{'ADDR':>4} {'STEPS':>10} {'%':>6} {'LINE':>6}  LABEL\n"
+        for addr, count in self.by_address.most_common(top_n):
+            a_line = self.line_at(addr)
+            to_ret += f"{addr:4d} {count:10d} {100 * count / total:6.2f} {a_line if a_line is not None else '-':>6}  " \
+                      f"{self.label_at(addr)}\n"
+        return to_ret
+
+
+def profile_program(program, max_n=200):
+    """
+    Executes a program, counting the instructions it executes.
+
+    :param program: A fully compiled Digirule2 binary.
+    :type program: DGB_Archive
+    :param max_n: Maximum number of steps to allow the VM to run for.
+    :type max_n: int (>0)
+    :returns: The profile and the VM at its final state.
+    :rtype: tuple<ProgramProfile, Digirule>
+    """
+    machine = BUILTIN_MODELS[program.version]()
+    machine.load_program(program.program)
+    machine.use_decode_cache = True
+    profile = ProgramProfile(program.labels, program.source_map)
+
+    mem = machine.mem_view
+    by_address = profile.by_address
+    by_opcode = profile.by_opcode
+    by_stack = profile.by_stack
+    stack = (profile.function_at(machine._pc),)
+    n = 0
+    while n < max_n:
+        pc = machine._pc
+        depth = len(machine._ppc)
+        by_address[pc] += 1
+        by_opcode[mem[pc]] += 1
+        by_stack[stack] += 1
+        n += 1
+        try:
+            machine._exec_next()
+        except DgtoolsError as de:
+            profile.halt_reason = halt_message(program, machine, de)
+            break
+        new_depth = len(machine._ppc)
+        if new_depth > depth:
+            a_function = profile.function_at(machine._pc)
+            profile.calls[a_function] += 1
+            stack = stack + (a_function,)
+        elif new_depth < depth:
+            stack = stack[:max(1, len(stack) - (depth - new_depth))]
+    profile.n_steps = n
+    return profile, machine
+
+
+@click.command()
+@click.argument("input-file", type=click.Path(exists=True))
+@click.option("--output-file", "-o", type=click.Path(dir_okay=False),
+              help="Filename of the text report. By default, the report is written to stdout.")
+@click.option("--collapsed-file", "-cf", type=click.Path(dir_okay=False),
+              help="Filename of the call stacks in collapsed form (one 'caller;callee count' line per stack), as "
+                   "expected by flamegraph tools.")
+@click.option("--max-n","-mn", type=int, default=200,
+              help="Maximum number of time steps to allow the sim to run for.")
+@click.option("--top-n", "-tn", type=click.IntRange(min=0), default=20,
+              help="Number of most executed addresses (and source lines) to report.")
+def dgprof(input_file, output_file, collapsed_file, max_n, top_n):
+    """
+    Profiles the execution of a Digirule binary (.dgb) on simulated hardware.
+
+    Reports the number of instructions executed per opcode, per label (the label that encloses each address) and
+    per function of the call graph (the targets of CALL), as well as the addresses executed most often. If the binary
+    has a source map, steps are also reported per source line.
+
+    \f
+    :param input_file: The `.dgb` file to profile.
+    :type input_file: str<Path>
+    :param output_file: The filename of the text report.
+    :type output_file: str<Path>
+    :param collapsed_file: The filename of the collapsed call stacks.
+    :type collapsed_file: str<Path>
+    :param max_n: The total number of timesteps to allow execution to run for.
+    :type max_n: int
+    :param top_n: The number of most executed addresses (and source lines) to report.
+    :type top_n: int
+    """
+    try:
+        compiled_program = DGB_Archive.load(input_file)
+        profile, machine = profile_program(compiled_program, max_n=max_n)
+        mnemonics = {an_opcode:a_handler.__name__.strip("_").upper()
+                     for an_opcode, (a_handler, num_operands) in machine._ins_lookup.items()}
+        report = profile.report(input_file, mnemonics, top_n=top_n)
+        if output_file is not None:
+            with open(output_file, "wt") as fd:
+                fd.write(report)
+        else:
+            sys.stdout.write(report)
+        if collapsed_file is not None:
+            with open(collapsed_file, "wt") as fd:
+                fd.write(profile.collapsed_stacks())
+    except Exception as e:
+        print(f"dgprof: {str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    dgprof()
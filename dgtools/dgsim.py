@@ -6,9 +6,12 @@ Usage: dgsim.py [OPTIONS] INPUT_FILE
   Command line program that produces a trace of a Digirule2 binary on
   simulated hardware.
 
+  INPUT_FILE can also be a binary trace (.dgt), which is then rendered to
+  HTML.
+
 Options:
   -otf, --output-trace_file PATH  Filename containing trace information in
-                                  HTML.
+                                  HTML (or binary, see --trace-format).
 
   -omf, --output-memdump_file PATH
                                   Filename containing final memory space.
@@ -43,6 +46,55 @@ Options:
   -mn, --max-n INTEGER            Maximum number of time steps to allow the
                                   sim to run for.
 
+  -ps, --page-size INTEGER RANGE  Number of time steps per page of the trace.
+                                  If set, the trace file becomes an index of
+                                  the pages.  [x>=1]
+
+  -tf, --trace-format [html|dgt|none]
+                                  Whether to produce an HTML trace or record a
+                                  binary (.dgt) trace that can be rendered
+                                  later. With none, only the memdump is
+                                  produced.
+
+  -ki, --keyframe-interval INTEGER RANGE
+                                  Number of time steps between two complete
+                                  memory snapshots of a binary trace.  [x>=1]
+
+  -rf, --resume-from FILE         A binary (.dgt) trace of the same program.
+                                  The simulation is restored from the recorded
+                                  state nearest to --skip-n (--max-n with
+                                  --trace-format none), instead of executing
+                                  every step up to it.
+
+  -cov, --coverage-file FILE      Instead of a trace, produce a JSON file with
+                                  the number of times each address was
+                                  executed, fetched as an operand, read and
+                                  written (see dgform.py to annotate the
+                                  source with it).
+
+  -cd, --cache-dir DIRECTORY      Directory of a cache of simulation results.
+                                  With --trace-format none, programs that have
+                                  been run before (same image, same --max-n,
+                                  same inputs) are not simulated again.
+
+  -rs, --result-store FILE        An SQLite file of simulation results, used
+                                  like --cache-dir (and instead of it) but
+                                  kept to --result-store-size results,
+                                  evicting the least recently used ones.
+
+  -rss, --result-store-size INTEGER RANGE
+                                  Maximum number of results to keep in the
+                                  result store.  [x>=1]
+
+  -is, --input-streams FILE       A JSON file with the values to feed the
+                                  inputs of the Digirule with (button, comin,
+                                  pin_in), instead of prompting for them in
+                                  interactive mode.
+
+  -ri, --record-inputs FILE       In interactive mode, write the values that
+                                  were entered to a JSON file that can be used
+                                  as --input-streams.
+
   --theme TEXT                    Specifies the CSS theme to use (plain OR
                                   dgbeos)
 
@@ -63,22 +115,226 @@ from dgtools import (DgtoolsErrorOpcodeNotSupported,
                      DgtoolsErrorDgbarchiveCorrupted, 
                      DgtoolsErrorSymbolUndefined,
                      DgtoolsErrorProgramHalt, 
-                     Output_Render_HTML,
+                     Output_Trace_HTML,
                      DGB_Archive,
+                     DGT_TraceWriter,
+                     DGT_TraceReader,
+                     DGB_ResultCache,
+                     DGB_ResultStore,
                      DigiruleCallbackInputUserInteraction,
+                     DigiruleCallbackInputSequence,
+                     DigiruleCallbackInputRecorder,
                      Digirule, 
                      Digirule2U, 
+                     DigiruleRunResult, 
                      BUILTIN_MODELS)
 import inspect
 import shutil
-from dgtools.exceptions import DgtoolsError
+import hashlib
+import json
+import random
+from dgtools.exceptions import DgtoolsError, DgtoolsErrorOpcodeNotSupported
+from dgtools.dgt_trace import state_to_machine
+from dgtools.result_cache import result_key
+    
+
+def halt_message(program, machine, halt_reason):
+    """
+    Returns the reason a program halted, pointing at the source of the instruction that could not be executed.
+    
+    Notes:
+        * Only archives that carry a source map can point at the source.
+    
+    :param program: A fully compiled Digirule2 binary.
+    :type program: DGB_Archive
+    :param machine: The VM, right after it halted.
+    :type machine: Digirule
+    :param halt_reason: The reason the VM halted.
+    :type halt_reason: DgtoolsError
+    :rtype: str
+    """
+    if type(halt_reason) is DgtoolsErrorOpcodeNotSupported:
+        # The program counter has already moved past the opcode
+        addr = (machine._pc - 1) & 0xFF
+        position = program.source_position(addr)
+        if position is not None:
+            return f"{halt_reason} at 0x{addr:02X} (line {position[0]}, col {position[1]})"
+    return str(halt_reason)
+
+# The inputs of a VM that can be fed from a stream of values, by name (and the property of their callback)
+INPUT_CALLBACKS = {"button":"interactive_callback", "comin":"comin_callback", "pin_in":"pin_in_callback"}
+
+def read_input_streams(input_file):
+    """
+    Reads the streams of values to feed the inputs of a VM with, from a JSON file.
+
+    Notes:
+        * The file holds a list of values (uint8) per input name (see INPUT_CALLBACKS), for example 
+          ``{"button":[1, 2], "comin":[65]}``. record_inputs produces such files from interactive runs.
+
+    :param input_file: The JSON file.
+    :type input_file: str<Path>
+    :rtype: dict<str:list<int>>
+    """
+    with open(input_file, "rt") as fd:
+        input_streams = json.load(fd)
+    if type(input_streams) is not dict or \
+       not all(map(lambda x:x in INPUT_CALLBACKS, input_streams)) or \
+       not all(map(lambda x:type(x) is list and all(map(lambda y:type(y) is int and 0<=y<=255, x)), 
+                   input_streams.values())):
+        raise ValueError(f"Expected input streams as lists of uint8 named {'/'.join(INPUT_CALLBACKS)}, "
+                         f"received {input_file}")
+    return input_streams
+
+def connect_inputs(machine, in_interactive_mode=False, input_streams=None):
+    """
+    Connects the inputs of a VM to the user (interactive mode) or to streams of values.
+
+    Notes:
+        * In interactive mode, the values the user enters are recorded (see record_inputs).
+        * An input returns 0 once its stream is exhausted.
+
+    :param machine: The VM.
+    :type machine: Digirule
+    :param in_interactive_mode: Whether to execute the program in interactive mode.
+    :type in_interactive_mode: bool
+    :param input_streams: The values each input returns, in order, by input name (see read_input_streams).
+    :type input_streams: dict<str:list<int>>
+    :raises DgtoolsError: If the model of the VM does not have one of the inputs.
+    """
+    if in_interactive_mode:
+        machine.set_default_callbacks()
+        for a_callback in INPUT_CALLBACKS.values():
+            if hasattr(machine, a_callback):
+                setattr(machine, a_callback, DigiruleCallbackInputRecorder(getattr(machine, a_callback)))
+    elif input_streams is not None:
+        for a_name, a_stream in input_streams.items():
+            if not hasattr(machine, INPUT_CALLBACKS[a_name]):
+                raise DgtoolsError(f"{type(machine).__name__} does not have a {a_name} input.")
+            setattr(machine, INPUT_CALLBACKS[a_name], DigiruleCallbackInputSequence(a_stream))
+
+def record_inputs(machine, output_file):
+    """
+    Writes the values that were entered to the inputs of a VM in interactive mode to a JSON file that 
+    read_input_streams can read.
+
+    :param machine: The VM, after it was run in interactive mode.
+    :type machine: Digirule
+    :param output_file: The JSON file.
+    :type output_file: str<Path>
+    """
+    input_streams = {}
+    for a_name, a_callback in INPUT_CALLBACKS.items():
+        a_recorder = getattr(machine, a_callback, None)
+        if isinstance(a_recorder, DigiruleCallbackInputRecorder):
+            input_streams[a_name] = list(a_recorder.values)
+    with open(output_file, "wt") as fd:
+        json.dump(input_streams, fd)
+    
+def start_program(program, skip_n=0, max_n=200, in_interactive_mode=False, resume_from=None, input_streams=None):
+    """
+    Sets up a VM for program and executes its first skip_n steps.
+    
+    Notes:
+        * If resume_from is a binary trace of the same program, the VM is restored to the recorded state that is 
+          nearest to skip_n, rather than executing every step up to it.
+        * Input streams are replayed from their first value, they cannot be combined with resume_from.
+    
+    :param program: A fully compiled Digirule2 binary.
+    :type program: DGB_Archive
+    :param skip_n: Number of execution steps to execute.
+    :type skip_n: int (>0)
+    :param max_n: Maximum number of steps to allow the VM to run for.
+    :type max_n: int (>0)
+    :param in_interactive_mode: Whether to execute the program in interactive mode.
+    :type in_interactive_mode: bool
+    :param resume_from: The filename of a binary (.dgt) trace of program.
+    :type resume_from: str
+    :param input_streams: The values each input of the VM returns, by input name (see read_input_streams).
+    :type input_streams: dict<str:list<int>>
+    :returns: The VM, the number of steps it has executed and the reason it halted (or None).
+    :rtype: tuple<Digirule, int, DgtoolsError>
+    """
+    machine = BUILTIN_MODELS[program.version]()
+    machine.load_program(program.program)
+    n = 0
+    skip_n = min(skip_n, max_n)
+    
+    if resume_from is not None:
+        if input_streams is not None:
+            raise DgtoolsError("Input streams cannot be replayed from a recorded state.")
+        with DGT_TraceReader(resume_from) as dgt_trace:
+            if dgt_trace.model != program.version or \
+               dgt_trace.program_digest != hashlib.sha1(program.program_view).hexdigest():
+                raise DgtoolsError(f"Trace {resume_from} was not recorded from this program.")
+            # The last state of a halted trace is after the halt, it is re-executed to reproduce it.
+            last_step = dgt_trace.first_step + dgt_trace.n_states - 1 - (dgt_trace.halt_reason is not None)
+            if dgt_trace.first_step <= min(skip_n, last_step):
+                n = min(skip_n, last_step)
+                machine = dgt_trace.machine_at(n)
     
+    connect_inputs(machine, in_interactive_mode, input_streams)
+    # Each instruction is decoded once, rather than at every step that executes it
+    machine.use_decode_cache = True
+        
+    # Steps that are not traced are executed at full speed
+    run_result = machine.run(skip_n - n)
+    return machine, n + run_result.n_steps, run_result.halt_reason
+
+def run_program(program, max_n=200, loop_stride=None, input_streams=None, result_cache=None):
+    """
+    Executes a program at full speed, without a trace.
+
+    Notes:
+        * If result_cache is set, the result is returned from it when the same image has been run before for the 
+          same max_n, loop_stride and input streams, and stored in it otherwise.
+        * Runs that draw random numbers (RANDA) cannot be reproduced from their key and are not stored. Only runs 
+          that did not draw any are looked up, since those are the only ones that are stored.
+        * There is no interactive mode, the inputs of a run must be known before it to look its result up 
+          (see start_program to run a program interactively).
+
+    :param program: A fully compiled Digirule2 binary.
+    :type program: DGB_Archive
+    :param max_n: Maximum number of steps to allow the VM to run for.
+    :type max_n: int (>0)
+    :param loop_stride: Number of steps between checks for infinite loops, or None to run up to max_n.
+    :type loop_stride: int
+    :param input_streams: The values each input of the VM returns, by input name (see read_input_streams).
+    :type input_streams: dict<str:list<int>>
+    :param result_cache: The results of earlier runs, or None.
+    :type result_cache: DGB_ResultCache or DGB_ResultStore
+    :returns: The final memory, the number of steps and the halt reason (None if max_n was reached).
+    :rtype: tuple<bytes, int, str>
+    """
+    if result_cache is not None:
+        key = result_key(program, max_n, loop_stride, input_streams)
+        result = result_cache.get(key)
+        if result is not None:
+            return result
+
+    machine = BUILTIN_MODELS[program.version]()
+    machine.load_program(program.program)
+    machine.loop_detection_stride = loop_stride
+    machine.use_decode_cache = True
+    connect_inputs(machine, input_streams=input_streams)
+    random_state = random.getstate()
+    run_result = machine.run(max_n)
+    halt_reason = str(run_result.halt_reason) if run_result.halt_reason is not None else None
+    result = (bytes(machine.mem_view), run_result.n_steps, halt_reason)
+    if result_cache is not None and random.getstate() == random_state:
+        result_cache.put(key, *result)
+    return result
 
 def trace_program(program, output_file, skip_n=0, max_n=200, trace_title="", 
-                  in_interactive_mode=False, extra_symbols=[], with_mem_dump=True):
+                  in_interactive_mode=False, extra_symbols=[], with_mem_dump=True, page_size=None, 
+                  resume_from=None, input_streams=None, loop_stride=None):
     """
     Produces a detailed trace of program execution in HTML form.
     
+    Notes:
+        * The first skip_n steps are executed without producing a trace.
+        * If loop_stride is set, the traced steps are checked for infinite loops (see Digirule.run).
+    
     :param program: A fully compiled Digirule2 binary.
     :type program: List<uint8>[256]
     :param output_file: The HTML filename.
@@ -94,127 +350,218 @@ def trace_program(program, output_file, skip_n=0, max_n=200, trace_title="",
     :param with_mem_dump: Whether to be producing a full memory dump at each time step of execution.
     :param exra_symbols: A list of symbol name, offset, length to explicitly monitor during execution
     :type extra_symbols: List<str, int, int>
+    :param page_size: Number of steps per page of the trace, or None for a single HTML file.
+    :type page_size: int (>0)
+    :param resume_from: The filename of a binary trace of program to restore the VM at skip_n from.
+    :type resume_from: str
+    :param input_streams: The values each input of the VM returns, by input name (see read_input_streams).
+    :type input_streams: dict<str:list<int>>
+    :param loop_stride: Number of steps between checks for infinite loops, or None to run up to max_n.
+    :type loop_stride: int
+    :returns: A Digirule2 object at its final state when the last command was executed, the number of steps it 
+              has executed and the reason it halted (or None).
+    :rtype: tuple<Digirule, int, DgtoolsError>
+    """
+    machine, n, halt_reason = start_program(program, skip_n, max_n, in_interactive_mode, resume_from, input_streams)
+        
+    with Output_Trace_HTML(output_file, trace_title=trace_title, with_mem_dump=with_mem_dump, 
+                           extra_symbols=extra_symbols, page_size=page_size, 
+                           source_map=program.source_map) as trace:
+        def traced_run(max_steps):
+            # Executes up to max_steps steps, one at a time, writing each of them to the trace.
+            nonlocal n
+            for a_step in range(max_steps):
+                trace.write_step(n, machine)
+                n += 1
+                try:
+                    machine._exec_next()
+                except DgtoolsError as de:
+                    return DigiruleRunResult(a_step + 1, de, machine._pc)
+            return DigiruleRunResult(max_steps, None, machine._pc)
+        
+        if halt_reason is None:
+            machine.loop_detection_stride = loop_stride
+            halt_reason = machine.run(max_n - n, run_steps=traced_run).halt_reason
+        # The program terminated for a reason at this point. Mention it
+        if halt_reason is not None:
+            trace.write_halt(n-1, halt_message(program, machine, halt_reason))
+        else:
+            trace.write_halt(n-1, f"Program exceeded max_n of {max_n}")
+    return machine, n, halt_reason
+
+def record_program(program, output_file, skip_n=0, max_n=200, trace_title="", in_interactive_mode=False, 
+                   keyframe_interval=256, resume_from=None, input_streams=None):
+    """
+    Records program execution to a binary (.dgt) trace.
+    
+    Notes:
+        * The first skip_n steps are executed without being recorded.
+        * The state after the last executed step is recorded too, the trace holds one more state than the steps 
+          it traces.
+    
+    :param program: A fully compiled Digirule2 binary.
+    :type program: DGB_Archive
+    :param output_file: The .dgt filename.
+    :type output_file: str
+    :param skip_n: Number of execution steps to omit recording.
+    :type skip_n: int (>0)
+    :param max_n: Maximum number of steps to allow the VM to run for.
+    :type max_n: int (>0)
+    :param trace_title: A very simple title for the trace.
+    :type trace_title: str
+    :param in_interactive_mode: Whether to execute the program in interactive mode.
+    :type in_interactive_mode: bool
+    :param keyframe_interval: Number of steps between two complete memory snapshots in the trace.
+    :type keyframe_interval: int (>0)
+    :param resume_from: The filename of a binary trace of program to restore the VM at skip_n from.
+    :type resume_from: str
+    :param input_streams: The values each input of the VM returns, by input name (see read_input_streams).
+    :type input_streams: dict<str:list<int>>
     :returns: A Digirule2 object at its final state when the last command was executed.
     :rtype: Digirule
     """
-    # Setup the VM
-    machine = BUILTIN_MODELS[program.version]()
-    machine.load_program(program.program)
-    
-    if in_interactive_mode:
-        machine.set_default_callbacks()
-        
-    done = False
-    n=0
-    # Headings for the memory space dump
-    mem_space_heading_h = ["Offset (h)"]+[f"{x:02X}" for x in range(0,16)]
-    mem_space_heading_v = [f"{x:02X}" for x in range(0,256,16)]
-    # This function could simply be returning a data structure with all data required by a template to produce the 
-    # actual output. But that would increase dependencies and possibly required memory too. This is why the file is 
-    # created here on the fly.
-    with Output_Render_HTML(output_file) as dgen:
-        dgen.open_tag("article")
-        dgen.open_tag("header")
-        dgen.heading(f"Program Trace {trace_title}", 1)
-        dgen.close_tag("header")
-        while not done and n<max_n:
-            if n>=skip_n:
-                # Machine registers
-                dgen.open_tag("section")
-                dgen.named_anchor(f"n{n}")
-                dgen.open_tag("header")
-                dgen.heading(f"Machine State at n={n}",2)
-                dgen.close_tag("header")
-                
-                dgen.open_tag("section")
-                dgen.open_tag("header")
-                dgen.heading(f"Machine Registers",3)
-                dgen.close_tag("header")
-                dgen.table_h(["Program Counter:","Accumulator:", "Status Reg:","Button Register:", "Addr.Led Register:",
-                              "Data Led Register:", "Speed setting:", "Program counter stack:"],
-                             [[f"0x{machine._pc:02X}"], 
-                              [machine._acc],
-                              [machine._mem[machine._status_reg_ptr]], 
-                              [machine._mem[machine._bt_reg_ptr]], 
-                              [machine._mem[machine._addrled_reg_ptr]], 
-                              [machine._mem[machine._dataled_reg_ptr]], 
-                              [machine._speed_setting], 
-                              # [machine._ppc]],
-                              [",".join(list(map(lambda x:f"0x{x:02X}",machine._ppc)))]],
-                              attrs={"class":"table_machine_state"})
-                dgen.close_tag("section")
-                
-                # Memory space
-                if with_mem_dump:
-                    dgen.open_tag("section")
-                    dgen.open_tag("header")
-                    dgen.heading(f"Full memory dump:",3)
-                    dgen.close_tag("header")
-                    dgen.table_hv([[f"{machine._mem[n]:02X}" for n in range(m,m+16)] for m in range(0,256,16)],
-                                  mem_space_heading_h, 
-                                  mem_space_heading_v,
-                                  attrs={"class":"table_memory_space"},
-                                  cell_attrs={(machine._pc // 16,machine._pc-(machine._pc // 16)):{"class":"current_pc"}})
-                    dgen.close_tag("section")
-                
-                # Extra symbols
-                if len(extra_symbols):
-                    dgen.open_tag("section")
-                    dgen.open_tag("header")
-                    dgen.heading(f"Specific Symbols",3)
-                    dgen.close_tag("header")
-                    
-                    # symbol_names = list(map(lambda x:x[0],extra_symbols))
-                    
-                    symbol_values = []
-                    for a_symbol in extra_symbols:
-                        raw_bytes = machine._mem[a_symbol[1]:(a_symbol[1]+a_symbol[2])]
-                        if len(raw_bytes)>1:
-                            chr_bytes = "".join(map(lambda x:chr(x), raw_bytes))
-                        else:
-                            chr_bytes = ""
-                        symbol_values.append([str(raw_bytes),chr_bytes])
-                    # dgen.table_h(symbol_names,symbol_values, attrs={"class":"table_spec_sym"})
-                    dgen.table_v(["Symbol","Offset","Value(s)", "Value as string"],
-                                 list(map(lambda x:[x[0][0],
-                                                    f"0x{x[0][1]:02X}",
-                                                    x[1][0],x[1][1]],
-                                          zip(extra_symbols,symbol_values))), 
-                                 attrs={"class":"table_spec_sym"})
-                    dgen.close_tag("section")
-                
-                # Onboard IO
-                dgen.open_tag("section")
-                dgen.open_tag("header")
-                dgen.heading("Onboard I/O",3)
-                dgen.close_tag("header")
-                dgen.table_h(["Address LEDs","Data LEDs","Button Switches"],
-                             [machine.addr_led, machine.data_led, machine.button_sw],
-                             attrs={"class":"table_onboard_io"})
-                dgen.close_tag("section")
-                
-                dgen.close_tag("section")
-                dgen.ruler()
+    machine, n, halt_reason = start_program(program, skip_n, max_n, in_interactive_mode, resume_from, input_streams)
+    with DGT_TraceWriter(output_file, model=program.version, keyframe_interval=keyframe_interval, first_step=n, 
+                         labels=program.labels, title=trace_title, 
+                         program_digest=hashlib.sha1(program.program_view).hexdigest()) as trace:
+        while halt_reason is None and n<max_n:
+            trace.write_state(machine)
             try:
                 machine._exec_next()
             except DgtoolsError as de:
-                done = True
                 halt_reason = de
-                
             n+=1
-        # The program terminated for a reason at this point. Mention it
-        dgen.open_tag("section", {"class":"program_halt"})
-        dgen.named_anchor(f"program_halt")
-        dgen.open_tag("header")
-        dgen.heading(f"Program stopped at n={n-1}",2)
-        dgen.close_tag("header")
-        if done:
-            dgen._write_tag("p", str(halt_reason))
-        else:
-            dgen._write_tag("p", f"Program exceeded max_n of {max_n}")
-        dgen.close_tag("section")
+        trace.write_state(machine)
+        if halt_reason is not None:
+            trace.write_halt(halt_message(program, machine, halt_reason))
+    return machine
+    
+def cover_program(program, max_n=200, in_interactive_mode=False, input_streams=None):
+    """
+    Executes a program, recording how each byte of memory is used.
+    
+    Notes:
+        * A byte is executed (as an opcode), fetched as an operand of an executed instruction, read as data or 
+          written. Each is counted separately, per address.
+        * Accesses to the status register that instructions make to update their flags are not counted.
+    
+    :param program: A fully compiled Digirule2 binary.
+    :type program: DGB_Archive
+    :param max_n: Maximum number of steps to allow the VM to run for.
+    :type max_n: int (>0)
+    :param in_interactive_mode: Whether to execute the program in interactive mode.
+    :type in_interactive_mode: bool
+    :param input_streams: The values each input of the VM returns, by input name (see read_input_streams).
+    :type input_streams: dict<str:list<int>>
+    :returns: A Digirule2 object at its final state when the last command was executed and the coverage (a 
+              dictionary with the number of steps, the halt reason and the counts per address).
+    :rtype: tuple<Digirule, dict>
+    """
+    machine = BUILTIN_MODELS[program.version]()
+    machine.load_program(program.program)
+    
+    connect_inputs(machine, in_interactive_mode, input_streams)
         
-        dgen.close_tag("article")
+    executed = [0] * 256
+    operand = [0] * 256
+    read = [0] * 256
+    written = [0] * 256
+    # Instruction handlers access memory through _rd_mem / _wr_mem, these are counted on this VM only.
+    rd_mem = machine._rd_mem
+    wr_mem = machine._wr_mem
+    def counting_rd_mem(addr):
+        read[addr & 0xFF] += 1
+        return rd_mem(addr)
+    def counting_wr_mem(addr, value):
+        written[addr & 0xFF] += 1
+        return wr_mem(addr, value)
+    machine._rd_mem = counting_rd_mem
+    machine._wr_mem = counting_wr_mem
+    
+    # Instructions are fetched here rather than through _exec_next, so that fetches are not counted as reads.
+    mem = machine.mem_view
+    ins_lookup = machine._ins_lookup
+    n = 0
+    halt_reason = None
+    while n < max_n:
+        pc = machine._pc
+        n += 1
+        executed[pc] += 1
+        try:
+            try:
+                handler, num_operands = ins_lookup[mem[pc]]
+            except KeyError:
+                machine._pc = pc + 1
+                raise DgtoolsErrorOpcodeNotSupported(f"Opcode {mem[pc]} not understood")
+            for an_addr in range(pc + 1, pc + 1 + num_operands):
+                operand[an_addr] += 1
+            machine._pc = pc + 1 + num_operands
+            handler(*mem[(pc + 1):(pc + 1 + num_operands)])
+        except DgtoolsError as de:
+            halt_reason = de
+            break
+            
+    del machine._rd_mem
+    del machine._wr_mem
+    return machine, {"model":program.version, 
+                     "program":list(program.program), 
+                     "labels":dict(program.labels),
+                     "n_steps":n, 
+                     "halt_reason":halt_message(program, machine, halt_reason) if halt_reason is not None else None,
+                     "executed":executed, 
+                     "operand":operand, 
+                     "read":read, 
+                     "written":written,
+                     # Bytes of the program that were neither executed nor accessed
+                     "unused":[an_addr for an_addr in range(len(program.program)) 
+                               if executed[an_addr] + operand[an_addr] + read[an_addr] + written[an_addr] == 0]}
+    
+def render_trace(input_file, output_file, skip_n=0, max_n=200, trace_title=None, extra_symbols=[], 
+                 with_mem_dump=True, page_size=None):
+    """
+    Renders a binary (.dgt) trace to HTML.
+    
+    Notes:
+        * The HTML is the same as the one trace_program produces for the same program and parameters.
+    
+    :param input_file: The .dgt filename.
+    :type input_file: str
+    :param output_file: The HTML filename.
+    :type output_file: str
+    :param skip_n: Number of execution steps to omit producing a report on.
+    :type skip_n: int (>0)
+    :param max_n: Maximum number of steps to render.
+    :type max_n: int (>0)
+    :param trace_title: A title for the trace, or None for the title the trace was recorded with.
+    :type trace_title: str
+    :param extra_symbols: A list of symbol name, offset, length to explicitly monitor during execution
+    :type extra_symbols: List<str, int, int>
+    :param with_mem_dump: Whether to be producing a full memory dump at each time step of execution.
+    :type with_mem_dump: bool
+    :param page_size: Number of steps per page of the trace, or None for a single HTML file.
+    :type page_size: int (>0)
+    :returns: A Digirule2 object at its state after the last rendered step.
+    :rtype: Digirule
+    """
+    with DGT_TraceReader(input_file) as dgt_trace:
+        machine = BUILTIN_MODELS[dgt_trace.model]()
+        last_step = dgt_trace.first_step + dgt_trace.n_states - 1
+        first_step = min(max(skip_n, dgt_trace.first_step), last_step)
+        end_step = max(first_step, min(last_step, max_n))
+        halt_reason = dgt_trace.halt_reason if end_step == last_step else None
+        if trace_title is None:
+            trace_title = dgt_trace.title
+        with Output_Trace_HTML(output_file, trace_title=trace_title, with_mem_dump=with_mem_dump, 
+                               extra_symbols=extra_symbols, page_size=page_size) as trace:
+            for a_state in dgt_trace.iter_states(first_step):
+                state_to_machine(a_state, machine)
+                if a_state.step == end_step:
+                    break
+                trace.write_step(a_state.step, machine)
+            if halt_reason is not None:
+                trace.write_halt(end_step-1, halt_reason)
+            else:
+                trace.write_halt(end_step-1, f"Program exceeded max_n of {max_n}")
     return machine
 
 def validate_trace_symbol(ctx, param, value):
@@ -254,7 +601,7 @@ def validate_trace_symbol(ctx, param, value):
 @click.command()
 @click.argument("input-file", type=click.Path(exists=True))
 @click.option("--output-trace_file","-otf", type=click.Path(), 
-              help="Filename containing trace information in HTML.")
+              help="Filename containing trace information in HTML (or binary, see --trace-format).")
 @click.option("--output-memdump_file", "-omf", type=click.Path(), 
               help="Filename containing final memory space.")
 @click.option("--title","-t", type=str, 
@@ -276,12 +623,43 @@ def validate_trace_symbol(ctx, param, value):
                    "will be executed and the HTML report will start at n=10")
 @click.option("--max-n","-mn", type=int, default=200, 
               help="Maximum number of time steps to allow the sim to run for.")
+@click.option("--page-size", "-ps", type=click.IntRange(min=1), 
+              help="Number of time steps per page of the trace. If set, the trace file becomes an index of the pages.")
+@click.option("--trace-format", "-tf", type=click.Choice(["html", "dgt", "none"]), default="html", 
+              help="Whether to produce an HTML trace or record a binary (.dgt) trace that can be rendered later. "
+                   "With none, only the memdump is produced.")
+@click.option("--keyframe-interval", "-ki", type=click.IntRange(min=1), default=256, 
+              help="Number of time steps between two complete memory snapshots of a binary trace.")
+@click.option("--resume-from", "-rf", type=click.Path(exists=True, dir_okay=False), 
+              help="A binary (.dgt) trace of the same program. The simulation is restored from the recorded state "
+                   "nearest to --skip-n (--max-n with --trace-format none), instead of executing every step up to it.")
+@click.option("--coverage-file", "-cov", type=click.Path(dir_okay=False), 
+              help="Instead of a trace, produce a JSON file with the number of times each address was executed, "
+                   "fetched as an operand, read and written (see dgform.py to annotate the source with it).")
+@click.option("--cache-dir", "-cd", type=click.Path(file_okay=False), envvar="DGTOOLS_CACHE_DIR", 
+              help="Directory of a cache of simulation results. With --trace-format none, programs that have been run "
+                   "before (same image, same --max-n, same inputs) are not simulated again.")
+@click.option("--result-store", "-rs", type=click.Path(dir_okay=False), envvar="DGTOOLS_RESULT_STORE", 
+              help="An SQLite file of simulation results, used like --cache-dir (and instead of it) but kept to "
+                   "--result-store-size results, evicting the least recently used ones.")
+@click.option("--result-store-size", "-rss", type=click.IntRange(min=1), default=4096, 
+              help="Maximum number of results to keep in the result store.")
+@click.option("--input-streams", "-is", "input_streams_file", type=click.Path(exists=True, dir_okay=False), 
+              help="A JSON file with the values to feed the inputs of the Digirule with (button, comin, pin_in), "
+                   "instead of prompting for them in interactive mode.")
+@click.option("--record-inputs", "-ri", "record_inputs_file", type=click.Path(dir_okay=False), 
+              help="In interactive mode, write the values that were entered to a JSON file that can be used as "
+                   "--input-streams.")
 @click.option("--theme",type=str, help="Specifies the CSS theme to use (plain OR dgbeos)")
 def dgsim(input_file, output_trace_file, output_memdump_file, title, 
-          with_dump, interactive_mode, trace_symbol, skip_n, max_n, theme):
+          with_dump, interactive_mode, trace_symbol, skip_n, max_n, page_size, trace_format, keyframe_interval, 
+          resume_from, coverage_file, cache_dir, result_store, result_store_size, input_streams_file, 
+          record_inputs_file, theme):
     """
     Command line program that produces a trace of a Digirule2 binary on simulated hardware.
     
+    INPUT_FILE can also be a binary trace (.dgt), which is then rendered to HTML.
+    
     \f
     :param input_file: The `.dgb` file to simulate.
     :type input_file: str<Path>
@@ -301,17 +679,55 @@ def dgsim(input_file, output_trace_file, output_memdump_file, title,
     :type max_n:int
     :param skip_n:
     :type skip_n:
+    :param page_size: The number of timesteps per page of the trace.
+    :type page_size: int
+    :param trace_format: The format of the trace (html, dgt or none).
+    :type trace_format: str
+    :param keyframe_interval: The number of timesteps between complete memory snapshots of a binary trace.
+    :type keyframe_interval: int
+    :param resume_from: The filename of a binary trace to restore the simulation at skip_n from.
+    :type resume_from: str<Path>
+    :param coverage_file: The filename of the JSON coverage of the program.
+    :type coverage_file: str<Path>
+    :param cache_dir: The directory of the result cache.
+    :type cache_dir: str<Path>
+    :param result_store: The SQLite file of the result store (takes precedence over cache_dir).
+    :type result_store: str<Path>
+    :param result_store_size: The maximum number of results in the result store.
+    :type result_store_size: int
+    :param input_streams_file: The JSON file of the values to feed the inputs of the VM with.
+    :type input_streams_file: str<Path>
+    :param record_inputs_file: The JSON file to record the values entered in interactive mode to.
+    :type record_inputs_file: str<Path>
     :param theme: A theme to apply to the output. Must be installed under [package]/css_data
     :type theme: str(path)
     """
+    from_dgt = os.path.splitext(input_file)[1] == ".dgt"
+    if from_dgt:
+        trace_format = "html"
+        
     if output_trace_file is None:
-        output_trace_file = f"{os.path.splitext(input_file)[0]}_trace.html"
+        output_trace_file = f"{os.path.splitext(input_file)[0]}_trace.{trace_format}"
     
     if output_memdump_file is None:
         output_memdump_file = f"{os.path.splitext(input_file)[0]}_memdump.dgb"
         
     try:
-        compiled_program = DGB_Archive.load(input_file)       
+        input_streams = None
+        if input_streams_file is not None:
+            if interactive_mode:
+                raise DgtoolsError("--input-streams cannot be combined with --interactive-mode.")
+            input_streams = read_input_streams(input_streams_file)
+        if record_inputs_file is not None and not interactive_mode:
+            raise DgtoolsError("--record-inputs requires --interactive-mode.")
+        if trace_format == "none" and skip_n > 0:
+            raise DgtoolsError("--skip-n requires a trace, it cannot be combined with --trace-format none.")
+            
+        if from_dgt:
+            with DGT_TraceReader(input_file) as dgt_trace:
+                compiled_program = DGB_Archive([0]*256, dgt_trace.labels, version=dgt_trace.model)
+        else:
+            compiled_program = DGB_Archive.load(input_file)       
 
         symbols_to_trace = list(map(lambda x:x.split(":"), trace_symbol))
         # Validate trace_symbol if any
@@ -333,17 +749,73 @@ def dgsim(input_file, output_trace_file, output_memdump_file, title,
                         list(map(lambda x:(x[0],compiled_program.labels[x[0]], int(x[1])), 
                                  filter(lambda x:len(x)==3, symbols_to_trace)))
                                  
-        machine_after_execution = trace_program(compiled_program, 
-                                                output_trace_file,
-                                                skip_n = skip_n, 
-                                                max_n = max_n, 
-                                                trace_title = title, 
-                                                in_interactive_mode=interactive_mode, 
-                                                with_mem_dump=with_dump, 
-                                                extra_symbols=extra_symbols)
+        if coverage_file is not None:
+            if from_dgt:
+                raise DgtoolsError("Coverage is produced by simulating a .dgb file.")
+            machine_after_execution, coverage = cover_program(compiled_program, 
+                                                              max_n=max_n, 
+                                                              in_interactive_mode=interactive_mode, 
+                                                              input_streams=input_streams)
+            with open(coverage_file, "wt") as fd:
+                json.dump(coverage, fd)
+        elif from_dgt:
+            machine_after_execution = render_trace(input_file, 
+                                                   output_trace_file, 
+                                                   skip_n=skip_n, 
+                                                   max_n=max_n, 
+                                                   trace_title=title or None, 
+                                                   extra_symbols=extra_symbols, 
+                                                   with_mem_dump=with_dump, 
+                                                   page_size=page_size)
+        elif trace_format == "dgt":
+            machine_after_execution = record_program(compiled_program, 
+                                                     output_trace_file, 
+                                                     skip_n=skip_n, 
+                                                     max_n=max_n, 
+                                                     trace_title=title, 
+                                                     in_interactive_mode=interactive_mode, 
+                                                     keyframe_interval=keyframe_interval, 
+                                                     resume_from=resume_from, 
+                                                     input_streams=input_streams)
+        elif trace_format == "none" and not interactive_mode and resume_from is None:
+            # Only the final memory is needed, it might come from earlier results rather than a VM.
+            machine_after_execution = None
+            result_cache = None
+            if result_store is not None:
+                result_cache = DGB_ResultStore(result_store, result_store_size)
+            elif cache_dir is not None:
+                result_cache = DGB_ResultCache(cache_dir)
+            try:
+                final_memory, n_steps, halt_reason = run_program(compiled_program, 
+                                                                 max_n=max_n, 
+                                                                 input_streams=input_streams, 
+                                                                 result_cache=result_cache)
+            finally:
+                if result_cache is not None:
+                    result_cache.close()
+        elif trace_format == "none":
+            # Interactive runs cannot be looked up, their inputs are only known as they are entered. Runs that 
+            # resume from a binary trace start from its state nearest to max_n.
+            machine_after_execution = start_program(compiled_program, max_n, max_n, interactive_mode, resume_from, 
+                                                    input_streams)[0]
+        else:
+            machine_after_execution = trace_program(compiled_program, 
+                                                    output_trace_file,
+                                                    skip_n = skip_n, 
+                                                    max_n = max_n, 
+                                                    trace_title = title, 
+                                                    in_interactive_mode=interactive_mode, 
+                                                    with_mem_dump=with_dump, 
+                                                    extra_symbols=extra_symbols,
+                                                    page_size=page_size, 
+                                                    resume_from=resume_from, 
+                                                    input_streams=input_streams)[0]
                                                 
-        machine_after_execution_archive = DGB_Archive(machine_after_execution._mem, 
-                                                      compiled_program.labels, version=compiled_program.version)
+        if machine_after_execution is not None:
+            final_memory = machine_after_execution.mem_view
+            if record_inputs_file is not None:
+                record_inputs(machine_after_execution, record_inputs_file)
+        machine_after_execution_archive = compiled_program.with_program(final_memory)
         
         machine_after_execution_archive.save(output_memdump_file)
     
@@ -0,0 +1,598 @@
+"""
+
+Binary traces of Digirule program execution (.dgt).
+
+A trace records the state of a machine before every step of execution. Every state is stored as the difference
+from the previous one (pc, acc, status, opcode and only the memory bytes that changed), except for every K-th state,
+that is stored in full (a keyframe). A footer lists the offsets of all keyframes, so that any state can be
+reconstructed by seeking to the nearest keyframe and replaying the differences that follow it.
+
+Layout (little endian):
+
+* Header: ``DGT1``, version (uint8), keyframe interval (uint32), first step (uint64), length of metadata (uint32)
+  and metadata (JSON with the model, labels and title of the trace and the SHA1 of the traced program).
+* Records, each starting with a one byte tag:
+    * ``K`` (keyframe): pc (uint16), acc, opcode, speed (uint8), stack depth (uint16), stack (uint16 each),
+      memory (256 bytes).
+    * ``D`` (difference): pc (uint16), acc, status, opcode, flags (uint8), speed (uint8, if flags bit 0),
+      stack depth (uint16), number of pushed values (uint8) and pushed values (uint16 each) (if flags bit 1),
+      number of memory changes (uint16) and (address, value) pairs (uint8 each).
+    * ``H`` (halt): length (uint16) and reason (UTF-8).
+* Footer: ``F``, number of states (uint64), number of keyframes (uint32), keyframe offsets (uint64 each), followed
+  by the offset of the footer (uint64) and ``DGTE``.
+
+A trace can be accompanied by an index (.dgti), stored alongside it, that maps every step to the offset of its record.
+The index is also what makes a trace that was not closed properly (no footer) usable without scanning it:
+
+* ``DGTI``, version (uint8), size of the trace when the index was written (uint64), first step (uint64),
+  keyframe interval (uint32), number of states (uint64) and record offsets (uint64 each).
+
+:author: Athanasios Anastasiou
+:date: Oct 2026
+"""
+import array
+import collections
+import json
+import os
+import struct
+import sys
+from .digirule import Digirule, Digirule2U
+from .exceptions import DgtoolsErrorDgtTraceCorrupted
+
+DGT_MAGIC = b"DGT1"
+DGT_END_MAGIC = b"DGTE"
+DGT_VERSION = 1
+
+_HEADER = struct.Struct("<4sBIQI")
+_KEYFRAME = struct.Struct("<HBBBH")
+_DELTA = struct.Struct("<HBBBB")
+_STACK_DELTA = struct.Struct("<HB")
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_FOOTER = struct.Struct("<QI")
+_FOOTER_END = struct.Struct("<Q4s")
+_INDEX_HEADER = struct.Struct("<4sBQQIQ")
+
+DGT_INDEX_MAGIC = b"DGTI"
+
+_TAG_KEYFRAME = b"K"
+_TAG_DELTA = b"D"
+_TAG_HALT = b"H"
+_TAG_FOOTER = b"F"
+
+_DELTA_SPEED = 1
+_DELTA_STACK = 2
+
+# The state of a machine before a given step
+DGT_State = collections.namedtuple("DGT_State", ["step", "pc", "acc", "status", "opcode", "speed", "ppc", "mem"])
+
+DGT_MODELS = {"2A":Digirule, "2U":Digirule2U}
+
+
+def index_filename(trace_filename):
+    """
+    Returns the filename of the index of a trace (e.g. run.dgt -> run.dgti).
+    """
+    return f"{trace_filename}i" if str(trace_filename).endswith(".dgt") else f"{trace_filename}.dgti"
+
+
+def machine_state(step, machine):
+    """
+    Returns the state of a machine as a DGT_State.
+
+    :param step: The step the machine is at.
+    :type step: int
+    :param machine: The machine
+    :type machine: Digirule
+    :rtype: DGT_State
+    """
+    mem = bytes(machine.mem_view)
+    pc = machine._pc
+    return DGT_State(step, pc, machine._acc, mem[machine._status_reg_ptr], mem[pc] if pc < 256 else 0,
+                     machine._speed_setting, tuple(machine._ppc), mem)
+
+
+class DGT_TraceWriter:
+    """
+    Writes the consecutive states of a machine to a binary trace.
+    """
+    def __init__(self, filename, model="2A", keyframe_interval=1024, first_step=0, labels=None, title="", 
+                 with_index=True, program_digest=None):
+        """
+        Initialisation
+
+        :param filename: The .dgt file to write.
+        :type filename: str<Path>
+        :param model: The model of the traced machine.
+        :type model: str
+        :param keyframe_interval: Number of steps between two full states.
+        :type keyframe_interval: int
+        :param first_step: The step of the first state that will be written.
+        :type first_step: int
+        :param labels: Lookup of labels and their offsets within the memory space.
+        :type labels: dict<str:int>
+        :param title: A title for the trace.
+        :type title: str
+        :param with_index: Whether to write the index of the trace alongside it.
+        :type with_index: bool
+        :param program_digest: The SHA1 of the traced program (before step 0), if known.
+        :type program_digest: str
+        """
+        if type(keyframe_interval) is not int or keyframe_interval < 1:
+            raise ValueError(f"Expected keyframe_interval as int>0, received {keyframe_interval}")
+        self._filename = filename
+        self._model = model
+        self._keyframe_interval = keyframe_interval
+        self._first_step = first_step
+        self._metadata = {"model":model, "labels":dict(labels or {}), "title":title, "program_digest":program_digest}
+        self._fd = None
+        self._n_states = 0
+        self._keyframe_offsets = []
+        self._offsets = array.array("Q") if with_index else None
+        self._previous = None
+
+    def __enter__(self):
+        self._fd = open(self._filename, "wb", buffering=1 << 20)
+        metadata = json.dumps(self._metadata).encode("utf-8")
+        self._fd.write(_HEADER.pack(DGT_MAGIC, DGT_VERSION, self._keyframe_interval, self._first_step, len(metadata)))
+        self._fd.write(metadata)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        footer_offset = self._fd.tell()
+        self._fd.write(_TAG_FOOTER)
+        self._fd.write(_FOOTER.pack(self._n_states, len(self._keyframe_offsets)))
+        self._fd.write(struct.pack(f"<{len(self._keyframe_offsets)}Q", *self._keyframe_offsets))
+        self._fd.write(_FOOTER_END.pack(footer_offset, DGT_END_MAGIC))
+        trace_size = self._fd.tell()
+        self._fd.close()
+        self._fd = None
+        if self._offsets is not None:
+            DGT_TraceIndex(trace_size, self._first_step, self._keyframe_interval, 
+                           self._offsets).save(index_filename(self._filename))
+
+    @property
+    def n_states(self):
+        return self._n_states
+
+    def write_state(self, machine):
+        """
+        Writes the state of machine as the next step of the trace.
+
+        :param machine: The machine.
+        :type machine: Digirule
+        :returns: The offset of the record in the file.
+        :rtype: int
+        """
+        state = machine_state(self._first_step + self._n_states, machine)
+        offset = self._fd.tell()
+        if self._offsets is not None:
+            self._offsets.append(offset)
+        if self._n_states % self._keyframe_interval == 0:
+            self._keyframe_offsets.append(offset)
+            self._fd.write(_TAG_KEYFRAME)
+            self._fd.write(_KEYFRAME.pack(state.pc, state.acc, state.opcode, state.speed, len(state.ppc)))
+            self._fd.write(struct.pack(f"<{len(state.ppc)}H", *state.ppc))
+            self._fd.write(state.mem)
+        else:
+            self._write_delta(self._previous, state)
+        self._previous = state
+        self._n_states += 1
+        return offset
+
+    def _write_delta(self, previous, state):
+        flags = 0
+        payload = []
+        if state.speed != previous.speed:
+            flags |= _DELTA_SPEED
+            payload.append(_U8.pack(state.speed))
+        if state.ppc != previous.ppc:
+            # Instructions only ever change the top of the stack (or clear it).
+            common = min(len(previous.ppc), len(state.ppc))
+            while common > 0 and previous.ppc[common - 1] != state.ppc[common - 1]:
+                common -= 1
+            pushed = state.ppc[common:]
+            flags |= _DELTA_STACK
+            payload.append(_STACK_DELTA.pack(len(state.ppc), len(pushed)))
+            payload.append(struct.pack(f"<{len(pushed)}H", *pushed))
+        # The status register is stored separately, everything else as (address, value) pairs.
+        changed = []
+        mem_xor = int.from_bytes(state.mem, "little") ^ int.from_bytes(previous.mem, "little")
+        mem_xor &= ~(0xFF << (8 * 252))
+        while mem_xor:
+            addr = ((mem_xor & -mem_xor).bit_length() - 1) >> 3
+            changed.append(addr)
+            changed.append(state.mem[addr])
+            mem_xor &= ~(0xFF << (8 * addr))
+        self._fd.write(_TAG_DELTA)
+        self._fd.write(_DELTA.pack(state.pc, state.acc, state.status, state.opcode, flags))
+        self._fd.write(b"".join(payload))
+        self._fd.write(_U16.pack(len(changed) // 2))
+        self._fd.write(bytes(changed))
+
+    def write_halt(self, reason):
+        """
+        Records the reason the program stopped.
+
+        :param reason: A human readable reason.
+        :type reason: str
+        """
+        reason = reason.encode("utf-8")[:0xFFFF]
+        self._fd.write(_TAG_HALT)
+        self._fd.write(_U16.pack(len(reason)))
+        self._fd.write(reason)
+        return self
+
+
+class DGT_TraceReader:
+    """
+    Reads a binary trace and reconstructs the state of the machine at any step.
+
+    Notes:
+        * The state at a step is reconstructed from the nearest keyframe before it.
+        * The index of the trace is used if it exists and is up to date, otherwise the footer of the trace.
+        * A trace that was not closed properly (no footer) and has no index is scanned once, to find its records.
+    """
+    def __init__(self, filename, use_index=True):
+        """
+        Initialisation
+
+        :param filename: The .dgt file to read.
+        :type filename: str<Path>
+        :param use_index: Whether to use the index of the trace (if it exists).
+        :type use_index: bool
+        """
+        self._filename = filename
+        self._fd = open(filename, "rb")
+        try:
+            header = self._fd.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise DgtoolsErrorDgtTraceCorrupted("DGT trace corrupted.")
+            magic, version, self._keyframe_interval, self._first_step, metadata_len = _HEADER.unpack(header)
+            if magic != DGT_MAGIC or version != DGT_VERSION or self._keyframe_interval < 1:
+                raise DgtoolsErrorDgtTraceCorrupted("DGT trace corrupted.")
+            metadata = self._fd.read(metadata_len)
+            if len(metadata) != metadata_len:
+                raise DgtoolsErrorDgtTraceCorrupted("DGT trace truncated.")
+            try:
+                self._metadata = json.loads(metadata.decode("utf-8"))
+            except ValueError:
+                raise DgtoolsErrorDgtTraceCorrupted("DGT trace corrupted.")
+            self._records_offset = self._fd.tell()
+            self._halt_reason = None
+            self._offsets = None
+            if not (use_index and self._read_index()) and not self._read_footer():
+                self._scan()
+        except Exception:
+            self._fd.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        self._fd.close()
+
+    @property
+    def model(self):
+        return self._metadata["model"]
+
+    @property
+    def labels(self):
+        return self._metadata["labels"]
+
+    @property
+    def title(self):
+        return self._metadata["title"]
+
+    @property
+    def program_digest(self):
+        return self._metadata.get("program_digest")
+
+    @property
+    def keyframe_interval(self):
+        return self._keyframe_interval
+
+    @property
+    def first_step(self):
+        return self._first_step
+
+    @property
+    def n_states(self):
+        return self._n_states
+
+    @property
+    def halt_reason(self):
+        """
+        The reason the program stopped, or None if it was still running at the end of the trace.
+        """
+        return self._halt_reason
+
+    def _read_footer(self):
+        self._fd.seek(0, 2)
+        file_size = self._fd.tell()
+        if file_size < self._records_offset + _FOOTER_END.size:
+            return False
+        self._fd.seek(file_size - _FOOTER_END.size)
+        footer_offset, end_magic = _FOOTER_END.unpack(self._fd.read(_FOOTER_END.size))
+        if end_magic != DGT_END_MAGIC or footer_offset < self._records_offset:
+            return False
+        self._fd.seek(footer_offset)
+        if self._fd.read(1) != _TAG_FOOTER:
+            return False
+        self._n_states, n_keyframes = _FOOTER.unpack(self._fd.read(_FOOTER.size))
+        self._keyframe_offsets = list(struct.unpack(f"<{n_keyframes}Q", self._fd.read(8 * n_keyframes)))
+        # The halt reason (if any) is the last record before the footer
+        self._fd.seek(self._keyframe_offsets[-1] if n_keyframes else self._records_offset)
+        for a_record in self._records():
+            pass
+        return True
+
+    def _read_index(self):
+        try:
+            index = DGT_TraceIndex.load(index_filename(self._filename))
+        except (OSError, DgtoolsErrorDgtTraceCorrupted):
+            return False
+        if index.trace_size != os.path.getsize(self._filename) or index.first_step != self._first_step or \
+           index.keyframe_interval != self._keyframe_interval:
+            return False
+        self._offsets = index.offsets
+        self._n_states = len(self._offsets)
+        self._keyframe_offsets = self._offsets[::self._keyframe_interval]
+        # The halt reason (if any) is the record that follows the last state
+        if self._n_states > 0:
+            self._fd.seek(self._offsets[-1])
+            try:
+                for a_record in self._records():
+                    pass
+            except DgtoolsErrorDgtTraceCorrupted:
+                pass
+        return True
+
+    def _scan(self):
+        self._offsets = array.array("Q")
+        self._keyframe_offsets = []
+        self._fd.seek(self._records_offset)
+        offset = self._records_offset
+        try:
+            for a_tag, a_record in self._records():
+                if a_tag == _TAG_KEYFRAME:
+                    self._keyframe_offsets.append(offset)
+                if a_tag in (_TAG_KEYFRAME, _TAG_DELTA):
+                    self._offsets.append(offset)
+                offset = self._fd.tell()
+        except DgtoolsErrorDgtTraceCorrupted:
+            # The last record was not written completely, the trace ends at the one before it.
+            pass
+        self._n_states = len(self._offsets)
+
+    def index(self):
+        """
+        Returns the index of the trace.
+
+        :rtype: DGT_TraceIndex
+        """
+        if self._offsets is None:
+            self._scan()
+        return DGT_TraceIndex(os.path.getsize(self._filename), self._first_step, self._keyframe_interval, 
+                              self._offsets)
+
+    def record_offset(self, step):
+        """
+        Returns the offset of the record of a step within the trace file.
+
+        :param step: The step.
+        :type step: int
+        :rtype: int
+        """
+        if self._offsets is None:
+            self._scan()
+        index = step - self._first_step
+        if index < 0 or index >= self._n_states:
+            raise IndexError(f"Step {step} is not in the trace (steps {self._first_step}.."
+                             f"{self._first_step + self._n_states - 1})")
+        return self._offsets[index]
+
+    def _read(self, n):
+        payload = self._fd.read(n)
+        if len(payload) != n:
+            raise DgtoolsErrorDgtTraceCorrupted("DGT trace truncated.")
+        return payload
+
+    def _records(self):
+        """
+        Yields (tag, decoded record) from the current position until the footer or the end of the file.
+
+        Notes:
+            * Keyframes are decoded to (pc, acc, opcode, speed, ppc, mem), differences to
+              (pc, acc, status, opcode, speed or None, (stack depth, pushed values) or None, changed (addr, value)).
+        """
+        while True:
+            a_tag = self._fd.read(1)
+            if a_tag == _TAG_KEYFRAME:
+                pc, acc, opcode, speed, ppc_len = _KEYFRAME.unpack(self._read(_KEYFRAME.size))
+                ppc = struct.unpack(f"<{ppc_len}H", self._read(2 * ppc_len))
+                yield a_tag, (pc, acc, opcode, speed, ppc, self._read(256))
+            elif a_tag == _TAG_DELTA:
+                pc, acc, status, opcode, flags = _DELTA.unpack(self._read(_DELTA.size))
+                speed = _U8.unpack(self._read(1))[0] if flags & _DELTA_SPEED else None
+                stack = None
+                if flags & _DELTA_STACK:
+                    ppc_len, n_pushed = _STACK_DELTA.unpack(self._read(_STACK_DELTA.size))
+                    stack = (ppc_len, struct.unpack(f"<{n_pushed}H", self._read(2 * n_pushed)))
+                n_changed = _U16.unpack(self._read(2))[0]
+                yield a_tag, (pc, acc, status, opcode, speed, stack, self._read(2 * n_changed))
+            elif a_tag == _TAG_HALT:
+                reason_len = _U16.unpack(self._read(2))[0]
+                self._halt_reason = self._read(reason_len).decode("utf-8")
+                yield a_tag, self._halt_reason
+            else:
+                return
+
+    def iter_states(self, from_step=None):
+        """
+        Yields the states of the trace in order, starting from from_step.
+
+        :param from_step: The first step to return (default: the first step of the trace).
+        :type from_step: int
+        :rtype: Iterator<DGT_State>
+        """
+        if from_step is None:
+            from_step = self._first_step
+        index = from_step - self._first_step
+        if index < 0 or index >= self._n_states:
+            raise IndexError(f"Step {from_step} is not in the trace (steps {self._first_step}.."
+                             f"{self._first_step + self._n_states - 1})")
+        keyframe = min(index // self._keyframe_interval, len(self._keyframe_offsets) - 1)
+        return self._iter_states_from(self._keyframe_offsets[keyframe],
+                                      self._first_step + keyframe * self._keyframe_interval, from_step)
+
+    def _iter_states_from(self, offset, step, from_step):
+        self._fd.seek(offset)
+        mem = None
+        pc = acc = opcode = speed = 0
+        ppc = ()
+        for a_tag, a_record in self._records():
+            if a_tag == _TAG_KEYFRAME:
+                pc, acc, opcode, speed, ppc, mem = a_record
+                mem = bytearray(mem)
+            elif a_tag == _TAG_DELTA:
+                pc, acc, status, opcode, new_speed, stack, changed = a_record
+                if new_speed is not None:
+                    speed = new_speed
+                if stack is not None:
+                    ppc = ppc[:stack[0] - len(stack[1])] + stack[1]
+                mem[252] = status
+                for k in range(0, len(changed), 2):
+                    mem[changed[k]] = changed[k + 1]
+            else:
+                continue
+            if step >= from_step:
+                # Records are read ahead, so the position is restored when the state is consumed.
+                position = self._fd.tell()
+                yield DGT_State(step, pc, acc, mem[252], opcode, speed, ppc, bytes(mem))
+                self._fd.seek(position)
+            step += 1
+            if step == self._first_step + self._n_states:
+                return
+
+    def state_at(self, step):
+        """
+        Returns the state of the machine before the given step.
+
+        :param step: The step.
+        :type step: int
+        :rtype: DGT_State
+        """
+        return next(self.iter_states(step))
+
+    def machine_at(self, step):
+        """
+        Returns a machine (of the model of the trace) restored to its state before the given step.
+
+        :param step: The step.
+        :type step: int
+        :rtype: Digirule
+        """
+        return state_to_machine(self.state_at(step), DGT_MODELS[self.model]())
+
+
+def state_to_machine(state, machine):
+    """
+    Sets the state of machine to state.
+
+    :param state: The state.
+    :type state: DGT_State
+    :param machine: The machine to set.
+    :type machine: Digirule
+    :returns: machine
+    :rtype: Digirule
+    """
+    machine.load_program(state.mem)
+    machine._pc = state.pc
+    machine._acc = state.acc
+    machine._speed_setting = state.speed
+    machine._ppc = list(state.ppc)
+    return machine
+
+
+class DGT_TraceIndex:
+    """
+    The offsets of the records of every step of a trace.
+    """
+    def __init__(self, trace_size, first_step, keyframe_interval, offsets):
+        """
+        Initialisation
+
+        :param trace_size: The size of the trace file the offsets refer to.
+        :type trace_size: int
+        :param first_step: The step of the first record of the trace.
+        :type first_step: int
+        :param keyframe_interval: Number of steps between two full states.
+        :type keyframe_interval: int
+        :param offsets: The offset of the record of every step.
+        :type offsets: array<uint64>
+        """
+        self._trace_size = trace_size
+        self._first_step = first_step
+        self._keyframe_interval = keyframe_interval
+        self._offsets = offsets
+
+    @property
+    def trace_size(self):
+        return self._trace_size
+
+    @property
+    def first_step(self):
+        return self._first_step
+
+    @property
+    def keyframe_interval(self):
+        return self._keyframe_interval
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    def save(self, filename):
+        offsets = array.array("Q", self._offsets)
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        with open(filename, "wb") as fd:
+            fd.write(_INDEX_HEADER.pack(DGT_INDEX_MAGIC, DGT_VERSION, self._trace_size, self._first_step, 
+                                        self._keyframe_interval, len(offsets)))
+            offsets.tofile(fd)
+        return self
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, "rb") as fd:
+            header = fd.read(_INDEX_HEADER.size)
+            if len(header) != _INDEX_HEADER.size:
+                raise DgtoolsErrorDgtTraceCorrupted("DGT index corrupted.")
+            magic, version, trace_size, first_step, keyframe_interval, n_states = _INDEX_HEADER.unpack(header)
+            if magic != DGT_INDEX_MAGIC or version != DGT_VERSION:
+                raise DgtoolsErrorDgtTraceCorrupted("DGT index corrupted.")
+            offsets = array.array("Q")
+            try:
+                offsets.fromfile(fd, n_states)
+            except EOFError:
+                raise DgtoolsErrorDgtTraceCorrupted("DGT index corrupted.")
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        return cls(trace_size, first_step, keyframe_interval, offsets)
+
+    @classmethod
+    def build(cls, trace_filename):
+        """
+        Builds (and saves) the index of a trace by scanning it.
+
+        :param trace_filename: The .dgt file.
+        :type trace_filename: str<Path>
+        :rtype: DGT_TraceIndex
+        """
+        with DGT_TraceReader(trace_filename, use_index=False) as trace:
+            return trace.index().save(index_filename(trace_filename))
@@ -22,6 +22,9 @@ import urwid
 import click
 from dgtools import DgToolsMakefileParser
 
+# The result store of dgsim that generated Makefiles use
+DGSIM_RESULT_STORE = "dgsim_results.db"
+
 
 def get_symbols_parser():
     """
@@ -114,7 +117,8 @@ class ModalDialogBox(urwid.PopUpLauncher):
                 dsf2dgb_rule = makefile_contents[dsf2dgb_makefile_target[0]]
                 # And is there a rule that takes that dgb file and produces an HTML file?
                 dgb2html_makefile_target = list(filter(lambda x:makefile_contents[x].action["input_file"] == \
-                                                                dsf2dgb_rule.target,
+                                                                dsf2dgb_rule.target and \
+                                                                makefile_contents[x].action["trace_format"] != "none",
                                                        makefile_contents.targets))
                 if len(dgb2html_makefile_target) == 1:
                     dgb2html_rule = makefile_contents[dgb2html_makefile_target[0]]
@@ -295,20 +299,33 @@ def handle_esc(key):
         raise urwid.ExitMainLoop()
 
 
-def generate_makefile(input_dsf_file, output_dgb_file, output_trace_file, max_n, dgasm_line, dgsim_line):
+def generate_makefile(input_dsf_file, output_dgb_file, output_trace_file, max_n, dgasm_line, dgsim_line, 
+                      dgsim_memdump_line=None, input_streams_file=None):
     """
     Generates a very simple Makefile.
+
+    Notes:
+        * If dgsim_memdump_line is set, target ``memdump`` produces the final memory alone. It runs every time, but 
+          dgsim looks the result up in its result store rather than simulating a program it has run before.
+        * If input_streams_file is set, it is recorded by the trace and replayed to ``memdump``, which therefore 
+          depends on the trace.
     """
     makefile_template = f"{output_trace_file}:{output_dgb_file}\n" \
                         f"\t{dgsim_line}\n\n" \
                         f"{output_dgb_file}:{input_dsf_file}\n" \
                         f"\t{dgasm_line}\n\n" \
                         f"html:{output_trace_file}\n" \
-                        f"\txdg-open {output_trace_file}\n\n" \
-                        f"clean:\n" \
-                        f"\t rm *.dgb\n" \
-                        f"\t rm *.html\n" \
-                        f"\t rm *.css\n" 
+                        f"\txdg-open {output_trace_file}\n\n"
+    if dgsim_memdump_line is not None:
+        memdump_prerequisite = output_trace_file if input_streams_file is not None else output_dgb_file
+        makefile_template += f"memdump:{memdump_prerequisite}\n" \
+                             f"\t{dgsim_memdump_line}\n\n"
+    makefile_template += f"clean:\n" \
+                         f"\t rm *.dgb\n" \
+                         f"\t rm *.html\n" \
+                         f"\t rm *.css\n" \
+                         f"\t rm -f {DGSIM_RESULT_STORE}\n" \
+                         f"\t rm -f *_inputs.json\n"
     
     return makefile_template
     
@@ -363,8 +380,15 @@ def main(input_file, output_file):
             dgsim_params.extend(["-otf", params_dialog_box.output_trace_file])
         if len(params_dialog_box.trace_title):
             dgsim_params.extend(["-t", f"'{params_dialog_box.trace_title}'"])
+        # The final memory alone is looked up in the result store of dgsim, when the Makefile is used
+        dgsim_memdump_params = ["dgsim.py", params_dialog_box.output_file, "-mn", 
+                                str(params_dialog_box.maximum_cycles_to_run), "-tf", "none", "-rs", DGSIM_RESULT_STORE]
+        input_streams_file = None
         if params_dialog_box.in_interactive_mode:
-            dgsim_params.extend(["-I"])
+            # The inputs of the trace are recorded, to be replayed to the memdump
+            input_streams_file = f"{os.path.splitext(params_dialog_box.output_file)[0]}_inputs.json"
+            dgsim_params.extend(["-I", "-ri", input_streams_file])
+            dgsim_memdump_params.extend(["-is", input_streams_file])
         if params_dialog_box.with_mem_dump:
             dgsim_params.extend(["--with-dump"])
         if len(params_dialog_box.dgtheme)>0:
@@ -389,7 +413,9 @@ def main(input_file, output_file):
                                                    params_dialog_box.output_trace_file,
                                                    params_dialog_box.maximum_cycles_to_run,
                                                    " ".join(dgasm_params),
-                                                   " ".join(dgsim_params)))
+                                                   " ".join(dgsim_params), 
+                                                   " ".join(dgsim_memdump_params),
+                                                   input_streams_file))
     else:
         sys.stdout.write("Compilation canceled\n")
         sys.exit(1)
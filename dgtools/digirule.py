@@ -5,12 +5,21 @@ Built-in Digirule models supported by dgtools.
 :author: Athanasios Anastasiou
 :date: Mar 2020
 """
-from .exceptions import (DgtoolsErrorOpcodeNotSupported, DgtoolsErrorProgramHalt, DgtoolsErrorOutOfMemory,
-                         DgtoolsErrorStackUnderflow)
-from .callbacks import (DigiruleCallbackInputBase, DigiruleCallbackInputUserInteraction, DigiruleCallbackComOutStdout, 
-                        DigiruleCallbackComInUserInteraction, DigiruleCallbackPinInUserInteraction)
+from .exceptions import (DgtoolsError, DgtoolsErrorOpcodeNotSupported, DgtoolsErrorProgramHalt, DgtoolsErrorOutOfMemory,
+                         DgtoolsErrorStackUnderflow, DgtoolsErrorInfiniteLoop)
+from .callbacks import (DigiruleCallbackInputBase, DigiruleCallbackOutputBase, DigiruleCallbackInputUserInteraction, 
+                        DigiruleCallbackComOutStdout, DigiruleCallbackComInUserInteraction, 
+                        DigiruleCallbackPinInUserInteraction)
+import collections
+import copy
+import functools
 import random
-import pyparsing
+
+# The outcome of Digirule.run()
+DigiruleRunResult = collections.namedtuple("DigiruleRunResult", ["n_steps", "halt_reason", "pc"])
+# The complete state of a Digirule, as returned by Digirule.snapshot(). 
+# callbacks holds the state of each callback in _CALLBACK_ATTRIBUTES (None for callbacks that are not set).
+DigiruleSnapshot = collections.namedtuple("DigiruleSnapshot", ["pc", "acc", "speed", "ppc", "mem", "callbacks"])
 
 class Digirule:
     """
@@ -19,8 +28,98 @@ class Digirule:
     
     Notes:
         * Functions that change the state of the VM but do not return values, should return `self`
+        * Instruction handlers receive their operands already fetched, with the program counter pointing to the 
+          next instruction.
+        * Setting ``use_decode_cache`` executes instructions through a cache of pre-decoded instructions, that is 
+          invalidated by any write to the memory an instruction occupies.
+        * Setting ``use_block_compiler`` makes ``run()`` execute whole basic blocks that are compiled to Python 
+          functions from the templates in ``_BLOCK_TEMPLATES``.
+        * ``snapshot()`` returns the state of the VM as an immutable value that ``restore()`` and ``fork()`` 
+          bring a VM back to.
+        * Setting ``loop_detection_stride`` makes ``run()`` stop programs that return to a state they have been in 
+          before (and would therefore never halt), with a ``DgtoolsErrorInfiniteLoop``.
         
     """
+    # Attributes holding callbacks whose state is part of a snapshot.
+    _CALLBACK_ATTRIBUTES = ("_interactive_callback",)
+    # Opcodes whose outcome is not determined by the state of the VM (e.g. random numbers).
+    _NONDETERMINISTIC_OPCODES = frozenset()
+
+    # Python source templates of each instruction, used by the basic block compiler.
+    # Each entry is opcode:(source, indices of operands that are addresses written to, kind).
+    # Sources operate on the locals acc, st (the status register), mem, ppc (the program counter stack) and pc. 
+    # {0}, {1} are replaced by the operands and {pc} by the address of the next instruction.
+    # kind is "T" for instructions that terminate a block by setting pc and "E" for instructions that terminate a 
+    # block because they write to addresses that are not known at compile time.
+    # Instructions without a template (e.g. HALT) are always executed by the interpreter.
+    _BLOCK_TEMPLATES = {1:("pass", (), None),
+                        2:("vm._speed_setting = {0}", (), None),
+                        3:("mem[{1}] = {0}", (1,), None),
+                        4:("acc = {0}", (), None),
+                        5:("mem[{0}] = acc", (0,), None),
+                        6:("acc = mem[{0}]\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), None),
+                        7:("v = mem[{0}]\n"
+                           "mem[{1}] = v\n"
+                           "st = (st | 1) if v == 0 else (st & 254)", (1,), None),
+                        8:("v = acc + {0}\n"
+                           "acc = v & 255\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)\n"
+                           "st = (st | 2) if v > 255 else (st & 253)", (), None),
+                        9:("acc = (acc + mem[{0}]) & 255\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), None),
+                       10:("v = acc - {0}\n"
+                           "acc = v & 255\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)\n"
+                           "st = (st | 2) if v < 0 else (st & 253)", (), None),
+                       11:("v = acc - mem[{0}]\n"
+                           "acc = v & 255\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)\n"
+                           "st = (st | 2) if v < 0 else (st & 253)", (), None),
+                       12:("acc &= {0}\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), None),
+                       13:("acc &= mem[{0}]\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), None),
+                       14:("acc |= {0}\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), None),
+                       15:("acc |= mem[{0}]\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), None),
+                       16:("acc ^= {0}\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), None),
+                       17:("acc ^= mem[{0}]\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), None),
+                       18:("v = (mem[{0}] - 1) & 255\n"
+                           "mem[{0}] = v\n"
+                           "st = (st | 1) if v == 0 else (st & 254)", (0,), None),
+                       19:("v = (mem[{0}] + 1) & 255\n"
+                           "mem[{0}] = v\n"
+                           "st = (st | 1) if v == 0 else (st & 254)", (0,), None),
+                       20:("v = (mem[{0}] - 1) & 255\n"
+                           "mem[{0}] = v\n"
+                           "st = (st | 1) if v == 0 else (st & 254)\n"
+                           "pc = {pc} + 2 if v == 0 else {pc}", (0,), "T"),
+                       21:("v = (mem[{0}] + 1) & 255\n"
+                           "mem[{0}] = v\n"
+                           "st = (st | 1) if v == 0 else (st & 254)\n"
+                           "pc = {pc} + 2 if v == 0 else {pc}", (0,), "T"),
+                       22:("v = mem[{0}]\n"
+                           "mem[{0}] = ((v << 1) & 255) | ((st & 2) >> 1)\n"
+                           "st = (st | 2) if v & 128 else (st & 253)", (0,), None),
+                       23:("v = mem[{0}]\n"
+                           "mem[{0}] = (v >> 1) | ((st & 2) << 6)\n"
+                           "st = (st | 2) if v & 1 else (st & 253)", (0,), None),
+                       24:("mem[{1}] &= (255 - (1 << {0})) & 255", (1,), None),
+                       25:("mem[{1}] |= (1 << {0}) & 255", (1,), None),
+                       26:("pc = {pc} + 2 if (mem[{1}] & (1 << {0})) != (1 << {0}) else {pc}", (), "T"),
+                       27:("pc = {pc} + 2 if (mem[{1}] & (1 << {0})) == (1 << {0}) else {pc}", (), "T"),
+                       28:("pc = {0}", (), "T"),
+                       29:("ppc.append({pc})\n"
+                           "pc = {0}", (), "T"),
+                       30:("acc = {0}\n"
+                           "pc = ppc.pop() if ppc else -1", (), "T"),
+                       31:("pc = ppc.pop() if ppc else -1", (), "T"),
+                       32:("pc = {pc} + {0} - 1", (), "T")}
+    
     # TODO: MED, Need to add randa on the 2A 
     def __init__(self):
         # Program counter
@@ -40,7 +139,8 @@ class Digirule:
         self._bt_reg_ptr = 253
         self._addrled_reg_ptr = 254
         self._dataled_reg_ptr = 255
-        self._mem = [0 for k in range(0,256)]
+        # Memory is a byte buffer, so that every value is a uint8 and copies of it are cheap.
+        self._mem = bytearray(256)
         # The speed setting is just for visualisation
         # TODO: LOW, Make the speed setting functional
         self._speed_setting = 0
@@ -48,40 +148,48 @@ class Digirule:
         # When a Digirule is in Interactive Mode and an instruction comes to read from the button register
         # it prompts the user for input
         self._interactive_callback = None
-        # Instruction set lookup
-        self._ins_lookup = {0:self._halt,
-                            1:self._nop,
-                            2:self._speed,
-                            3:self._copylr,
-                            4:self._copyla,
-                            5:self._copyar,
-                            6:self._copyra,
-                            7:self._copyrr,
-                            8:self._addla,
-                            9:self._addra,
-                           10:self._subla,
-                           11:self._subra,
-                           12:self._andla,
-                           13:self._andra,
-                           14:self._orla,
-                           15:self._orra,
-                           16:self._xorla,
-                           17:self._xorra,
-                           18:self._decr,
-                           19:self._incr,
-                           20:self._decrjz,
-                           21:self._incrjz,
-                           22:self._shiftrl,
-                           23:self._shiftrr,
-                           24:self._cbr,
-                           25:self._sbr,
-                           26:self._bcrsc,
-                           27:self._bcrss,
-                           28:self._jump,
-                           29:self._call,
-                           30:self._retla,
-                           31:self._return,
-                           32:self._addrpc}
+        # Decoded instructions, keyed by the address of their opcode. Set to None to bypass the decode cache.
+        self._decode_cache = None
+        # Flags the addresses that are part of a cached instruction, so that only writes to them invalidate the cache.
+        self._decode_cover = bytearray(256)
+        # Compiled basic blocks, keyed by the address of their first opcode. Set to None to bypass the block compiler.
+        self._blocks = None
+        # Number of steps between two checks for a repeated state in run(). Set to None to disable loop detection.
+        self._loop_detection_stride = None
+        # Instruction set lookup (opcode:(handler, number of operands))
+        self._ins_lookup = {0:(self._halt, 0),
+                            1:(self._nop, 0),
+                            2:(self._speed, 1),
+                            3:(self._copylr, 2),
+                            4:(self._copyla, 1),
+                            5:(self._copyar, 1),
+                            6:(self._copyra, 1),
+                            7:(self._copyrr, 2),
+                            8:(self._addla, 1),
+                            9:(self._addra, 1),
+                           10:(self._subla, 1),
+                           11:(self._subra, 1),
+                           12:(self._andla, 1),
+                           13:(self._andra, 1),
+                           14:(self._orla, 1),
+                           15:(self._orra, 1),
+                           16:(self._xorla, 1),
+                           17:(self._xorra, 1),
+                           18:(self._decr, 1),
+                           19:(self._incr, 1),
+                           20:(self._decrjz, 1),
+                           21:(self._incrjz, 1),
+                           22:(self._shiftrl, 1),
+                           23:(self._shiftrr, 1),
+                           24:(self._cbr, 2),
+                           25:(self._sbr, 2),
+                           26:(self._bcrsc, 2),
+                           27:(self._bcrss, 2),
+                           28:(self._jump, 1),
+                           29:(self._call, 1),
+                           30:(self._retla, 1),
+                           31:(self._return, 0),
+                           32:(self._addrpc, 1)}
         
     @property
     def addr_led(self):
@@ -110,6 +218,74 @@ class Digirule:
     def mem(self):
         return self._mem
         
+    @property
+    def mem_view(self):
+        """
+        A read-only, zero-copy view of the memory space.
+        
+        Notes:
+            * Writes must go through the VM (e.g. ``_wr_mem``) so that decoded instructions and compiled blocks are 
+              invalidated.
+        
+        :rtype: memoryview
+        """
+        return memoryview(self._mem).toreadonly()
+        
+    @property
+    def use_decode_cache(self):
+        return self._decode_cache is not None
+        
+    @use_decode_cache.setter
+    def use_decode_cache(self, new_value):
+        if type(new_value) is not bool:
+            raise TypeError(f".use_decode_cache() setter expects bool, received {type(new_value)}")
+        self._decode_cache = {} if new_value else None
+        self._decode_cover = bytearray(256)
+        if new_value:
+            self._blocks = None
+        self._bind_stepper()
+        
+    @property
+    def use_block_compiler(self):
+        return self._blocks is not None
+        
+    @use_block_compiler.setter
+    def use_block_compiler(self, new_value):
+        if type(new_value) is not bool:
+            raise TypeError(f".use_block_compiler() setter expects bool, received {type(new_value)}")
+        self._blocks = {} if new_value else None
+        if new_value:
+            # Compiled blocks write to memory directly, which would leave decoded instructions stale.
+            self._decode_cache = None
+            self._bind_stepper()
+        
+    def _bind_stepper(self):
+        """
+        Binds ``_exec_next`` and ``_wr_mem`` to the variants that match the decode cache setting.
+        
+        Notes:
+            * The choice is made once, here, so that neither the plain nor the cached path pays for a per step check 
+              of the other.
+        """
+        if self._decode_cache is not None:
+            self._exec_next = self._exec_next_decoded
+            self._wr_mem = self._wr_mem_decoded
+        else:
+            self.__dict__.pop("_exec_next", None)
+            self.__dict__.pop("_wr_mem", None)
+        
+    @property
+    def loop_detection_stride(self):
+        return self._loop_detection_stride
+        
+    @loop_detection_stride.setter
+    def loop_detection_stride(self, new_value):
+        if new_value is not None and type(new_value) is not int:
+            raise TypeError(f".loop_detection_stride() setter expects int or None, received {type(new_value)}")
+        if new_value is not None and new_value < 1:
+            raise ValueError(f".loop_detection_stride() setter expects a value >0, received {new_value}")
+        self._loop_detection_stride = new_value
+        
     @property
     def speed(self):
         return self._speed_setting
@@ -142,15 +318,22 @@ class Digirule:
             * A program is basically an array of (most commonly) 256 values
             * Offset is the offset within the Digirule memory where the first
               byte of the program would reside.
+            * A program can be a list of int (that are truncated to uint8) or any bytes-like object.
         """
-        if type(a_program) is not list:
-            raise TypeError(f"Expected a_program as list received {type(a_program)}")
+        if type(a_program) not in (list, bytes, bytearray, memoryview):
+            raise TypeError(f"Expected a_program as list or bytes-like received {type(a_program)}")
         
         if len(a_program) > 256:
             raise DgtoolsErrorOutOfMemory(f"Expected length of program to be at most 256, received {len(a_program)}")
             
-        for k in enumerate(a_program):
-            self._mem[k[0]] = k[1]            
+        if type(a_program) is list:
+            a_program = bytes(a_value & 0xFF for a_value in a_program)
+        self._mem[:len(a_program)] = a_program
+        if self._decode_cache is not None:
+            self._decode_cache.clear()
+            self._decode_cover = bytearray(256)
+        if self._blocks is not None:
+            self._blocks.clear()
         return self
         
     def set_button_register(self, new_value):
@@ -185,7 +368,8 @@ class Digirule:
         return self
         
     def _push_pc(self):
-        self._ppc.append(self._pc + 1)
+        # Operands have already been fetched, so the pc is pointing to the return address.
+        self._ppc.append(self._pc)
         return self
         
     def _pop_pc(self):
@@ -220,6 +404,19 @@ class Digirule:
         self._mem[addr & 0xFF] = value & 0xFF
         return self
         
+    def _wr_mem_decoded(self, addr, value):
+        """
+        Writes memory and drops the decoded instructions that the write invalidates.
+        """
+        addr &= 0xFF
+        self._mem[addr] = value & 0xFF
+        if self._decode_cover[addr]:
+            # Instructions are at most 3 bytes long, so only those decoded at addr-2..addr can contain addr.
+            self._decode_cache.pop(addr, None)
+            self._decode_cache.pop(addr - 1, None)
+            self._decode_cache.pop(addr - 2, None)
+        return self
+        
     def _rd_mem(self, addr):
         """
         Reads memory from the specified address.
@@ -230,7 +427,7 @@ class Digirule:
               for input.
         """
         if addr == self._bt_reg_ptr and self._interactive_callback is not None:
-            self._mem[addr] = self._interactive_callback()
+            self._mem[addr] = self._interactive_callback() & 0xFF
         return self._mem[addr]
         
     def _halt(self):
@@ -239,170 +436,184 @@ class Digirule:
     def _nop(self):
         pass
         
-    def _speed(self):
-        self._speed_setting = self._read_next()
+    def _speed(self, value):
+        self._speed_setting = value
         
-    def _copylr(self):
-        literal = self._read_next()
-        self._wr_mem(self._read_next(), literal)
+    def _copylr(self, literal, addr):
+        self._wr_mem(addr, literal)
         
-    def _copyla(self):
-        literal = self._read_next()
+    def _copyla(self, literal):
         self._set_acc_value(literal)
 
-    def _copyar(self):
-        self._wr_mem(self._read_next(), self._get_acc_value())
+    def _copyar(self, addr):
+        self._wr_mem(addr, self._get_acc_value())
 
-    def _copyra(self):
-        new_value = self._rd_mem(self._read_next())
+    def _copyra(self, addr):
+        new_value = self._rd_mem(addr)
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, new_value==0)
 
-    def _copyrr(self):
-        addr1 = self._read_next()
+    def _copyrr(self, addr1, addr2):
         value_addr1 = self._rd_mem(addr1) & 0xFF
-        addr2 = self._read_next()
         self._wr_mem(addr2, value_addr1)
         self._set_status_reg(self._ZERO_FLAG_BIT,value_addr1==0)
 
-    def _addla(self):
-        new_value = self._get_acc_value() + self._read_next()
+    def _addla(self, literal):
+        new_value = self._get_acc_value() + literal
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
         self._set_status_reg(self._CARRY_FLAG_BIT, (new_value > 255 or new_value < 0))
 
-    def _addra(self):
-        new_value = self._get_acc_value() + self._rd_mem(self._read_next())
+    def _addra(self, addr):
+        new_value = self._get_acc_value() + self._rd_mem(addr)
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
 
-    def _subla(self):
-        new_value = self._get_acc_value() - self._read_next()
+    def _subla(self, literal):
+        new_value = self._get_acc_value() - literal
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
         self._set_status_reg(self._CARRY_FLAG_BIT, (new_value > 255 or new_value < 0))
 
-    def _subra(self):
-        new_value = self._get_acc_value() - self._rd_mem(self._read_next())
+    def _subra(self, addr):
+        new_value = self._get_acc_value() - self._rd_mem(addr)
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
         self._set_status_reg(self._CARRY_FLAG_BIT, (new_value > 255 or new_value < 0))
 
-    def _andla(self):
-        new_value = self._get_acc_value() & self._read_next()
+    def _andla(self, literal):
+        new_value = self._get_acc_value() & literal
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
 
-    def _andra(self):
-        new_value = self._get_acc_value() & self._rd_mem(self._read_next())
+    def _andra(self, addr):
+        new_value = self._get_acc_value() & self._rd_mem(addr)
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
 
-    def _orla(self):
-        new_value = self._get_acc_value() | self._read_next()
+    def _orla(self, literal):
+        new_value = self._get_acc_value() | literal
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
 
-    def _orra(self):
-        new_value = self._get_acc_value() | self._rd_mem(self._read_next())
+    def _orra(self, addr):
+        new_value = self._get_acc_value() | self._rd_mem(addr)
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
 
-    def _xorla(self):
-        new_value = self._get_acc_value() ^ self._read_next()
+    def _xorla(self, literal):
+        new_value = self._get_acc_value() ^ literal
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
 
-    def _xorra(self):
-        new_value = self._get_acc_value() ^ self._rd_mem(self._read_next())
+    def _xorra(self, addr):
+        new_value = self._get_acc_value() ^ self._rd_mem(addr)
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
 
-    def _decr(self):
-        addr = self._read_next()
+    def _decr(self, addr):
         value = (self._rd_mem(addr) - 1) & 0xFF
         self._wr_mem(addr, value)
         self._set_status_reg(self._ZERO_FLAG_BIT,value==0)
 
-    def _incr(self):
-        addr = self._read_next()
+    def _incr(self, addr):
         value = (self._rd_mem(addr) + 1) & 0xFF
         self._wr_mem(addr, value)
         self._set_status_reg(self._ZERO_FLAG_BIT,value==0)
 
-    def _decrjz(self):
-        addr = self._read_next()
+    def _decrjz(self, addr):
         value = (self._rd_mem(addr) - 1) & 0xFF
         self._wr_mem(addr, value)
         self._set_status_reg(self._ZERO_FLAG_BIT,value==0)
         if value == 0:
             self._pc+=2
 
-    def _incrjz(self):        
-        addr = self._read_next()
+    def _incrjz(self, addr):        
         value = (self._rd_mem(addr) + 1) & 0xFF
         self._wr_mem(addr, value)
         self._set_status_reg(self._ZERO_FLAG_BIT,value==0)
         if value == 0:
             self._pc += 2
             
-    def _shiftrl(self):
-        addr = self._read_next()
+    def _shiftrl(self, addr):
         value = self._rd_mem(addr)
         next_carry_value = 1 if value & 128 == 128 else 0
         self._wr_mem(addr, ((value<<1) & 0xFF)|self._get_status_reg(self._CARRY_FLAG_BIT))
         self._set_status_reg(self._CARRY_FLAG_BIT,next_carry_value)
 
-    def _shiftrr(self):
-        addr = self._read_next()
+    def _shiftrr(self, addr):
         value = self._rd_mem(addr)
         next_carry_value = 1 if value & 1 == 1 else 0
         self._wr_mem(addr, ((value>>1) & 0xFF)|(self._get_status_reg(self._CARRY_FLAG_BIT) << 7))
         self._set_status_reg(self._CARRY_FLAG_BIT,next_carry_value)
 
-    def _cbr(self):
-        bit_to_clear = self._read_next()
-        addr = self._read_next()
+    def _cbr(self, bit_to_clear, addr):
         new_value = self._rd_mem(addr) & (255 - (1<<bit_to_clear))
         self._wr_mem(addr, new_value)
         
-    def _sbr(self):
+    def _sbr(self, bit_to_clear, addr):
         # TODO: MED, In CBR and SBR, if the bit is zero, it should raise an error at compile time.
-        bit_to_clear = self._read_next()
-        addr = self._read_next()
         new_value = self._rd_mem(addr) | (1<<bit_to_clear)
         self._wr_mem(addr, new_value)
         
-    def _bcrsc(self):
-        bit_to_check_mask = 1 << self._read_next()
-        addr = self._read_next()
+    def _bcrsc(self, bit_to_check, addr):
+        bit_to_check_mask = 1 << bit_to_check
         if (self._rd_mem(addr) & bit_to_check_mask) != bit_to_check_mask:
             self._pc+=2
             
-    def _bcrss(self):
-        bit_to_check_mask = 1 << self._read_next()
-        addr = self._read_next()
+    def _bcrss(self, bit_to_check, addr):
+        bit_to_check_mask = 1 << bit_to_check
         if (self._rd_mem(addr) & bit_to_check_mask) == bit_to_check_mask:
             self._pc+=2
 
-    def _jump(self):
-        self._pc = self._read_next()
+    def _jump(self, addr):
+        self._pc = addr
         
-    def _call(self):
+    def _call(self, addr):
         self._push_pc()
-        self._pc = self._read_next()
+        self._pc = addr
         
-    def _retla(self):
-        self._acc = self._read_next()
+    def _retla(self, value):
+        self._acc = value
         # TODO: MED, If you get a RETLA without first having called CALL, it should raise an exception at compile time.
         self._pop_pc()
 
     def _return(self):
         self._pop_pc()
         
-    def _addrpc(self):
-        self._pc += self._read_next()
+    def _addrpc(self, value):
+        # The offset is relative to the address of the operand, not that of the next instruction.
+        self._pc += value - 1
 
+    def _decode(self, addr):
+        """
+        The equivalent of "fetch" and "decode" for the instruction that starts at addr.
+        
+        Notes:
+            * Returns an (instruction, next_pc) record and stores it in the decode cache. The instruction is the 
+              handler with its operands already bound to it, executing it is a single call.
+            * Instructions that overlap the memory mapped registers are decoded but never cached, 
+              because those registers can change without going through ``_wr_mem``.
+        
+        :param addr: The address of the opcode
+        :type addr: uint8
+        :returns: The decoded instruction
+        :rtype: tuple<callable, int>
+        """
+        cmd = self._rd_mem(addr)
+        try:
+            handler, num_operands = self._ins_lookup[cmd]
+        except KeyError:
+            self._pc = addr + 1
+            raise DgtoolsErrorOpcodeNotSupported(f"Opcode {cmd} not understood")
+        next_pc = addr + 1 + num_operands
+        if num_operands > 0:
+            handler = functools.partial(handler, *map(self._rd_mem, range(addr + 1, next_pc)))
+        decoded = (handler, next_pc)
+        if next_pc <= self._status_reg_ptr:
+            self._decode_cache[addr] = decoded
+            self._decode_cover[addr:next_pc] = b"\x01" * (next_pc - addr)
+        return decoded
 
     def _exec_next(self):
         """
@@ -410,11 +621,172 @@ class Digirule:
         """
         # Fetch...
         cmd = self._read_next()
-        # Execute
+        # Decode...
         try:
-            self._ins_lookup[cmd]()
+            handler, num_operands = self._ins_lookup[cmd]
         except KeyError as ke:
             raise DgtoolsErrorOpcodeNotSupported(f"Opcode {cmd} not understood")
+        # Execute
+        if num_operands == 0:
+            handler()
+        elif num_operands == 1:
+            handler(self._read_next())
+        else:
+            handler(self._read_next(), self._read_next())
+        
+    def _exec_next_decoded(self):
+        """
+        Executes the instruction at the program counter through the decode cache.
+        """
+        try:
+            instruction, next_pc = self._decode_cache[self._pc]
+        except KeyError:
+            instruction, next_pc = self._decode(self._pc)
+        self._pc = next_pc
+        instruction()
+        
+    def _compile_block(self, addr, self_modified=False):
+        """
+        Compiles the basic block that starts at addr to a Python function.
+        
+        Notes:
+            * A block extends up to (and including) its first terminating instruction, or up to the first 
+              instruction that has to be left to the interpreter.
+            * A block also stops before any instruction whose bytes are written to by an earlier instruction 
+              of the same block.
+            * The compiled function keeps acc and the status register in locals and commits them at block exit. 
+              Instructions that write to the status register directly are left to the interpreter.
+            * Instructions left to the interpreter, as well as code that has been modified since it was last 
+              compiled, are only decoded to a "block" of one instruction. This keeps self-modifying code from 
+              being recompiled over and over.
+        
+        :param addr: The address of the first opcode of the block.
+        :type addr: uint8
+        :param self_modified: Whether the block is recompiled because its code has changed.
+        :type self_modified: bool
+        :returns: A (function, end address, source bytes, number of instructions) record. The function is None 
+                  if the opcode at addr is not understood.
+        :rtype: tuple<callable, int, bytes, int>
+        """
+        mem = self._mem
+        code_lines = []
+        written = set()
+        num_instructions = 0
+        pc = addr
+        while pc < self._status_reg_ptr and not self_modified:
+            cmd = mem[pc]
+            if cmd not in self._BLOCK_TEMPLATES or cmd not in self._ins_lookup:
+                break
+            source, write_operands, kind = self._BLOCK_TEMPLATES[cmd]
+            next_pc = pc + 1 + self._ins_lookup[cmd][1]
+            operands = list(mem[(pc + 1):next_pc])
+            if next_pc > self._status_reg_ptr or \
+               any(operands[k] == self._status_reg_ptr for k in write_operands) or \
+               any(an_addr in written for an_addr in range(pc, next_pc)):
+                break
+            # Reads of the status register are served by its local copy
+            for k, an_operand in enumerate(operands):
+                if an_operand == self._status_reg_ptr:
+                    source = source.replace(f"mem[{{{k}}}]", "st")
+            code_lines.extend(source.format(*operands, pc=next_pc).split("\n"))
+            written.update(operands[k] for k in write_operands)
+            num_instructions += 1
+            pc = next_pc
+            if kind is not None:
+                break
+        
+        if num_instructions > 0:
+            block_source = "def _block(vm, mem, ppc):\n" \
+                           "    acc = vm._acc\n" \
+                           f"    st = mem[{self._status_reg_ptr}]\n" \
+                           f"    pc = {pc}\n" + \
+                           "".join(map(lambda x:f"    {x}\n", code_lines)) + \
+                           "    vm._acc = acc\n" \
+                           f"    mem[{self._status_reg_ptr}] = st\n" \
+                           "    return pc\n"
+            block_namespace = {"randint":random.randint}
+            exec(compile(block_source, f"<digirule block 0x{addr:02X}>", "exec"), block_namespace)
+            block = (block_namespace["_block"], pc, bytes(mem[addr:pc]), num_instructions)
+        elif mem[addr] in self._ins_lookup and addr + 1 + self._ins_lookup[mem[addr]][1] <= len(mem):
+            handler, num_operands = self._ins_lookup[mem[addr]]
+            next_pc = addr + 1 + num_operands
+            operands = tuple(mem[(addr + 1):next_pc])
+            
+            def _block(vm, mem, ppc):
+                vm._pc = next_pc
+                handler(*operands)
+                return vm._pc
+                
+            block = (_block, next_pc, bytes(mem[addr:next_pc]), 1)
+        else:
+            block = (None, addr + 1, bytes(mem[addr:(addr + 1)]), 1)
+        self._blocks[addr] = block
+        return block
+        
+    def snapshot(self):
+        """
+        Returns the state of the VM (registers, stack, memory and the state of its callbacks).
+        
+        Notes:
+            * The snapshot is immutable and hashable, so it can be used as a key (e.g. to detect states that have 
+              already been explored).
+            * The state of the random number generator (used by RANDA) is not part of a snapshot.
+        
+        :rtype: DigiruleSnapshot
+        """
+        return DigiruleSnapshot(self._pc, self._acc, self._speed_setting, tuple(self._ppc), bytes(self._mem), 
+                                tuple(getattr(self, an_attribute).get_state() 
+                                      if getattr(self, an_attribute) is not None else None
+                                      for an_attribute in self._CALLBACK_ATTRIBUTES))
+        
+    def restore(self, a_snapshot):
+        """
+        Brings the VM back to the state of a snapshot.
+        
+        Notes:
+            * The callbacks of the VM are not replaced, their state is set to the one in the snapshot.
+        
+        :param a_snapshot: A snapshot of a VM of the same model.
+        :type a_snapshot: DigiruleSnapshot
+        """
+        if type(a_snapshot) is not DigiruleSnapshot:
+            raise TypeError(f"Expected a_snapshot as DigiruleSnapshot, received {type(a_snapshot)}")
+            
+        if len(a_snapshot.callbacks) != len(self._CALLBACK_ATTRIBUTES):
+            raise ValueError(f"Snapshot was not taken from a {self.__class__.__name__}")
+        
+        self.load_program(a_snapshot.mem)
+        self._pc = a_snapshot.pc
+        self._acc = a_snapshot.acc
+        self._speed_setting = a_snapshot.speed
+        self._ppc = list(a_snapshot.ppc)
+        for an_attribute, a_state in zip(self._CALLBACK_ATTRIBUTES, a_snapshot.callbacks):
+            a_callback = getattr(self, an_attribute)
+            if a_callback is not None and a_state is not None:
+                a_callback.set_state(a_state)
+        return self
+        
+    def fork(self, a_snapshot=None):
+        """
+        Returns a new VM at the state of a snapshot (or at the current state of this VM).
+        
+        Notes:
+            * The new VM gets copies of the callbacks of this VM, so that the two can consume their inputs 
+              independently.
+        
+        :param a_snapshot: A snapshot of a VM of the same model.
+        :type a_snapshot: DigiruleSnapshot
+        :rtype: Digirule
+        """
+        if a_snapshot is None:
+            a_snapshot = self.snapshot()
+        forked = self.__class__()
+        for an_attribute in self._CALLBACK_ATTRIBUTES:
+            a_callback = getattr(self, an_attribute)
+            setattr(forked, an_attribute, copy.copy(a_callback) if a_callback is not None else None)
+        forked.use_decode_cache = self.use_decode_cache
+        forked._blocks = {} if self._blocks is not None else None
+        return forked.restore(a_snapshot)
         
     def goto(self, offset):
         if type(offset) is not int:
@@ -425,18 +797,175 @@ class Digirule:
             
         self._pc = offset
     
-    def run(self, max_n=2500):
+    def run(self, max_n=2500, run_steps=None):
         """
-        Executes commands from the current program counter until a HALT opcode.
+        Executes instructions from the current program counter until the program halts or max_n instructions have 
+        been executed.
+        
+        Notes:
+            * The program halts on any ``DgtoolsError`` raised by an instruction (e.g. HALT, stack under/overflow, 
+              an opcode that is not understood). The exception is returned in ``halt_reason`` rather than raised.
+            * If ``use_block_compiler`` is set, basic blocks that would exceed the remaining budget are executed one 
+              instruction at a time, so that exactly max_n instructions are executed.
+            * If ``loop_detection_stride`` is set, the state of the VM is checked every that many steps (Brent's 
+              algorithm). A repeated state halts the program with ``DgtoolsErrorInfiniteLoop``. Loops are not 
+              detected while any input callback is set, since the program depends on its inputs then, or if the 
+              repeating steps include an instruction that is not deterministic (e.g. RANDA).
+            * ``run_steps`` replaces the way instructions are executed, e.g. to observe each one of them. It is 
+              called with a number of instructions and returns a ``DigiruleRunResult``, as ``_run`` does. The steps 
+              that measure the period of a detected loop are not executed through it.
+        
+        :param max_n: Maximum number of instructions to execute.
+        :type max_n: int
+        :param run_steps: Executes up to a number of instructions (by default, at full speed).
+        :type run_steps: callable
+        :returns: The number of instructions executed, the reason the program halted (or None if max_n was reached) 
+                  and the final program counter.
+        :rtype: DigiruleRunResult
         """
-        cnt = self._exec_next()
-        n = 0
-        while n<2500:
-            cnt = self._exec_next()
-            n+=1
-            
-        raise DgtoolsErrorProgramHalt(f"Program exceeded preset max_n={max_n}.")
+        if type(max_n) is not int:
+            raise TypeError(f"Expected max_n as int, received {type(max_n)}")
+        if max_n < 0:
+            raise ValueError(f"Expected max_n>=0, received {max_n}")
             
+        if self._loop_detection_stride is not None and \
+           not any(isinstance(getattr(self, an_attribute), DigiruleCallbackInputBase) 
+                   for an_attribute in self._CALLBACK_ATTRIBUTES):
+            return self._run_detect_loops(max_n, run_steps or self._run)
+        return (run_steps or self._run)(max_n)
+        
+    def _state_key(self):
+        """
+        Returns the part of the state of the VM that determines its execution.
+        """
+        return (self._pc, self._acc, self._speed_setting, tuple(self._ppc), bytes(self._mem))
+        
+    def _run_detect_loops(self, max_n, run_steps):
+        """
+        Executes run() in strides, halting the program if the VM returns to a state it has been in before.
+        
+        Notes:
+            * States are compared every ``loop_detection_stride`` steps with Brent's algorithm, which keeps one 
+              state at a time. The period of a detected loop is then measured exactly by stepping through it once.
+            * A loop of period p steps is detected within a small multiple of p * stride / gcd(p, stride) steps after 
+              it starts. Small strides detect long loops sooner, at the cost of comparing states more often.
+            * The state does not include the random number generator, so a repeated state is only an infinite loop 
+              if the loop does not execute any of ``_NONDETERMINISTIC_OPCODES``. Otherwise, the program runs on 
+              without loop detection.
+            * Output callbacks are detached while the period is measured, so that the output of the loop is not 
+              repeated.
+        """
+        stride = self._loop_detection_stride
+        n = 0
+        power = period = 1
+        tortoise = self._state_key()
+        while n < max_n:
+            run_result = run_steps(min(stride, max_n - n))
+            n += run_result.n_steps
+            if run_result.halt_reason is not None or n == max_n:
+                return DigiruleRunResult(n, run_result.halt_reason, self._pc)
+            hare = self._state_key()
+            if hare == tortoise:
+                break
+            if power == period:
+                tortoise = hare
+                power *= 2
+                period = 0
+            period += 1
+        else:
+            return DigiruleRunResult(n, None, self._pc)
+        # The loop repeats every period * stride steps, find its exact (shortest) period.
+        loop_start = self.snapshot()
+        output_callbacks = {an_attribute:getattr(self, an_attribute) for an_attribute in self._CALLBACK_ATTRIBUTES 
+                            if isinstance(getattr(self, an_attribute), DigiruleCallbackOutputBase)}
+        for an_attribute in output_callbacks:
+            setattr(self, an_attribute, None)
+        exact_period = None
+        try:
+            for a_period in range(1, period * stride + 1):
+                if self._pc < len(self._mem) and self._mem[self._pc] in self._NONDETERMINISTIC_OPCODES:
+                    break
+                self._run(1)
+                if self._state_key() == hare:
+                    exact_period = a_period
+                    break
+        finally:
+            for an_attribute, a_callback in output_callbacks.items():
+                setattr(self, an_attribute, a_callback)
+            self.restore(loop_start)
+        if exact_period is None:
+            run_result = run_steps(max_n - n)
+            return DigiruleRunResult(n + run_result.n_steps, run_result.halt_reason, self._pc)
+        return DigiruleRunResult(n, DgtoolsErrorInfiniteLoop(n, exact_period), self._pc)
+        
+    def _run(self, max_n):
+        n = 0
+        halt_reason = None
+        try:
+            if self._interactive_callback is not None:
+                exec_next = self._exec_next
+                while n < max_n:
+                    n += 1
+                    exec_next()
+            elif self._blocks is not None:
+                # Basic block dispatch. A block is invalidated if any of the bytes it was compiled from has changed.
+                mem = self._mem
+                blocks = self._blocks
+                compile_block = self._compile_block
+                exec_next = self._exec_next
+                while n < max_n:
+                    pc = self._pc
+                    block = blocks.get(pc)
+                    if block is None:
+                        block = compile_block(pc)
+                    elif mem[pc:block[1]] != block[2]:
+                        block = compile_block(pc, self_modified=True)
+                    block_fun, block_end, block_code, num_instructions = block
+                    if block_fun is None or num_instructions > max_n - n:
+                        n += 1
+                        exec_next()
+                        continue
+                    n += num_instructions
+                    next_pc = block_fun(self, mem, self._ppc)
+                    if next_pc < 0:
+                        self._pc = block_end
+                        raise DgtoolsErrorStackUnderflow("Program stack underflow.")
+                    self._pc = next_pc
+            elif self._decode_cache is not None:
+                decode_cache = self._decode_cache
+                decode = self._decode
+                while n < max_n:
+                    n += 1
+                    try:
+                        instruction, next_pc = decode_cache[self._pc]
+                    except KeyError:
+                        instruction, next_pc = decode(self._pc)
+                    self._pc = next_pc
+                    instruction()
+            else:
+                mem = self._mem
+                ins_lookup = self._ins_lookup
+                while n < max_n:
+                    n += 1
+                    pc = self._pc
+                    try:
+                        handler, num_operands = ins_lookup[mem[pc]]
+                    except KeyError:
+                        self._pc = pc + 1
+                        raise DgtoolsErrorOpcodeNotSupported(f"Opcode {mem[pc]} not understood")
+                    if num_operands == 0:
+                        self._pc = pc + 1
+                        handler()
+                    elif num_operands == 1:
+                        self._pc = pc + 2
+                        handler(mem[pc + 1])
+                    else:
+                        self._pc = pc + 3
+                        handler(mem[pc + 1], mem[pc + 2])
+        except DgtoolsError as de:
+            halt_reason = de
+        return DigiruleRunResult(n, halt_reason, self._pc)
+        
     def step(self):
         return self._exec_next()
         
@@ -449,118 +978,222 @@ class Digirule:
                f"  BTT SW:{self._mem[self._bt_reg_ptr]:08b}\n"
                
     @staticmethod
-    def get_asm_statement_def(existing_defs):
+    def get_asm_mnemonics():
+        """
+        Returns the mnemonics that the Digirule2A understands.
+        
+        :returns: Lookup of mnemonics to their opcode and the names of their operands.
+        :rtype: dict<str:tuple<int, tuple<str>>>
+        """
+        return {"HALT":(0, ()),
+                "NOP":(1, ()),
+                "SPEED":(2, ("value",)),
+                "COPYLR":(3, ("value", "addr")),
+                "COPYLA":(4, ("value",)),
+                "COPYAR":(5, ("addr",)),
+                "COPYRA":(6, ("addr",)),
+                "COPYRR":(7, ("addr_from", "addr_to")),
+                "ADDLA":(8, ("value",)),
+                "ADDRA":(9, ("addr",)),
+                "SUBLA":(10, ("value",)),
+                "SUBRA":(11, ("value",)),
+                "ANDLA":(12, ("value",)),
+                "ANDRA":(13, ("addr",)),
+                "ORLA":(14, ("value",)),
+                "ORRA":(15, ("addr",)),
+                "XORLA":(16, ("value",)),
+                "XORRA":(17, ("addr",)),
+                "DECR":(18, ("addr",)),
+                "INCR":(19, ("addr",)),
+                "DECRJZ":(20, ("addr",)),
+                "INCRJZ":(21, ("addr",)),
+                "SHIFTRL":(22, ("addr",)),
+                "SHIFTRR":(23, ("addr",)),
+                "CBR":(24, ("n_bit", "addr")),
+                "SBR":(25, ("n_bit", "addr")),
+                "BCRSC":(26, ("n_bit", "addr")),
+                "BCRSS":(27, ("n_bit", "addr")),
+                "JUMP":(28, ("addr",)),
+                "CALL":(29, ("addr",)),
+                "RETLA":(30, ("value",)),
+                "RETURN":(31, ()),
+                "ADDRPC":(32, ("value",))}
+        
+    @classmethod
+    def get_asm_statement_def(cls, existing_defs):
         """
-        Returns the assembly parser that the Digirule2A understands.
+        Returns the assembly parser for the mnemonics of the model (see get_asm_mnemonics).
         
         Notes:
             
-            * See inline comments for specification of the grammar
-        """
-        # Digirule ASM instructions
-        # Each succesfully parsed instruction is tagged by its opcode:num operands.
-        asm_halt = pyparsing.Group(pyparsing.Regex(r"HALT")("cmd"))("0:0")
-        asm_nop = pyparsing.Group(pyparsing.Regex(r"NOP")("cmd"))("1:0")
-        asm_speed = pyparsing.Group(pyparsing.Regex(r"SPEED")("cmd") + existing_defs["literal_or_identifier"]("value"))("2:1")
-        asm_copylr = pyparsing.Group(pyparsing.Regex("COPYLR")("cmd") + existing_defs["literal_or_identifier"]("value") + existing_defs["literal_or_identifier"]("addr"))("3:2")
-        asm_copyla = pyparsing.Group(pyparsing.Regex(r"COPYLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("4:1")
-        asm_copyar = pyparsing.Group(pyparsing.Regex("COPYAR")("cmd") + existing_defs["literal_or_identifier"]("addr"))("5:1")
-        asm_copyra = pyparsing.Group(pyparsing.Regex("COPYRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("6:1")
-        asm_copyrr = pyparsing.Group(pyparsing.Regex("COPYRR")("cmd") + existing_defs["literal_or_identifier"]("addr_from") + existing_defs["literal_or_identifier"]("addr_to"))("7:2")
-        asm_addla = pyparsing.Group(pyparsing.Regex("ADDLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("8:1")
-        asm_addra = pyparsing.Group(pyparsing.Regex("ADDRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("9:1")
-        asm_subla = pyparsing.Group(pyparsing.Regex("SUBLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("10:1")
-        asm_subra = pyparsing.Group(pyparsing.Regex("SUBRA")("cmd") + existing_defs["literal_or_identifier"]("value"))("11:1")
-        asm_andla = pyparsing.Group(pyparsing.Regex("ANDLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("12:1")
-        asm_andra = pyparsing.Group(pyparsing.Regex("ANDRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("13:1")
-        asm_orla = pyparsing.Group(pyparsing.Regex("ORLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("14:1")
-        asm_orra = pyparsing.Group(pyparsing.Regex("ORRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("15:1")
-        asm_xorla = pyparsing.Group(pyparsing.Regex("XORLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("16:1")
-        asm_xorra = pyparsing.Group(pyparsing.Regex("XORRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("17:1")
-        asm_decr = pyparsing.Group(pyparsing.Regex("DECR")("cmd") + existing_defs["literal_or_identifier"]("addr"))("18:1")
-        asm_incr = pyparsing.Group(pyparsing.Regex("INCR")("cmd") + existing_defs["literal_or_identifier"]("addr"))("19:1")
-        asm_decrjz = pyparsing.Group(pyparsing.Regex("DECRJZ")("cmd") + existing_defs["literal_or_identifier"]("addr"))("20:1")
-        asm_incrjz = pyparsing.Group(pyparsing.Regex("INCRJZ")("cmd") + existing_defs["literal_or_identifier"]("addr"))("21:1")
-        asm_shiftrl = pyparsing.Group(pyparsing.Regex("SHIFTRL")("cmd") + existing_defs["literal_or_identifier"]("addr"))("22:1")
-        asm_shiftrr = pyparsing.Group(pyparsing.Regex("SHIFTRR")("cmd") + existing_defs["literal_or_identifier"]("addr"))("23:1")
-        asm_cbr = pyparsing.Group(pyparsing.Regex("CBR")("cmd") + existing_defs["literal_or_identifier"]("n_bit") + existing_defs["literal_or_identifier"]("addr"))("24:2")
-        asm_sbr = pyparsing.Group(pyparsing.Regex("SBR")("cmd") + existing_defs["literal_or_identifier"]("n_bit") + existing_defs["literal_or_identifier"]("addr"))("25:2")
-        asm_bcrsc = pyparsing.Group(pyparsing.Regex("BCRSC")("cmd") + existing_defs["literal_or_identifier"]("n_bit") + existing_defs["literal_or_identifier"]("addr"))("26:2")
-        asm_bcrss = pyparsing.Group(pyparsing.Regex("BCRSS")("cmd") + existing_defs["literal_or_identifier"]("n_bit") + existing_defs["literal_or_identifier"]("addr"))("27:2")
-        asm_jump = pyparsing.Group(pyparsing.Regex("JUMP")("cmd") + existing_defs["literal_or_identifier"]("addr"))("28:1")
-        asm_call = pyparsing.Group(pyparsing.Regex("CALL")("cmd") + existing_defs["literal_or_identifier"]("addr"))("29:1")
-        asm_retla = pyparsing.Group(pyparsing.Regex("RETLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("30:1")
-        asm_return = pyparsing.Group(pyparsing.Regex("RETURN")("cmd"))("31:0")
-        asm_addrpc = pyparsing.Group(pyparsing.Regex("ADDRPC")("cmd") + existing_defs["literal_or_identifier"]("value"))("32:1")
-        asm_statement = pyparsing.Group(asm_halt ^ asm_nop ^ asm_speed ^ asm_copylr ^ asm_copyla ^ asm_copyar ^ asm_copyra ^ asm_copyrr ^ \
-                  asm_addla ^ asm_addra ^ asm_subla ^ asm_subra ^ asm_andla ^ asm_andra ^ asm_subla ^ asm_subra ^ \
-                  asm_andla ^ asm_andra ^ asm_orla ^ asm_orra ^ asm_xorla ^ asm_xorra ^ asm_decr ^ asm_incr ^ \
-                  asm_decrjz ^ asm_incrjz ^ asm_shiftrl ^ asm_shiftrr ^ asm_cbr ^ asm_sbr ^ asm_bcrsc ^ asm_bcrss ^ \
-                  asm_jump ^ asm_call ^ asm_retla ^ asm_return ^ asm_addrpc)
-
-        return asm_statement
+            * Each succesfully parsed instruction is tagged by its opcode:num operands.
+            * Mnemonics that share an opcode (aliases) are alternatives of the same instruction.
+        """
+        import pyparsing
+        mnemonics_by_opcode = {}
+        for a_mnemonic, (an_opcode, operands) in cls.get_asm_mnemonics().items():
+            mnemonics_by_opcode.setdefault((an_opcode, operands), []).append(a_mnemonic)
+        asm_instructions = []
+        for (an_opcode, operands), mnemonics in sorted(mnemonics_by_opcode.items()):
+            an_instruction = pyparsing.Regex("|".join(mnemonics))("cmd")
+            for an_operand in operands:
+                an_instruction = an_instruction + existing_defs["literal_or_identifier"](an_operand)
+            asm_instructions.append(pyparsing.Group(an_instruction)(f"{an_opcode}:{len(operands)}"))
+        return pyparsing.Group(pyparsing.Or(asm_instructions))
 
 
 class Digirule2U(Digirule):
     """
     Implements the Digirule 2U model.
     """
+    _CALLBACK_ATTRIBUTES = Digirule._CALLBACK_ATTRIBUTES + ("_comout_callback", "_comin_callback", 
+                                                            "_pin_in_callback", "_pin_out_callback")
+    # RANDA
+    _NONDETERMINISTIC_OPCODES = frozenset((47,))
+    # See Digirule._BLOCK_TEMPLATES.
+    # Instructions that go through an indirect address flush the status register to memory before they access it.
+    _BLOCK_TEMPLATES = {1:Digirule._BLOCK_TEMPLATES[1],
+                        2:Digirule._BLOCK_TEMPLATES[2],
+                        3:("vm._ppc = ppc = []", (), None),
+                        4:Digirule._BLOCK_TEMPLATES[4],
+                        5:Digirule._BLOCK_TEMPLATES[3],
+                        6:("mem[252] = st\n"
+                           "mem[mem[{1}]] = {0}\n"
+                           "st = mem[252]\n"
+                           "st = (st | 1) if {0} == 0 else (st & 254)", (), "E"),
+                        7:Digirule._BLOCK_TEMPLATES[5],
+                        8:("mem[252] = st\n"
+                           "mem[mem[{0}]] = acc\n"
+                           "st = mem[252]\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), "E"),
+                        9:Digirule._BLOCK_TEMPLATES[6],
+                       10:Digirule._BLOCK_TEMPLATES[7],
+                       11:("mem[252] = st\n"
+                           "v = mem[{0}]\n"
+                           "mem[mem[{1}]] = v\n"
+                           "st = mem[252]\n"
+                           "st = (st | 1) if v == 0 else (st & 254)", (), "E"),
+                       12:("mem[252] = st\n"
+                           "acc = mem[mem[{0}]]\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)", (), None),
+                       13:("mem[252] = st\n"
+                           "v = mem[mem[{0}]]\n"
+                           "mem[{1}] = v\n"
+                           "st = (st | 1) if v == 0 else (st & 254)", (1,), None),
+                       14:("mem[252] = st\n"
+                           "v = mem[mem[{0}]]\n"
+                           "mem[mem[{1}]] = v\n"
+                           "st = mem[252]\n"
+                           "st = (st | 1) if v == 0 else (st & 254)", (), "E"),
+                       15:("v = mem[{0}]\n"
+                           "mem[{0}] = acc\n"
+                           "acc = v", (0,), None),
+                       16:("v = mem[{0}]\n"
+                           "mem[{0}] = mem[{1}]\n"
+                           "mem[{1}] = v", (0, 1), None),
+                       17:("v = acc + {0} + ((st & 2) >> 1)\n"
+                           "acc = v & 255\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)\n"
+                           "st = (st | 2) if v > 255 else (st & 253)", (), None),
+                       18:("v = acc + mem[{0}] + ((st & 2) >> 1)\n"
+                           "acc = v & 255\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)\n"
+                           "st = (st | 2) if v > 255 else (st & 253)", (), None),
+                       19:("v = acc - {0} - ((st & 2) >> 1)\n"
+                           "acc = v & 255\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)\n"
+                           "st = (st | 2) if v < 0 else (st & 253)", (), None),
+                       20:("v = acc - mem[{0}] - ((st & 2) >> 1)\n"
+                           "acc = v & 255\n"
+                           "st = (st | 1) if acc == 0 else (st & 254)\n"
+                           "st = (st | 2) if v < 0 else (st & 253)", (), None),
+                       21:("v = mem[{0}] * mem[{1}]\n"
+                           "mem[{0}] = v & 255\n"
+                           "st = (st | 2) if v > 255 else (st & 253)\n"
+                           "st = (st | 1) if (v & 255) == 0 else (st & 254)", (0,), None),
+                       23:Digirule._BLOCK_TEMPLATES[12],
+                       24:Digirule._BLOCK_TEMPLATES[13],
+                       25:Digirule._BLOCK_TEMPLATES[14],
+                       26:Digirule._BLOCK_TEMPLATES[15],
+                       27:Digirule._BLOCK_TEMPLATES[16],
+                       28:Digirule._BLOCK_TEMPLATES[17],
+                       29:Digirule._BLOCK_TEMPLATES[18],
+                       30:Digirule._BLOCK_TEMPLATES[19],
+                       31:Digirule._BLOCK_TEMPLATES[20],
+                       32:Digirule._BLOCK_TEMPLATES[21],
+                       33:Digirule._BLOCK_TEMPLATES[22],
+                       34:Digirule._BLOCK_TEMPLATES[23],
+                       35:Digirule._BLOCK_TEMPLATES[24],
+                       36:Digirule._BLOCK_TEMPLATES[25],
+                       37:("mem[{1}] ^= (1 << {0}) & 255", (1,), None),
+                       38:Digirule._BLOCK_TEMPLATES[26],
+                       39:Digirule._BLOCK_TEMPLATES[27],
+                       40:Digirule._BLOCK_TEMPLATES[28],
+                       41:("pc = mem[{0}]", (), "T"),
+                       42:Digirule._BLOCK_TEMPLATES[29],
+                       43:("ppc.append({pc})\n"
+                           "pc = mem[{0}]", (), "T"),
+                       44:Digirule._BLOCK_TEMPLATES[31],
+                       45:Digirule._BLOCK_TEMPLATES[30],
+                       46:Digirule._BLOCK_TEMPLATES[32],
+                       47:("acc = randint(0, 255)", (), None),
+                      194:("st &= 254", (), None)}
     
     def __init__(self):
         super().__init__()
 
         # Add the new commands
-        self._ins_lookup.update({3:self._initsp,
-                                 4:self._copyla,
-                                 5:self._copylr,
-                                 6:self._copyli,
-                                 7:self._copyar,
-                                 8:self._copyai,
-                                 9:self._copyra,
-                                10:self._copyrr,
-                                11:self._copyri,
-                                12:self._copyia,
-                                13:self._copyir,
-                                14:self._copyii,
-                                15:self._swapra,
-                                16:self._swaprr,
-                                17:self._addla,
-                                18:self._addra,
-                                19:self._subla,
-                                20:self._subra,
-                                21:self._mul,
-                                22:self._div,
-                                23:self._andla,
-                                24:self._andra,
-                                25:self._orla,
-                                26:self._orra,
-                                27:self._xorla,
-                                28:self._xorra,
-                                29:self._decr,
-                                30:self._incr,
-                                31:self._decrjz,
-                                32:self._incrjz,
-                                33:self._shiftrl,
-                                34:self._shiftrr,
-                                35:self._cbr,
-                                36:self._sbr,
-                                37:self._bchg,
-                                38:self._bcrsc,
-                                39:self._bcrss,
-                                40:self._jump,
-                                41:self._jumpi,
-                                42:self._call,
-                                43:self._calli,
-                                44:self._return,
-                                45:self._retla,
-                                46:self._addrpc,
-                                47:self._randa,
-                               192:self._comout,
-                               193:self._comin,
-                               194:self._comrdy,
-                               196:self._pinout,
-                               197:self._pinin,
-                               198:self._pindir})
+        self._ins_lookup.update({3:(self._initsp, 0),
+                                 4:(self._copyla, 1),
+                                 5:(self._copylr, 2),
+                                 6:(self._copyli, 2),
+                                 7:(self._copyar, 1),
+                                 8:(self._copyai, 1),
+                                 9:(self._copyra, 1),
+                                10:(self._copyrr, 2),
+                                11:(self._copyri, 2),
+                                12:(self._copyia, 1),
+                                13:(self._copyir, 2),
+                                14:(self._copyii, 2),
+                                15:(self._swapra, 1),
+                                16:(self._swaprr, 2),
+                                17:(self._addla, 1),
+                                18:(self._addra, 1),
+                                19:(self._subla, 1),
+                                20:(self._subra, 1),
+                                21:(self._mul, 2),
+                                22:(self._div, 2),
+                                23:(self._andla, 1),
+                                24:(self._andra, 1),
+                                25:(self._orla, 1),
+                                26:(self._orra, 1),
+                                27:(self._xorla, 1),
+                                28:(self._xorra, 1),
+                                29:(self._decr, 1),
+                                30:(self._incr, 1),
+                                31:(self._decrjz, 1),
+                                32:(self._incrjz, 1),
+                                33:(self._shiftrl, 1),
+                                34:(self._shiftrr, 1),
+                                35:(self._cbr, 2),
+                                36:(self._sbr, 2),
+                                37:(self._bchg, 2),
+                                38:(self._bcrsc, 2),
+                                39:(self._bcrss, 2),
+                                40:(self._jump, 1),
+                                41:(self._jumpi, 1),
+                                42:(self._call, 1),
+                                43:(self._calli, 1),
+                                44:(self._return, 0),
+                                45:(self._retla, 1),
+                                46:(self._addrpc, 1),
+                                47:(self._randa, 0),
+                               192:(self._comout, 0),
+                               193:(self._comin, 0),
+                               194:(self._comrdy, 0),
+                               196:(self._pinout, 1),
+                               197:(self._pinin, 1),
+                               198:(self._pindir, 1)})
                                
         self._comout_callback = None
         self._comin_callback = None
@@ -628,78 +1261,69 @@ class Digirule2U(Digirule):
     def _initsp(self):
         self._ppc = []
         
-    def _bchg(self):
+    def _bchg(self, bit_to_toggle, addr):
         # Bit toggling
-        bit_to_toggle = self._read_next()
-        addr = self._read_next()
         new_value = (self._rd_mem(addr) ^ (1<<bit_to_toggle)) & 0xFF
         self._wr_mem(addr, new_value)  
         
     def _randa(self):
         self._acc = random.randint(0,255)
         
-    def _swapra(self):
-        mem_addr = self._read_next()
+    def _swapra(self, mem_addr):
         mem_val = self._rd_mem(mem_addr)
         current_acc_value = self._acc
         self._acc = mem_val
         self._wr_mem(mem_addr, current_acc_value)
 
-    def _swaprr(self):
-        mem_addr_left = self._read_next()
-        mem_addr_right = self._read_next()
+    def _swaprr(self, mem_addr_left, mem_addr_right):
         mem_val_left =  self._rd_mem(mem_addr_left)
         mem_val_right = self._rd_mem(mem_addr_right)
         self._wr_mem(mem_addr_left, mem_val_right)
         self._wr_mem(mem_addr_right, mem_val_left)
         
-    def _addla(self):
-        new_value = self._get_acc_value() + self._read_next()
+    def _addla(self, literal):
+        new_value = self._get_acc_value() + literal
         if self._get_status_reg(self._CARRY_FLAG_BIT):
             new_value+=1
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
         self._set_status_reg(self._CARRY_FLAG_BIT, (new_value > 255 or new_value < 0))
 
-    def _addra(self):
-        new_value = self._get_acc_value() + self._rd_mem(self._read_next())
+    def _addra(self, addr):
+        new_value = self._get_acc_value() + self._rd_mem(addr)
         if self._get_status_reg(self._CARRY_FLAG_BIT):
             new_value+=1
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
         self._set_status_reg(self._CARRY_FLAG_BIT, (new_value > 255 or new_value < 0))
 
-    def _subla(self):
-        new_value = self._get_acc_value() - self._read_next()
+    def _subla(self, literal):
+        new_value = self._get_acc_value() - literal
         if self._get_status_reg(self._CARRY_FLAG_BIT):
             new_value-=1
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
         self._set_status_reg(self._CARRY_FLAG_BIT, (new_value > 255 or new_value < 0))
 
-    def _subra(self):
-        new_value = self._get_acc_value() - self._rd_mem(self._read_next())
+    def _subra(self, addr):
+        new_value = self._get_acc_value() - self._rd_mem(addr)
         if self._get_status_reg(self._CARRY_FLAG_BIT):
             new_value-=1
         self._set_acc_value(new_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, self._acc==0)
         self._set_status_reg(self._CARRY_FLAG_BIT, (new_value > 255 or new_value < 0))
     
-    def _mul(self):
-        mem_addr_left = self._read_next()
+    def _mul(self, mem_addr_left, mem_addr_right):
         mem_val_left = self._rd_mem(mem_addr_left)
-        mem_addr_right = self._read_next()
         mem_val_right = self._rd_mem(mem_addr_right)
         product = mem_val_left * mem_val_right
         self._wr_mem(mem_addr_left,product & 0xFF)
         self._set_status_reg(self._CARRY_FLAG_BIT, product > 255)
         self._set_status_reg(self._ZERO_FLAG_BIT, (product & 0xFF) == 0)
         
-    def _div(self):
+    def _div(self, mem_addr_left, mem_addr_right):
         # TODO: MED, This can raise a divide by zero warning / exception too
-        mem_addr_left = self._read_next()
         mem_val_left = self._rd_mem(mem_addr_left)
-        mem_addr_right = self._read_next()
         mem_val_right = self._rd_mem(mem_addr_right)
         if mem_val_right == 0:
             # This is the default division by zero behaviour
@@ -710,51 +1334,39 @@ class Digirule2U(Digirule):
         self._set_status_reg(self._ZERO_FLAG_BIT, (div_res & 0xFF) == 0)
         self._set_status_reg(self._CARRY_FLAG_BIT, self._get_acc_value() == 0) 
         
-    def _copyli(self):
-        literal = self._read_next()
-        i_addr = self._read_next()
+    def _copyli(self, literal, i_addr):
         self._wr_mem(self._rd_mem(i_addr), literal)
         self._set_status_reg(self._ZERO_FLAG_BIT, literal == 0)
         
-    def _copyai(self):
-        i_addr = self._read_next()
+    def _copyai(self, i_addr):
         self._wr_mem(self._rd_mem(i_addr), self._get_acc_value())
         self._set_status_reg(self._ZERO_FLAG_BIT, self._get_acc_value() == 0)
         
-    def _copyia(self):
-        i_addr = self._read_next()
+    def _copyia(self, i_addr):
         self._set_acc_value(self._rd_mem(self._rd_mem(i_addr)))
         self._set_status_reg(self._ZERO_FLAG_BIT, self._get_acc_value() == 0)
 
-    def _copyri(self):
-        mem_addr = self._read_next()
+    def _copyri(self, mem_addr, i_addr):
         mem_addr_value = self._rd_mem(mem_addr)
-        i_addr = self._read_next()
         #self._wr_mem(self._rd_mem(self._rd_mem(i_addr)), mem_addr_value)
         self._wr_mem(self._rd_mem(i_addr), mem_addr_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, mem_addr_value == 0) 
         
-    def _copyir(self):
-        i_addr = self._read_next()
-        mem_addr = self._read_next()
+    def _copyir(self, i_addr, mem_addr):
         i_addr_value = self._rd_mem(self._rd_mem(i_addr))
         self._wr_mem(mem_addr,i_addr_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, i_addr_value == 0)
     
-    def _copyii(self):
-        i_addr_l = self._read_next()
-        i_addr_r = self._read_next()
+    def _copyii(self, i_addr_l, i_addr_r):
         i_addr_l_value = self._rd_mem(self._rd_mem(i_addr_l))
         self._wr_mem(self._rd_mem(i_addr_r), i_addr_l_value)
         self._set_status_reg(self._ZERO_FLAG_BIT, i_addr_l_value == 0)
         
-    def _calli(self):
+    def _calli(self, i_addr):
         self._push_pc()
-        i_addr = self._read_next()
         self._pc = self._rd_mem(i_addr)
         
-    def _jumpi(self):
-        i_addr = self._read_next()
+    def _jumpi(self, i_addr):
         self._pc = self._rd_mem(i_addr)
         
     def _comout(self):
@@ -771,10 +1383,9 @@ class Digirule2U(Digirule):
         self._set_status_reg(self._ZERO_FLAG_BIT, 0)
         
     # TODO: MID, Reduce code duplication in _comin, _comout
-    def _pinout(self):
+    def _pinout(self, n_pin):
         # Send ACC n bit to n_pin.
         # The n_pin is a mask
-        n_pin = self._read_next()
         if n_pin>=1 and n_pin<=3:
             if self._pin_out_callback is not None:
                 if n_pin != 3:
@@ -795,10 +1406,9 @@ class Digirule2U(Digirule):
                     self._pin_out_callback(48 + ((self._get_acc_value() & 2)>>1))
                     self._pin_out_callback.label = self._pin_out_callback.label.replace(pin_label,"")
         
-    def _pinin(self):
+    def _pinin(self, n_pin):
         # Read ACC n bit to n_pin (1-3)
         # The n_pin is a mask if n_pin<3. If n_pin is 3 then the operation is carried out on both pins
-        n_pin = self._read_next()
         if n_pin>=1 and n_pin<=3:
             if self._pin_in_callback is not None:
                 if n_pin != 3:
@@ -820,91 +1430,80 @@ class Digirule2U(Digirule):
                     self._set_acc_value((self._get_acc_value() & ~2) | (self._pin_in_callback()<<1))
                     self._pin_in_callback.label = self._pin_in_callback.label.replace(pin_label,"")
         
-    def _pindir(self):
+    def _pindir(self, n_pin):
         # Set the pin I/O direction
         # The n_pin is a mask
-        n_pin = self._read_next()
-        
+        pass
 
     @staticmethod
-    def get_asm_statement_def(existing_defs):
+    def get_asm_mnemonics():
         """
-        Returns the assembly parser that the Digirule2U understands.
+        Returns the mnemonics that the Digirule2U understands.
         
         Notes:
             
-            * See inline comments for specification of the grammar
-        """
-        # NOTE: The instruction set on the 2U is so different that it is more practical to 
-        #       write the whole definition as if from scratch.
-        
-        # Digirule 2U ASM instructions
-        asm_halt = pyparsing.Group(pyparsing.Regex(r"HALT")("cmd"))("0:0")
-        asm_nop = pyparsing.Group(pyparsing.Regex(r"NOP")("cmd"))("1:0")
-        asm_speed = pyparsing.Group(pyparsing.Regex(r"SPEED")("cmd") + existing_defs["literal_or_identifier"]("value"))("2:1")
-        asm_initsp = pyparsing.Group(pyparsing.Regex(r"INITSP")("cmd"))("3:0")
-        asm_copyla = pyparsing.Group(pyparsing.Regex(r"COPYLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("4:1")
-        asm_copylr = pyparsing.Group(pyparsing.Regex("COPYLR")("cmd") + existing_defs["literal_or_identifier"]("value") + existing_defs["literal_or_identifier"]("addr"))("5:2")
-        asm_copyli = pyparsing.Group(pyparsing.Regex("COPYLI")("cmd") + existing_defs["literal_or_identifier"]("value") + existing_defs["literal_or_identifier"]("iaddr"))("6:2")
-        asm_copyar = pyparsing.Group(pyparsing.Regex("COPYAR")("cmd") + existing_defs["literal_or_identifier"]("addr"))("7:1")
-        asm_copyai = pyparsing.Group(pyparsing.Regex("COPYAI")("cmd") + existing_defs["literal_or_identifier"]("iaddr"))("8:1")
-        asm_copyra = pyparsing.Group(pyparsing.Regex("COPYRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("9:1")
-        asm_copyrr = pyparsing.Group(pyparsing.Regex("COPYRR")("cmd") + existing_defs["literal_or_identifier"]("addr_from") + existing_defs["literal_or_identifier"]("addr_to"))("10:2")
-        asm_copyri = pyparsing.Group(pyparsing.Regex("COPYRI")("cmd") + existing_defs["literal_or_identifier"]("addr_from") + existing_defs["literal_or_identifier"]("iaddr_to"))("11:2")
-        asm_copyia = pyparsing.Group(pyparsing.Regex("COPYIA")("cmd") + existing_defs["literal_or_identifier"]("iaddr_from"))("12:1")
-        asm_copyir = pyparsing.Group(pyparsing.Regex("COPYIR")("cmd") + existing_defs["literal_or_identifier"]("iaddr_from") + existing_defs["literal_or_identifier"]("addr_to"))("13:2")
-        asm_copyii = pyparsing.Group(pyparsing.Regex("COPYII")("cmd") + existing_defs["literal_or_identifier"]("iaddr_from") + existing_defs["literal_or_identifier"]("iaddr_to"))("14:2")
-        asm_swapra = pyparsing.Group(pyparsing.Regex("SWAPRA")("cmd") + existing_defs["literal_or_identifier"]("addr_from"))("15:1")
-        asm_swaprr = pyparsing.Group(pyparsing.Regex("SWAPRR")("cmd") + existing_defs["literal_or_identifier"]("addr_from") + existing_defs["literal_or_identifier"]("addr_to"))("16:2")
-        asm_addla = pyparsing.Group(pyparsing.Regex("ADDLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("17:1")
-        asm_addra = pyparsing.Group(pyparsing.Regex("ADDRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("18:1")
-        asm_subla = pyparsing.Group(pyparsing.Regex("SUBLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("19:1")
-        asm_subra = pyparsing.Group(pyparsing.Regex("SUBRA")("cmd") + existing_defs["literal_or_identifier"]("value"))("20:1")
-        asm_mul = pyparsing.Group(pyparsing.Regex("MUL")("cmd") + existing_defs["literal_or_identifier"]("addr_left") + existing_defs["literal_or_identifier"]("addr_right"))("21:2")
-        asm_div = pyparsing.Group(pyparsing.Regex("DIV")("cmd") + existing_defs["literal_or_identifier"]("addr_left") + existing_defs["literal_or_identifier"]("addr_right"))("22:2")
-        asm_andla = pyparsing.Group(pyparsing.Regex("ANDLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("23:1")
-        asm_andra = pyparsing.Group(pyparsing.Regex("ANDRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("24:1")
-        asm_orla = pyparsing.Group(pyparsing.Regex("ORLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("25:1")
-        asm_orra = pyparsing.Group(pyparsing.Regex("ORRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("26:1")
-        asm_xorla = pyparsing.Group(pyparsing.Regex("XORLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("27:1")
-        asm_xorra = pyparsing.Group(pyparsing.Regex("XORRA")("cmd") + existing_defs["literal_or_identifier"]("addr"))("28:1")
-        asm_decr = pyparsing.Group(pyparsing.Regex("DECR")("cmd") + existing_defs["literal_or_identifier"]("addr"))("29:1")
-        asm_incr = pyparsing.Group(pyparsing.Regex("INCR")("cmd") + existing_defs["literal_or_identifier"]("addr"))("30:1")
-        asm_decrjz = pyparsing.Group(pyparsing.Regex("DECRJZ")("cmd") + existing_defs["literal_or_identifier"]("addr"))("31:1")
-        asm_incrjz = pyparsing.Group(pyparsing.Regex("INCRJZ")("cmd") + existing_defs["literal_or_identifier"]("addr"))("32:1")
-        asm_shiftrl = pyparsing.Group(pyparsing.Regex("SHIFTRL")("cmd") + existing_defs["literal_or_identifier"]("addr"))("33:1")
-        asm_shiftrr = pyparsing.Group(pyparsing.Regex("SHIFTRR")("cmd") + existing_defs["literal_or_identifier"]("addr"))("34:1")
-                
-        asm_cbr = pyparsing.Group(pyparsing.Regex("CBR|BCLR")("cmd") + existing_defs["literal_or_identifier"]("n_bit") + existing_defs["literal_or_identifier"]("addr"))("35:2")
-        asm_sbr = pyparsing.Group(pyparsing.Regex("SBR|BSET")("cmd") + existing_defs["literal_or_identifier"]("n_bit") + existing_defs["literal_or_identifier"]("addr"))("36:2")
-        asm_bchg = pyparsing.Group(pyparsing.Regex("BCHG")("cmd") + existing_defs["literal_or_identifier"]("n_bit") + existing_defs["literal_or_identifier"]("addr"))("37:2")
-        
-        asm_bcrsc = pyparsing.Group(pyparsing.Regex("BCRSC|BTSTSC")("cmd") + existing_defs["literal_or_identifier"]("n_bit") + existing_defs["literal_or_identifier"]("addr"))("38:2")
-        asm_bcrss = pyparsing.Group(pyparsing.Regex("BCRSS|BTSTSS")("cmd") + existing_defs["literal_or_identifier"]("n_bit") + existing_defs["literal_or_identifier"]("addr"))("39:2")
-        asm_jump = pyparsing.Group(pyparsing.Regex("JUMP")("cmd") + existing_defs["literal_or_identifier"]("addr"))("40:1")
-        asm_jumpi = pyparsing.Group(pyparsing.Regex("JUMPI")("cmd") + existing_defs["literal_or_identifier"]("iaddr"))("41:1")
-        asm_call = pyparsing.Group(pyparsing.Regex("CALL")("cmd") + existing_defs["literal_or_identifier"]("addr"))("42:1")
-        asm_calli = pyparsing.Group(pyparsing.Regex("CALLI")("cmd") + existing_defs["literal_or_identifier"]("iaddr"))("43:1")
-        asm_return = pyparsing.Group(pyparsing.Regex("RETURN")("cmd"))("44:0")
-        asm_retla = pyparsing.Group(pyparsing.Regex("RETLA")("cmd") + existing_defs["literal_or_identifier"]("value"))("45:1")
-        asm_addrpc = pyparsing.Group(pyparsing.Regex("ADDRPC")("cmd") + existing_defs["literal_or_identifier"]("value"))("46:1")
-        asm_randa = pyparsing.Group(pyparsing.Regex("RANDA")("cmd"))("47:0")
-        asm_comout = pyparsing.Group(pyparsing.Regex("COMOUT")("cmd"))("192:0")
-        asm_comin = pyparsing.Group(pyparsing.Regex("COMIN")("cmd"))("193:0")
-        asm_comrdy = pyparsing.Group(pyparsing.Regex("COMRDY")("cmd"))("194:0")
-        asm_pinout = pyparsing.Group(pyparsing.Regex("PINOUT")("cmd") + existing_defs["literal_or_identifier"]("value"))("196:1")
-        asm_pinin = pyparsing.Group(pyparsing.Regex("PININ")("cmd") + existing_defs["literal_or_identifier"]("value"))("197:1")
-        asm_pindir = pyparsing.Group(pyparsing.Regex("PINDIR")("cmd") + existing_defs["literal_or_identifier"]("value"))("198:1")
-        
-        asm_statement = pyparsing.Group(asm_halt ^ asm_nop ^ asm_speed ^ asm_initsp ^ asm_copyla ^ asm_copylr ^ \
-                                        asm_copyli ^ asm_copyar ^ asm_copyai ^ asm_copyra ^ asm_copyrr ^ asm_copyri ^ \
-                                        asm_copyia ^ asm_copyir ^ asm_copyii ^ asm_swapra ^ asm_swaprr ^ asm_addla ^ \
-                                        asm_addra ^ asm_subla ^ asm_subra ^ asm_mul ^ asm_div ^ asm_andla ^ \
-                                        asm_andra ^ asm_orla ^ asm_orra ^ asm_xorla ^ asm_xorra ^ asm_decr ^ \
-                                        asm_incr ^ asm_decrjz ^ asm_incrjz ^ asm_shiftrl ^ asm_shiftrr ^ asm_cbr ^ \
-                                        asm_sbr ^ asm_bchg ^ asm_bcrsc ^ asm_bcrss ^ \
-                                        asm_jump ^ asm_jumpi ^ asm_call ^ asm_calli ^ asm_return ^ asm_retla ^ \
-                                        asm_addrpc ^ asm_randa ^ asm_comout ^ asm_comin ^ asm_comrdy ^ \
-                                        asm_pinout ^ asm_pinin ^ asm_pindir)
-
-        return asm_statement
+            * The instruction set on the 2U is so different that it is more practical to write the whole 
+              definition as if from scratch.
+            * CBR, SBR, BCRSC and BCRSS are also available under their 2U names (BCLR, BSET, BTSTSC, BTSTSS).
+        
+        :returns: Lookup of mnemonics to their opcode and the names of their operands.
+        :rtype: dict<str:tuple<int, tuple<str>>>
+        """
+        return {"HALT":(0, ()),
+                "NOP":(1, ()),
+                "SPEED":(2, ("value",)),
+                "INITSP":(3, ()),
+                "COPYLA":(4, ("value",)),
+                "COPYLR":(5, ("value", "addr")),
+                "COPYLI":(6, ("value", "iaddr")),
+                "COPYAR":(7, ("addr",)),
+                "COPYAI":(8, ("iaddr",)),
+                "COPYRA":(9, ("addr",)),
+                "COPYRR":(10, ("addr_from", "addr_to")),
+                "COPYRI":(11, ("addr_from", "iaddr_to")),
+                "COPYIA":(12, ("iaddr_from",)),
+                "COPYIR":(13, ("iaddr_from", "addr_to")),
+                "COPYII":(14, ("iaddr_from", "iaddr_to")),
+                "SWAPRA":(15, ("addr_from",)),
+                "SWAPRR":(16, ("addr_from", "addr_to")),
+                "ADDLA":(17, ("value",)),
+                "ADDRA":(18, ("addr",)),
+                "SUBLA":(19, ("value",)),
+                "SUBRA":(20, ("value",)),
+                "MUL":(21, ("addr_left", "addr_right")),
+                "DIV":(22, ("addr_left", "addr_right")),
+                "ANDLA":(23, ("value",)),
+                "ANDRA":(24, ("addr",)),
+                "ORLA":(25, ("value",)),
+                "ORRA":(26, ("addr",)),
+                "XORLA":(27, ("value",)),
+                "XORRA":(28, ("addr",)),
+                "DECR":(29, ("addr",)),
+                "INCR":(30, ("addr",)),
+                "DECRJZ":(31, ("addr",)),
+                "INCRJZ":(32, ("addr",)),
+                "SHIFTRL":(33, ("addr",)),
+                "SHIFTRR":(34, ("addr",)),
+                "CBR":(35, ("n_bit", "addr")),
+                "BCLR":(35, ("n_bit", "addr")),
+                "SBR":(36, ("n_bit", "addr")),
+                "BSET":(36, ("n_bit", "addr")),
+                "BCHG":(37, ("n_bit", "addr")),
+                "BCRSC":(38, ("n_bit", "addr")),
+                "BTSTSC":(38, ("n_bit", "addr")),
+                "BCRSS":(39, ("n_bit", "addr")),
+                "BTSTSS":(39, ("n_bit", "addr")),
+                "JUMP":(40, ("addr",)),
+                "JUMPI":(41, ("iaddr",)),
+                "CALL":(42, ("addr",)),
+                "CALLI":(43, ("iaddr",)),
+                "RETURN":(44, ()),
+                "RETLA":(45, ("value",)),
+                "ADDRPC":(46, ("value",)),
+                "RANDA":(47, ()),
+                "COMOUT":(192, ()),
+                "COMIN":(193, ()),
+                "COMRDY":(194, ()),
+                "PINOUT":(196, ("value",)),
+                "PININ":(197, ("value",)),
+                "PINDIR":(198, ("value",))}
@@ -0,0 +1,697 @@
+"""
+
+Lockstep simulation of many Digirule machines with NumPy.
+
+:author: Athanasios Anastasiou
+:date: Oct 2026
+"""
+import numpy
+from .digirule import Digirule, Digirule2U
+from .exceptions import (DgtoolsErrorOpcodeNotSupported, DgtoolsErrorProgramHalt, DgtoolsErrorOutOfMemory,
+                         DgtoolsErrorStackUnderflow)
+
+# Reasons a machine in a batch stops executing (see DigiruleBatch.halt_reason())
+HALT_RUNNING = 0
+HALT_PROGRAM = 1
+HALT_DIVISION_BY_ZERO = 2
+HALT_OPCODE_NOT_SUPPORTED = 3
+HALT_STACK_UNDERFLOW = 4
+HALT_OUT_OF_MEMORY = 5
+
+
+class DigiruleBatch:
+    """
+    Holds N Digirule 2A machines as NumPy arrays and executes one instruction on all of them per step.
+
+    Notes:
+        * Memory is an (N,256) uint8 array, the status register being its column 252. The program counter,
+          accumulator, speed setting and the program counter stack are vectors (or (N,depth) arrays) of N elements.
+        * At every step, the running machines are grouped by the opcode at their program counter and each group is
+          executed with masked vector operations, following exactly the semantics of the respective ``Digirule``
+          instruction handler (including the flags it sets and the order it reads and writes memory).
+        * A machine stops when its scalar counterpart would raise an exception. The reason is kept in ``halt_code``
+          and the state of the machine is left as the scalar model would leave it. The only difference is that
+          running off the end of memory (an ``IndexError`` in ``Digirule``) is reported as ``HALT_OUT_OF_MEMORY``,
+          with the program counter left at the instruction that could not be fetched.
+        * Button register streams simulate interactive mode: every read of the button register by a machine
+          consumes the next value of its stream (or 0 once the stream is exhausted).
+    """
+    # The scalar model the batch follows
+    _model = Digirule
+    # Opcode:name of the batch handler
+    _ins_handlers = {0:"_halt",
+                     1:"_nop",
+                     2:"_speed",
+                     3:"_copylr",
+                     4:"_copyla",
+                     5:"_copyar",
+                     6:"_copyra",
+                     7:"_copyrr",
+                     8:"_addla",
+                     9:"_addra",
+                    10:"_subla",
+                    11:"_subra",
+                    12:"_andla",
+                    13:"_andra",
+                    14:"_orla",
+                    15:"_orra",
+                    16:"_xorla",
+                    17:"_xorra",
+                    18:"_decr",
+                    19:"_incr",
+                    20:"_decrjz",
+                    21:"_incrjz",
+                    22:"_shiftrl",
+                    23:"_shiftrr",
+                    24:"_cbr",
+                    25:"_sbr",
+                    26:"_bcrsc",
+                    27:"_bcrss",
+                    28:"_jump",
+                    29:"_call",
+                    30:"_retla",
+                    31:"_return",
+                    32:"_addrpc"}
+
+    def __init__(self, n_machines, stack_depth=16, rng=None):
+        """
+        Initialisation
+
+        :param n_machines: The number of machines in the batch.
+        :type n_machines: int
+        :param stack_depth: Initial depth of the program counter stack. The stack grows as required.
+        :type stack_depth: int
+        :param rng: The random number generator to use for instructions that generate random numbers.
+        :type rng: numpy.random.Generator
+        """
+        if type(n_machines) is not int:
+            raise TypeError(f"Expected n_machines as int, received {type(n_machines)}")
+        if n_machines < 1:
+            raise ValueError(f"Expected n_machines>0, received {n_machines}")
+        if type(stack_depth) is not int:
+            raise TypeError(f"Expected stack_depth as int, received {type(stack_depth)}")
+
+        self._n_machines = n_machines
+        self._rng = rng if rng is not None else numpy.random.default_rng()
+        # Mirror the memory map of the scalar model
+        a_machine = self._model()
+        self._status_reg_ptr = a_machine._status_reg_ptr
+        self._bt_reg_ptr = a_machine._bt_reg_ptr
+        self._ZERO_FLAG_BIT = a_machine._ZERO_FLAG_BIT
+        self._CARRY_FLAG_BIT = a_machine._CARRY_FLAG_BIT
+        # Number of operands per opcode (-1 if the opcode is not understood)
+        self._num_operands = numpy.full(256, -1, dtype=numpy.intp)
+        for an_opcode, a_handler in a_machine._ins_lookup.items():
+            self._num_operands[an_opcode] = a_handler[1]
+        self._handlers = {an_opcode:getattr(self, a_handler) for an_opcode, a_handler in self._ins_handlers.items()}
+        if set(self._handlers) != set(a_machine._ins_lookup):
+            raise NotImplementedError(f"{type(self).__name__} does not implement the complete instruction set "
+                                      f"of {self._model.__name__}")
+        # Machine state
+        self._mem = numpy.zeros((n_machines, 256), dtype=numpy.uint8)
+        self._pc = numpy.zeros(n_machines, dtype=numpy.intp)
+        self._acc = numpy.zeros(n_machines, dtype=numpy.intp)
+        self._speed_setting = numpy.zeros(n_machines, dtype=numpy.intp)
+        self._ppc = numpy.zeros((n_machines, max(stack_depth, 1)), dtype=numpy.intp)
+        self._sp = numpy.zeros(n_machines, dtype=numpy.intp)
+        self._halt_code = numpy.zeros(n_machines, dtype=numpy.uint8)
+        self._n_steps = numpy.zeros(n_machines, dtype=numpy.intp)
+        # Button register streams as an (N,L) array, the length of each stream and the position in it.
+        self._bt_streams = None
+        self._bt_stream_len = None
+        self._bt_stream_pos = None
+
+    @property
+    def n_machines(self):
+        return self._n_machines
+
+    @property
+    def mem(self):
+        return self._mem
+
+    @property
+    def pc(self):
+        return self._pc
+
+    @property
+    def acc(self):
+        return self._acc
+
+    @property
+    def status_reg(self):
+        return self._mem[:, self._status_reg_ptr]
+
+    @property
+    def speed(self):
+        return self._speed_setting
+
+    @property
+    def halt_code(self):
+        return self._halt_code
+
+    @property
+    def n_steps(self):
+        return self._n_steps
+
+    @property
+    def running(self):
+        return self._halt_code == HALT_RUNNING
+
+    def load_program(self, a_program):
+        """
+        Loads the same program to every machine in the batch.
+
+        :param a_program: A program of (most commonly) 256 values.
+        :type a_program: list<int> or bytes-like
+        """
+        if len(a_program) > 256:
+            raise DgtoolsErrorOutOfMemory(f"Expected length of program to be at most 256, received {len(a_program)}")
+        self._mem[:, :len(a_program)] = numpy.asarray(a_program, dtype=numpy.intp) & 0xFF
+        return self
+
+    @staticmethod
+    def _streams_to_array(streams, n_machines):
+        """
+        Packs one stream of uint8 per machine into an (N,L) array and a vector of stream lengths.
+        """
+        if len(streams) != n_machines:
+            raise ValueError(f"Expected {n_machines} streams, received {len(streams)}")
+        stream_len = numpy.array([len(a_stream) for a_stream in streams], dtype=numpy.intp)
+        stream_array = numpy.zeros((n_machines, max(int(stream_len.max()), 1)), dtype=numpy.uint8)
+        for k, a_stream in enumerate(streams):
+            stream_array[k, :stream_len[k]] = numpy.asarray(a_stream, dtype=numpy.intp) & 0xFF
+        return stream_array, stream_len
+
+    @staticmethod
+    def _next_from_stream(rows, stream_array, stream_len, stream_pos):
+        """
+        Returns the next value of the stream of each machine in rows (0 if exhausted) and advances the streams.
+        """
+        pos = stream_pos[rows]
+        available = pos < stream_len[rows]
+        values = numpy.zeros(len(rows), dtype=numpy.intp)
+        values[available] = stream_array[rows[available], pos[available]]
+        stream_pos[rows] = pos + 1
+        return values
+
+    def set_button_streams(self, streams):
+        """
+        Puts every machine in interactive mode, with its button register fed from a stream of values.
+
+        :param streams: One sequence of uint8 per machine.
+        :type streams: list<bytes-like or list<int>>
+        """
+        self._bt_streams, self._bt_stream_len = self._streams_to_array(streams, self._n_machines)
+        self._bt_stream_pos = numpy.zeros(self._n_machines, dtype=numpy.intp)
+        return self
+
+    def clear_callbacks(self):
+        """
+        Takes every machine out of interactive mode.
+        """
+        self._bt_streams = None
+        self._bt_stream_len = None
+        self._bt_stream_pos = None
+        return self
+
+    def halt_reason(self, k):
+        """
+        Returns the exception that the scalar model would have raised when machine k stopped.
+
+        :param k: The index of a machine in the batch.
+        :type k: int
+        :returns: The halt reason or None if machine k is still running.
+        :rtype: DgtoolsError
+        """
+        code = self._halt_code[k]
+        if code == HALT_PROGRAM:
+            return DgtoolsErrorProgramHalt("Program terminated at HALT instruction.")
+        if code == HALT_DIVISION_BY_ZERO:
+            return DgtoolsErrorProgramHalt("Division by zero.")
+        if code == HALT_OPCODE_NOT_SUPPORTED:
+            return DgtoolsErrorOpcodeNotSupported(f"Opcode {self._mem[k, self._pc[k] - 1]} not understood")
+        if code == HALT_STACK_UNDERFLOW:
+            return DgtoolsErrorStackUnderflow("Program stack underflow.")
+        if code == HALT_OUT_OF_MEMORY:
+            return DgtoolsErrorOutOfMemory(f"Program counter out of memory at 0x{self._pc[k]:X}.")
+        return None
+
+    def get_machine(self, k):
+        """
+        Returns a scalar model with the state of machine k.
+
+        Notes:
+            * Callbacks are not transferred.
+
+        :param k: The index of a machine in the batch.
+        :type k: int
+        :rtype: Digirule
+        """
+        machine = self._model()
+        machine._mem[:] = self._mem[k].tobytes()
+        machine._pc = int(self._pc[k])
+        machine._acc = int(self._acc[k])
+        machine._speed_setting = int(self._speed_setting[k])
+        machine._ppc = self._ppc[k, :self._sp[k]].tolist()
+        return machine
+
+    def run(self, max_n=2500):
+        """
+        Executes up to max_n lockstep steps, or until every machine has stopped.
+
+        :param max_n: Maximum number of instructions to execute.
+        :type max_n: int
+        :returns: The number of instructions executed by each machine (including the one that stopped it).
+        :rtype: numpy.ndarray
+        """
+        if type(max_n) is not int:
+            raise TypeError(f"Expected max_n as int, received {type(max_n)}")
+
+        n = 0
+        while n < max_n and self.step() > 0:
+            n += 1
+        return self._n_steps
+
+    def step(self):
+        """
+        Executes one instruction on every running machine.
+
+        :returns: The number of machines that executed an instruction.
+        :rtype: int
+        """
+        rows = numpy.flatnonzero(self._halt_code == HALT_RUNNING)
+        n_running = len(rows)
+        if n_running == 0:
+            return 0
+        self._n_steps[rows] += 1
+        # Fetch...
+        pc = self._pc[rows]
+        out_of_memory = pc > 255
+        if out_of_memory.any():
+            self._halt_code[rows[out_of_memory]] = HALT_OUT_OF_MEMORY
+            rows, pc = rows[~out_of_memory], pc[~out_of_memory]
+        opcode = self._rd(rows, pc)
+        # Decode...
+        num_operands = self._num_operands[opcode]
+        not_understood = num_operands < 0
+        if not_understood.any():
+            self._pc[rows[not_understood]] = pc[not_understood] + 1
+            self._halt_code[rows[not_understood]] = HALT_OPCODE_NOT_SUPPORTED
+        out_of_memory = pc + num_operands > 255
+        if out_of_memory.any():
+            self._halt_code[rows[out_of_memory]] = HALT_OUT_OF_MEMORY
+        valid = ~(not_understood | out_of_memory)
+        rows, pc, opcode, num_operands = rows[valid], pc[valid], opcode[valid], num_operands[valid]
+        operand_0 = numpy.zeros(len(rows), dtype=numpy.intp)
+        operand_1 = numpy.zeros(len(rows), dtype=numpy.intp)
+        has_operand = num_operands > 0
+        operand_0[has_operand] = self._rd(rows[has_operand], pc[has_operand] + 1)
+        has_operand = num_operands > 1
+        operand_1[has_operand] = self._rd(rows[has_operand], pc[has_operand] + 2)
+        self._pc[rows] = pc + 1 + num_operands
+        # Execute, one group of machines per opcode
+        order = numpy.argsort(opcode, kind="stable")
+        sorted_opcode = opcode[order]
+        group_start = numpy.flatnonzero(numpy.diff(sorted_opcode)) + 1
+        for a_group in numpy.split(order, group_start):
+            if len(a_group):
+                self._handlers[int(opcode[a_group[0]])](rows[a_group], operand_0[a_group], operand_1[a_group])
+        return n_running
+
+    # Memory, flag and stack access
+    def _rd(self, rows, addrs):
+        if self._bt_streams is not None:
+            bt_read = addrs == self._bt_reg_ptr
+            if bt_read.any():
+                bt_rows = rows[bt_read]
+                self._mem[bt_rows, self._bt_reg_ptr] = self._next_from_stream(bt_rows, self._bt_streams,
+                                                                              self._bt_stream_len,
+                                                                              self._bt_stream_pos)
+        return self._mem[rows, addrs].astype(numpy.intp)
+
+    def _wr(self, rows, addrs, values):
+        self._mem[rows, addrs] = values & 0xFF
+
+    def _set_status_reg(self, rows, field_mask, value):
+        current_value = self._mem[rows, self._status_reg_ptr]
+        self._mem[rows, self._status_reg_ptr] = numpy.where(value, current_value | field_mask,
+                                                             current_value & (0xFF ^ field_mask))
+
+    def _get_status_reg(self, rows, field_mask):
+        return (self._mem[rows, self._status_reg_ptr] & field_mask).astype(bool).astype(numpy.intp)
+
+    def _push_pc(self, rows):
+        if (self._sp[rows] >= self._ppc.shape[1]).any():
+            self._ppc = numpy.hstack([self._ppc, numpy.zeros_like(self._ppc)])
+        self._ppc[rows, self._sp[rows]] = self._pc[rows]
+        self._sp[rows] += 1
+
+    def _pop_pc(self, rows):
+        underflow = self._sp[rows] == 0
+        self._halt_code[rows[underflow]] = HALT_STACK_UNDERFLOW
+        rows = rows[~underflow]
+        self._sp[rows] -= 1
+        self._pc[rows] = self._ppc[rows, self._sp[rows]]
+
+    @staticmethod
+    def _bit_mask(bit):
+        # Bits beyond the 8th never match a uint8 value, as in the scalar model.
+        return numpy.where(bit < 8, 1 << numpy.minimum(bit, 7), 0)
+
+    # Instruction handlers (rows, first operand, second operand)
+    def _halt(self, rows, a, b):
+        self._halt_code[rows] = HALT_PROGRAM
+
+    def _nop(self, rows, a, b):
+        pass
+
+    def _speed(self, rows, a, b):
+        self._speed_setting[rows] = a
+
+    def _copylr(self, rows, a, b):
+        self._wr(rows, b, a)
+
+    def _copyla(self, rows, a, b):
+        self._acc[rows] = a
+
+    def _copyar(self, rows, a, b):
+        self._wr(rows, a, self._acc[rows])
+
+    def _copyra(self, rows, a, b):
+        value = self._rd(rows, a)
+        self._acc[rows] = value
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, value == 0)
+
+    def _copyrr(self, rows, a, b):
+        value = self._rd(rows, a)
+        self._wr(rows, b, value)
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, value == 0)
+
+    def _acc_op(self, rows, new_value, carry=None):
+        # Sets the accumulator, then the zero flag and optionally the carry flag.
+        self._acc[rows] = new_value & 0xFF
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, self._acc[rows] == 0)
+        if carry is not None:
+            self._set_status_reg(rows, self._CARRY_FLAG_BIT, carry)
+
+    def _addla(self, rows, a, b):
+        new_value = self._acc[rows] + a
+        self._acc_op(rows, new_value, new_value > 255)
+
+    def _addra(self, rows, a, b):
+        # The 2A does not set the carry flag on ADDRA.
+        self._acc_op(rows, self._acc[rows] + self._rd(rows, a))
+
+    def _subla(self, rows, a, b):
+        new_value = self._acc[rows] - a
+        self._acc_op(rows, new_value, new_value < 0)
+
+    def _subra(self, rows, a, b):
+        new_value = self._acc[rows] - self._rd(rows, a)
+        self._acc_op(rows, new_value, new_value < 0)
+
+    def _andla(self, rows, a, b):
+        self._acc_op(rows, self._acc[rows] & a)
+
+    def _andra(self, rows, a, b):
+        self._acc_op(rows, self._acc[rows] & self._rd(rows, a))
+
+    def _orla(self, rows, a, b):
+        self._acc_op(rows, self._acc[rows] | a)
+
+    def _orra(self, rows, a, b):
+        self._acc_op(rows, self._acc[rows] | self._rd(rows, a))
+
+    def _xorla(self, rows, a, b):
+        self._acc_op(rows, self._acc[rows] ^ a)
+
+    def _xorra(self, rows, a, b):
+        self._acc_op(rows, self._acc[rows] ^ self._rd(rows, a))
+
+    def _decr(self, rows, a, b):
+        value = (self._rd(rows, a) - 1) & 0xFF
+        self._wr(rows, a, value)
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, value == 0)
+        return value
+
+    def _incr(self, rows, a, b):
+        value = (self._rd(rows, a) + 1) & 0xFF
+        self._wr(rows, a, value)
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, value == 0)
+        return value
+
+    def _decrjz(self, rows, a, b):
+        self._pc[rows[self._decr(rows, a, b) == 0]] += 2
+
+    def _incrjz(self, rows, a, b):
+        self._pc[rows[self._incr(rows, a, b) == 0]] += 2
+
+    def _shiftrl(self, rows, a, b):
+        value = self._rd(rows, a)
+        self._wr(rows, a, ((value << 1) & 0xFF) | self._get_status_reg(rows, self._CARRY_FLAG_BIT))
+        self._set_status_reg(rows, self._CARRY_FLAG_BIT, (value & 128) == 128)
+
+    def _shiftrr(self, rows, a, b):
+        value = self._rd(rows, a)
+        self._wr(rows, a, (value >> 1) | (self._get_status_reg(rows, self._CARRY_FLAG_BIT) << 7))
+        self._set_status_reg(rows, self._CARRY_FLAG_BIT, (value & 1) == 1)
+
+    def _cbr(self, rows, a, b):
+        self._wr(rows, b, self._rd(rows, b) & (0xFF ^ self._bit_mask(a)))
+
+    def _sbr(self, rows, a, b):
+        self._wr(rows, b, self._rd(rows, b) | self._bit_mask(a))
+
+    def _bcrsc(self, rows, a, b):
+        bit_is_set = (self._rd(rows, b) & self._bit_mask(a)) != 0
+        self._pc[rows[~bit_is_set]] += 2
+
+    def _bcrss(self, rows, a, b):
+        bit_is_set = (self._rd(rows, b) & self._bit_mask(a)) != 0
+        self._pc[rows[bit_is_set]] += 2
+
+    def _jump(self, rows, a, b):
+        self._pc[rows] = a
+
+    def _call(self, rows, a, b):
+        self._push_pc(rows)
+        self._pc[rows] = a
+
+    def _retla(self, rows, a, b):
+        self._acc[rows] = a
+        self._pop_pc(rows)
+
+    def _return(self, rows, a, b):
+        self._pop_pc(rows)
+
+    def _addrpc(self, rows, a, b):
+        # The offset is relative to the address of the operand, not that of the next instruction.
+        self._pc[rows] += a - 1
+
+
+class Digirule2UBatch(DigiruleBatch):
+    """
+    Holds N Digirule 2U machines as NumPy arrays and executes one instruction on all of them per step.
+
+    Notes:
+        * COM input is fed from one stream per machine (see ``set_comin_streams()``). Without streams, COMIN leaves
+          the accumulator unchanged, as the scalar model does without a callback.
+        * COM output is collected per machine in ``comout``.
+        * There are no pin callbacks, so PINOUT, PININ and PINDIR do not change the state of a machine.
+    """
+    _model = Digirule2U
+    _ins_handlers = {**DigiruleBatch._ins_handlers,
+                     3:"_initsp",
+                     4:"_copyla",
+                     5:"_copylr",
+                     6:"_copyli",
+                     7:"_copyar",
+                     8:"_copyai",
+                     9:"_copyra",
+                    10:"_copyrr",
+                    11:"_copyri",
+                    12:"_copyia",
+                    13:"_copyir",
+                    14:"_copyii",
+                    15:"_swapra",
+                    16:"_swaprr",
+                    17:"_addla",
+                    18:"_addra",
+                    19:"_subla",
+                    20:"_subra",
+                    21:"_mul",
+                    22:"_div",
+                    23:"_andla",
+                    24:"_andra",
+                    25:"_orla",
+                    26:"_orra",
+                    27:"_xorla",
+                    28:"_xorra",
+                    29:"_decr",
+                    30:"_incr",
+                    31:"_decrjz",
+                    32:"_incrjz",
+                    33:"_shiftrl",
+                    34:"_shiftrr",
+                    35:"_cbr",
+                    36:"_sbr",
+                    37:"_bchg",
+                    38:"_bcrsc",
+                    39:"_bcrss",
+                    40:"_jump",
+                    41:"_jumpi",
+                    42:"_call",
+                    43:"_calli",
+                    44:"_return",
+                    45:"_retla",
+                    46:"_addrpc",
+                    47:"_randa",
+                   192:"_comout",
+                   193:"_comin",
+                   194:"_comrdy",
+                   196:"_pinout",
+                   197:"_pinin",
+                   198:"_pindir"}
+
+    def __init__(self, n_machines, stack_depth=16, rng=None):
+        super().__init__(n_machines, stack_depth, rng)
+        self._comin_streams = None
+        self._comin_stream_len = None
+        self._comin_stream_pos = None
+        self._comout = [bytearray() for k in range(n_machines)]
+
+    @property
+    def comout(self):
+        return self._comout
+
+    def set_comin_streams(self, streams):
+        """
+        Feeds the COM input of every machine from a stream of values.
+
+        :param streams: One sequence of uint8 per machine.
+        :type streams: list<bytes-like or list<int>>
+        """
+        self._comin_streams, self._comin_stream_len = self._streams_to_array(streams, self._n_machines)
+        self._comin_stream_pos = numpy.zeros(self._n_machines, dtype=numpy.intp)
+        return self
+
+    def clear_callbacks(self):
+        super().clear_callbacks()
+        self._comin_streams = None
+        self._comin_stream_len = None
+        self._comin_stream_pos = None
+        return self
+
+    def _with_carry(self, rows):
+        return self._get_status_reg(rows, self._CARRY_FLAG_BIT)
+
+    def _initsp(self, rows, a, b):
+        self._sp[rows] = 0
+
+    def _addla(self, rows, a, b):
+        new_value = self._acc[rows] + a + self._with_carry(rows)
+        self._acc_op(rows, new_value, new_value > 255)
+
+    def _addra(self, rows, a, b):
+        new_value = self._acc[rows] + self._rd(rows, a) + self._with_carry(rows)
+        self._acc_op(rows, new_value, new_value > 255)
+
+    def _subla(self, rows, a, b):
+        new_value = self._acc[rows] - a - self._with_carry(rows)
+        self._acc_op(rows, new_value, new_value < 0)
+
+    def _subra(self, rows, a, b):
+        new_value = self._acc[rows] - self._rd(rows, a) - self._with_carry(rows)
+        self._acc_op(rows, new_value, new_value < 0)
+
+    def _swapra(self, rows, a, b):
+        value = self._rd(rows, a)
+        current_acc_value = self._acc[rows]
+        self._acc[rows] = value
+        self._wr(rows, a, current_acc_value)
+
+    def _swaprr(self, rows, a, b):
+        value_left = self._rd(rows, a)
+        value_right = self._rd(rows, b)
+        self._wr(rows, a, value_right)
+        self._wr(rows, b, value_left)
+
+    def _mul(self, rows, a, b):
+        product = self._rd(rows, a) * self._rd(rows, b)
+        self._wr(rows, a, product)
+        self._set_status_reg(rows, self._CARRY_FLAG_BIT, product > 255)
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, (product & 0xFF) == 0)
+
+    def _div(self, rows, a, b):
+        value_left = self._rd(rows, a)
+        value_right = self._rd(rows, b)
+        by_zero = value_right == 0
+        self._halt_code[rows[by_zero]] = HALT_DIVISION_BY_ZERO
+        rows, a, value_left, value_right = rows[~by_zero], a[~by_zero], value_left[~by_zero], value_right[~by_zero]
+        div_res = value_left // value_right
+        self._wr(rows, a, div_res)
+        self._acc[rows] = value_left % value_right
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, (div_res & 0xFF) == 0)
+        self._set_status_reg(rows, self._CARRY_FLAG_BIT, self._acc[rows] == 0)
+
+    def _copyli(self, rows, a, b):
+        self._wr(rows, self._rd(rows, b), a)
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, a == 0)
+
+    def _copyai(self, rows, a, b):
+        self._wr(rows, self._rd(rows, a), self._acc[rows])
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, self._acc[rows] == 0)
+
+    def _copyia(self, rows, a, b):
+        self._acc[rows] = self._rd(rows, self._rd(rows, a))
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, self._acc[rows] == 0)
+
+    def _copyri(self, rows, a, b):
+        value = self._rd(rows, a)
+        self._wr(rows, self._rd(rows, b), value)
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, value == 0)
+
+    def _copyir(self, rows, a, b):
+        value = self._rd(rows, self._rd(rows, a))
+        self._wr(rows, b, value)
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, value == 0)
+
+    def _copyii(self, rows, a, b):
+        value = self._rd(rows, self._rd(rows, a))
+        self._wr(rows, self._rd(rows, b), value)
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, value == 0)
+
+    def _bchg(self, rows, a, b):
+        self._wr(rows, b, self._rd(rows, b) ^ self._bit_mask(a))
+
+    def _jumpi(self, rows, a, b):
+        self._pc[rows] = self._rd(rows, a)
+
+    def _calli(self, rows, a, b):
+        self._push_pc(rows)
+        self._pc[rows] = self._rd(rows, a)
+
+    def _randa(self, rows, a, b):
+        self._acc[rows] = self._rng.integers(0, 256, len(rows))
+
+    def _comout(self, rows, a, b):
+        for k, a_value in zip(rows.tolist(), self._acc[rows].tolist()):
+            self._comout[k].append(a_value)
+
+    def _comin(self, rows, a, b):
+        if self._comin_streams is not None:
+            self._acc[rows] = self._next_from_stream(rows, self._comin_streams, self._comin_stream_len,
+                                                     self._comin_stream_pos)
+
+    def _comrdy(self, rows, a, b):
+        # Comms is always "ready" in emulation.
+        self._set_status_reg(rows, self._ZERO_FLAG_BIT, False)
+
+    def _pinout(self, rows, a, b):
+        pass
+
+    def _pinin(self, rows, a, b):
+        pass
+
+    def _pindir(self, rows, a, b):
+        pass
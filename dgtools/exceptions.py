@@ -41,6 +41,20 @@ class DgtoolsErrorDgbarchiveCorrupted(DgtoolsError):
     pass
     
     
+class DgtoolsErrorDgtTraceCorrupted(DgtoolsError):
+    """
+    Raised when a .dgt trace does not conform to its defined format.
+    """
+    pass
+    
+    
+class DgtoolsErrorDgbBundleCorrupted(DgtoolsError):
+    """
+    Raised when a .dgbz bundle does not conform to its defined format.
+    """
+    pass
+    
+    
 class DgtoolsErrorDgbarchiveVersionIncompatible(DgtoolsError):
     """
     Raised when a Digirule is attempting to load a DGBArchive whose version (firmware version) does not match that 
@@ -54,7 +68,31 @@ class DgtoolsErrorProgramHalt(DgtoolsError):
     Raised to signify that execution has halted for a specific reason (mentioned in the message of the exception)
     """
     pass
-
+    
+    
+class DgtoolsErrorInfiniteLoop(DgtoolsError):
+    """
+    Raised when a program returns to a state it has been in before and would therefore never halt.
+    
+    Note:
+        * ``step`` is the step at which the repeated state was detected and ``period`` the number of steps after 
+          which the program repeats.
+    """
+    def __init__(self, step, period):
+        super().__init__(step, period)
+        
+    @property
+    def step(self):
+        return self.args[0]
+        
+    @property
+    def period(self):
+        return self.args[1]
+        
+    def __str__(self):
+        return f"Infinite loop detected at step {self.step}, period {self.period}"
+    
+    
 class DgtoolsErrorOutOfMemory(DgtoolsError):
     """
     Raised to signify that an operation has exhausted all available memory.
@@ -217,6 +217,10 @@ class DgToolsMakefileParser:
         otf = pyparsing.Regex("-otf|--output-trace_file") + a_file
         omf = pyparsing.Regex("-omf|--output-memdump_file") + a_file
         theme = pyparsing.Regex("--theme") + an_idf
+        trace_format = pyparsing.Regex("-tf|--trace-format") + pyparsing.Regex("html|dgt|none")
+        result_store = pyparsing.Regex("-rs|--result-store") + a_file
+        input_streams = pyparsing.Regex("-is|--input-streams") + a_file
+        record_inputs = pyparsing.Regex("-ri|--record-inputs") + a_file
         
         # Notice here, trace symbols can be either literals or shell variables (prepended with $$)
         trace_symbol = pyparsing.Group(pyparsing.Regex("[a-zA-Z_][a-zA-Z0-9_]*")("symbol") + 
@@ -242,6 +246,10 @@ class DgToolsMakefileParser:
                        pyparsing.Optional(otf)("otf") & 
                        pyparsing.Optional(omf)("omf") &
                        pyparsing.Optional(theme)("theme") & 
+                       pyparsing.Optional(trace_format)("trace_format") & 
+                       pyparsing.Optional(result_store)("result_store") & 
+                       pyparsing.Optional(input_streams)("input_streams") & 
+                       pyparsing.Optional(record_inputs)("record_inputs") & 
                        pyparsing.Optional(trace_symbols)("trace_symbols"))).setParseAction(lambda s,loc,tok:DgToolsMakefileAction(action="dgsim.py",
                                                                                                                                   parsed_parameters = tok)) 
         
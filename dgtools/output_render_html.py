@@ -5,8 +5,21 @@ A very basic HTML renderer.
 :author: Athanasios Anastasiou
 :date: April 2020
 """
+import os
+import html
 
 class Output_Render_HTML():
+    DOC_START = ("<!DOCTYPE html>\n"
+                 "<html>\n"
+                 "\t<head>\n"
+                 "\t<link rel=\"stylesheet\" type=\"text/css\" href=\"dgtheme.css\">"
+                 "\t\t<meta charset=\"utf-8\" />\n"
+                 "\t\t<title></title>\n"
+                 "\t</head>\n"
+                 "<body>\n")
+    DOC_END = ("</body>\n"
+               "</html>\n")
+    
     def __init__(self, filename):
         self._filename = filename
         self._fd = None
@@ -80,19 +93,11 @@ class Output_Render_HTML():
         return self
         
     def doc_start(self):
-        self._fd.write("<!DOCTYPE html>\n"
-                       "<html>\n"
-                       "\t<head>\n"
-                       "\t<link rel=\"stylesheet\" type=\"text/css\" href=\"dgtheme.css\">"
-                       "\t\t<meta charset=\"utf-8\" />\n"
-                       "\t\t<title></title>\n"
-                       "\t</head>\n"
-                       "<body>\n")
+        self._fd.write(self.DOC_START)
         return self
         
     def doc_end(self):
-        self._fd.write("</body>\n"
-                       "</html>\n")
+        self._fd.write(self.DOC_END)
         return self
         
     def open_tag(self, tag, attrs=None):
@@ -195,3 +200,267 @@ class Output_Render_HTML():
         
     def named_anchor(self, anchor_name):
         self._write_tag("a",attrs={"id":anchor_name})
+
+
+class Output_Trace_HTML():
+    """
+    Streams the trace of a Digirule program to HTML, one machine state (step) at a time.
+    
+    Notes:
+        * Each step is rendered from templates and lookup tables of table cells that are prepared once, when the 
+          trace is opened. Output is written through a large file buffer, so memory use does not depend on the 
+          length of the trace.
+        * If ``page_size`` is set, every ``page_size`` steps are written to their own page (``[name]_NNNN.html``) 
+          and ``filename`` becomes an index page that links to every step.
+        * The markup (and CSS classes) of each step is the same as that of ``Output_Render_HTML`` traces.
+        * If ``source_map`` is set, the program counter is followed by the source line and column of the 
+          instruction it points to.
+    """
+    _mem_heading_h = "".join([f"\t\t\t\t\t<th>{x:02X}</th>\n" for x in range(0, 16)])
+    _mem_rows = [f"\t\t\t\t<tr>\n\t\t\t\t\t<th>{x:02X}</th>\n" for x in range(0, 256, 16)]
+    _mem_cells = [f"\t\t\t\t\t<td>{x:02X}</td>\n" for x in range(0, 256)]
+    _mem_cells_pc = [f"\t\t\t\t\t<td class=\"current_pc\">{x:02X}</td>\n" for x in range(0, 256)]
+    _bit_cells = ["".join([f"\t\t\t\t\t<td>{a_bit}</td>\n" for a_bit in f"{x:08b}"]) for x in range(0, 256)]
+    
+    def __init__(self, filename, trace_title="", with_mem_dump=True, extra_symbols=[], page_size=None, 
+                 buffer_size=1 << 20, source_map=None):
+        """
+        Initialisation
+        
+        :param filename: The trace file (or index page if the trace is paged).
+        :type filename: str<Path>
+        :param trace_title: A title for the trace.
+        :type trace_title: str
+        :param with_mem_dump: Whether to include a complete memory dump at every step.
+        :type with_mem_dump: bool
+        :param extra_symbols: Memory areas to trace as (name, offset, length).
+        :type extra_symbols: list<tuple<str, int, int>>
+        :param page_size: Number of steps per page, or None for a single file.
+        :type page_size: int
+        :param buffer_size: The size of the output buffer in bytes.
+        :type buffer_size: int
+        :param source_map: The source (line, column) of every byte of the program.
+        :type source_map: list<tuple<int, int>>
+        """
+        if page_size is not None and (type(page_size) is not int or page_size < 1):
+            raise ValueError(f"Expected page_size as int>0, received {page_size}")
+        self._filename = filename
+        self._trace_title = html.escape(trace_title)
+        self._with_mem_dump = with_mem_dump
+        self._extra_symbols = [(html.escape(str(a_symbol[0])), a_symbol[1], a_symbol[2]) for a_symbol in extra_symbols]
+        self._page_size = page_size
+        self._buffer_size = buffer_size
+        self._fd = None
+        # (first step, last step) of every page written so far
+        self._pages = []
+        self._halted_at = None
+        # The program counter cell of every address
+        self._pc_cells = [f"0x{x:02X}" for x in range(256)]
+        if source_map is not None:
+            for an_addr, (a_line, a_col) in enumerate(source_map[:256]):
+                self._pc_cells[an_addr] += f" (line {a_line}, col {a_col})"
+        self._step_template = self._get_step_template()
+        
+    def _get_step_template(self):
+        """
+        Returns the template of one step, with the parts that depend on the options of the trace already filled in.
+        """
+        machine_state = ["Program Counter:", "Accumulator:", "Status Reg:", "Button Register:", 
+                         "Addr.Led Register:", "Data Led Register:", "Speed setting:", "Program counter stack:"]
+        template = ("\t<section>\n"
+                    "\t\t<a id=\"n{n}\"></a>\n"
+                    "\t\t<header>\n"
+                    "\t\t\t<h2>Machine State at n={n}</h2>\n"
+                    "\t\t</header>\n"
+                    "\t\t<section>\n"
+                    "\t\t\t<header>\n"
+                    "\t\t\t\t<h3>Machine Registers</h3>\n"
+                    "\t\t\t</header>\n"
+                    "\t\t\t<table class=\"table_machine_state\">\n" + 
+                    "".join([f"\t\t\t\t<tr>\n\t\t\t\t\t<th>{a_heading}</th>\n\t\t\t\t\t<td>{{{k}}}</td>\n\t\t\t\t</tr>\n" 
+                             for k, a_heading in enumerate(machine_state)]) + 
+                    "\t\t\t</table>\n"
+                    "\t\t</section>\n")
+        if self._with_mem_dump:
+            template += ("\t\t<section>\n"
+                         "\t\t\t<header>\n"
+                         "\t\t\t\t<h3>Full memory dump:</h3>\n"
+                         "\t\t\t</header>\n"
+                         "\t\t\t<table class=\"table_memory_space\">\n"
+                         "\t\t\t\t<tr>\n"
+                         "\t\t\t\t\t<th>Offset (h)</th>\n" + 
+                         self._mem_heading_h.replace("{", "{{").replace("}", "}}") + 
+                         "\t\t\t\t</tr>\n"
+                         "{mem_dump}"
+                         "\t\t\t</table>\n"
+                         "\t\t</section>\n")
+        if len(self._extra_symbols):
+            template += ("\t\t<section>\n"
+                         "\t\t\t<header>\n"
+                         "\t\t\t\t<h3>Specific Symbols</h3>\n"
+                         "\t\t\t</header>\n"
+                         "\t\t\t<table class=\"table_spec_sym\">\n"
+                         "\t\t\t\t<tr>\n"
+                         "\t\t\t\t\t<th>Symbol</th>\n"
+                         "\t\t\t\t\t<th>Offset</th>\n"
+                         "\t\t\t\t\t<th>Value(s)</th>\n"
+                         "\t\t\t\t\t<th>Value as string</th>\n"
+                         "\t\t\t\t</tr>\n"
+                         "{symbols}"
+                         "\t\t\t</table>\n"
+                         "\t\t</section>\n")
+        template += ("\t\t<section>\n"
+                     "\t\t\t<header>\n"
+                     "\t\t\t\t<h3>Onboard I/O</h3>\n"
+                     "\t\t\t</header>\n"
+                     "\t\t\t<table class=\"table_onboard_io\">\n"
+                     "\t\t\t\t<tr>\n"
+                     "\t\t\t\t\t<th>Address LEDs</th>\n"
+                     "{addr_led}"
+                     "\t\t\t\t</tr>\n"
+                     "\t\t\t\t<tr>\n"
+                     "\t\t\t\t\t<th>Data LEDs</th>\n"
+                     "{data_led}"
+                     "\t\t\t\t</tr>\n"
+                     "\t\t\t\t<tr>\n"
+                     "\t\t\t\t\t<th>Button Switches</th>\n"
+                     "{button_sw}"
+                     "\t\t\t\t</tr>\n"
+                     "\t\t\t</table>\n"
+                     "\t\t</section>\n"
+                     "\t</section>\n"
+                     "\t<hr>\n")
+        return template
+        
+    def _page_filename(self, page):
+        if self._page_size is None:
+            return self._filename
+        file_root, file_ext = os.path.splitext(self._filename)
+        return f"{file_root}_{page:04d}{file_ext or '.html'}"
+        
+    def _open_page(self, first_step):
+        page = len(self._pages)
+        self._pages.append([first_step, first_step])
+        self._fd = open(self._page_filename(page), "wt", buffering=self._buffer_size)
+        self._fd.write(Output_Render_HTML.DOC_START)
+        self._fd.write(f"<article>\n\t<header>\n\t\t<h1>Program Trace {self._trace_title}</h1>\n\t</header>\n")
+        if self._page_size is not None:
+            previous_page = f" | <a href=\"{os.path.basename(self._page_filename(page - 1))}\">Previous</a>" \
+                            if page > 0 else ""
+            self._fd.write(f"\t<nav><a href=\"{os.path.basename(self._filename)}\">Index</a>{previous_page}</nav>\n")
+        
+    def _close_page(self, has_next=False):
+        if self._page_size is not None and has_next:
+            next_page = os.path.basename(self._page_filename(len(self._pages)))
+            self._fd.write(f"\t<nav><a href=\"{next_page}\">Next</a></nav>\n")
+        self._fd.write("</article>\n")
+        self._fd.write(Output_Render_HTML.DOC_END)
+        self._fd.close()
+        self._fd = None
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, type, value, traceback):
+        if self._fd is None:
+            self._open_page(0)
+        self._close_page()
+        if self._page_size is not None:
+            self._write_index()
+            
+    def write_step(self, n, machine):
+        """
+        Writes the state of machine at step n.
+        
+        :param n: The step number.
+        :type n: int
+        :param machine: The machine at step n.
+        :type machine: Digirule
+        """
+        if self._fd is None:
+            self._open_page(n)
+        elif self._page_size is not None and n - self._pages[-1][0] >= self._page_size:
+            self._close_page(has_next=True)
+            self._open_page(n)
+        self._pages[-1][1] = n
+        
+        mem = machine.mem_view
+        pc = machine._pc
+        mem_dump = ""
+        if self._with_mem_dump:
+            mem_cells = list(map(self._mem_cells.__getitem__, mem))
+            if pc < 256:
+                mem_cells[pc] = self._mem_cells_pc[mem[pc]]
+            mem_dump = "".join([f"{self._mem_rows[k]}{''.join(mem_cells[(k * 16):(k * 16 + 16)])}\t\t\t\t</tr>\n" 
+                                for k in range(16)])
+        symbols = ""
+        if len(self._extra_symbols):
+            symbol_rows = []
+            for a_symbol in self._extra_symbols:
+                raw_bytes = mem[a_symbol[1]:(a_symbol[1] + a_symbol[2])].tolist()
+                chr_bytes = html.escape("".join(map(chr, raw_bytes))) if len(raw_bytes) > 1 else ""
+                symbol_rows.append(f"\t\t\t\t<tr>\n"
+                                   f"\t\t\t\t\t<td>{a_symbol[0]}</td>\n"
+                                   f"\t\t\t\t\t<td>0x{a_symbol[1]:02X}</td>\n"
+                                   f"\t\t\t\t\t<td>{raw_bytes}</td>\n"
+                                   f"\t\t\t\t\t<td>{chr_bytes}</td>\n"
+                                   f"\t\t\t\t</tr>\n")
+            symbols = "".join(symbol_rows)
+        addr_led = self._bit_cells[pc] if pc < 256 else \
+                   "".join([f"\t\t\t\t\t<td>{a_bit}</td>\n" for a_bit in machine.addr_led])
+        self._fd.write(self._step_template.format(self._pc_cells[pc] if pc < 256 else f"0x{pc:02X}",
+                                                  machine._acc,
+                                                  mem[machine._status_reg_ptr],
+                                                  mem[machine._bt_reg_ptr],
+                                                  mem[machine._addrled_reg_ptr],
+                                                  mem[machine._dataled_reg_ptr],
+                                                  machine._speed_setting,
+                                                  ",".join([f"0x{x:02X}" for x in machine._ppc]),
+                                                  n=n,
+                                                  mem_dump=mem_dump,
+                                                  symbols=symbols,
+                                                  addr_led=addr_led,
+                                                  data_led=self._bit_cells[mem[machine._dataled_reg_ptr]],
+                                                  button_sw=self._bit_cells[mem[machine._bt_reg_ptr]]))
+        return self
+        
+    def write_halt(self, n, reason):
+        """
+        Writes the reason the program stopped at step n.
+        
+        :param n: The step at which the program stopped.
+        :type n: int
+        :param reason: A human readable reason.
+        :type reason: str
+        """
+        if self._fd is None:
+            self._open_page(n)
+        self._halted_at = n
+        self._fd.write(f"\t<section class=\"program_halt\">\n"
+                       f"\t\t<a id=\"program_halt\"></a>\n"
+                       f"\t\t<header>\n"
+                       f"\t\t\t<h2>Program stopped at n={n}</h2>\n"
+                       f"\t\t</header>\n"
+                       f"\t\t<p>{html.escape(reason)}</p>\n"
+                       f"\t</section>\n")
+        return self
+        
+    def _write_index(self):
+        """
+        Writes the index page of a paged trace, with links to every step.
+        """
+        with open(self._filename, "wt", buffering=self._buffer_size) as fd:
+            fd.write(Output_Render_HTML.DOC_START)
+            fd.write(f"<article>\n\t<header>\n\t\t<h1>Program Trace {self._trace_title}</h1>\n\t</header>\n")
+            fd.write("\t<section class=\"trace_index\">\n")
+            for page, (first_step, last_step) in enumerate(self._pages):
+                page_filename = os.path.basename(self._page_filename(page))
+                fd.write(f"\t\t<h2><a href=\"{page_filename}\">n={first_step}..{last_step}</a></h2>\n\t\t<p>\n")
+                fd.write("".join([f"\t\t\t<a href=\"{page_filename}#n{n}\">{n}</a>\n" 
+                                  for n in range(first_step, last_step + 1)]))
+                fd.write("\t\t</p>\n")
+            if self._halted_at is not None:
+                fd.write(f"\t\t<h2><a href=\"{os.path.basename(self._page_filename(len(self._pages) - 1))}"
+                         f"#program_halt\">Program stopped at n={self._halted_at}</a></h2>\n")
+            fd.write("\t</section>\n</article>\n")
+            fd.write(Output_Render_HTML.DOC_END)
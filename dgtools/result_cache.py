@@ -0,0 +1,192 @@
+"""
+
+A cache of simulation results, addressed by the content of the program that was simulated.
+
+Programs that assemble to the same image, running on the same model, with the same inputs and for the same number
+of steps, end up at the same final memory and halt for the same reason. The cache stores these once per image, so
+regression runs only simulate the programs that have changed.
+
+Results are stored either as JSON files (final memory, number of steps and halt reason) in a directory tree, 
+written atomically so that a cache can be shared by parallel runs (DGB_ResultCache), or in a single SQLite file 
+that is kept to a maximum number of entries, evicting the least recently used ones (DGB_ResultStore).
+
+:author: Athanasios Anastasiou
+:date: Oct 2026
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+
+
+def result_key(program, max_n, loop_stride=None, input_streams=None):
+    """
+    Returns the key of the result of running a program.
+
+    Notes:
+        * The key depends on the content hash of the program (see DGB_Archive.content_hash), the number of steps it 
+          was allowed to run for, the loop detection stride, its input streams and the version of dgtools.
+
+    :param program: The program.
+    :type program: DGB_Archive
+    :param max_n: Maximum number of steps the program is allowed to run for.
+    :type max_n: int
+    :param loop_stride: Number of steps between checks for infinite loops, or None.
+    :type loop_stride: int
+    :param input_streams: The values each input of the VM returns, in order, by input name (None if the inputs 
+                          of the VM are not connected).
+    :type input_streams: dict<str:list<int>>
+    :rtype: str
+    """
+    from . import __version__
+    key = hashlib.sha1(f"{__version__}\n{program.content_hash}\n{max_n}\n{loop_stride}\n".encode("utf-8"))
+    for a_name, a_stream in sorted((input_streams or {}).items()):
+        key.update(f"{a_name}:{len(a_stream)}:".encode("utf-8"))
+        key.update(bytes(map(lambda x:x & 0xFF, a_stream)))
+    return key.hexdigest()
+
+
+class DGB_ResultCache:
+    """
+    Stores and retrieves the results of running programs in a directory.
+
+    Notes:
+        * Results are keyed by result_key.
+        * Entries that cannot be read are treated as missing.
+    """
+    def __init__(self, cache_dir):
+        """
+        Initialisation
+
+        :param cache_dir: The directory of the cache (created when the first result is stored).
+        :type cache_dir: str<Path>
+        """
+        self._cache_dir = cache_dir
+
+    def close(self):
+        """
+        Releases the resources of the cache (a directory cache has none).
+        """
+        pass
+
+    def _entry(self, key):
+        return os.path.join(self._cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """
+        Returns a stored result, or None if there is none.
+
+        :param key: The key of the result (see result_key).
+        :type key: str
+        :returns: The final memory, the number of steps and the halt reason (None if max_n was reached).
+        :rtype: tuple<bytes, int, str>
+        """
+        try:
+            with open(self._entry(key), "rt") as fd:
+                entry = json.load(fd)
+            return (bytes.fromhex(entry["memory"]), entry["n_steps"], entry["halt_reason"])
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def put(self, key, memory, n_steps, halt_reason):
+        """
+        Stores a result.
+
+        :param key: The key of the result (see result_key).
+        :type key: str
+        :param memory: The final memory.
+        :type memory: bytes-like
+        :param n_steps: The number of steps the program ran for.
+        :type n_steps: int
+        :param halt_reason: The reason the program halted, or None if it reached max_n.
+        :type halt_reason: str
+        """
+        entry = self._entry(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(entry))
+        with os.fdopen(fd, "wt") as temp_fd:
+            json.dump({"memory":bytes(memory).hex(), "n_steps":n_steps, "halt_reason":halt_reason}, temp_fd)
+        os.replace(temp_file, entry)
+
+
+class DGB_ResultStore:
+    """
+    Stores and retrieves the results of running programs in an SQLite file.
+
+    Notes:
+        * Results are keyed by result_key, as in DGB_ResultCache.
+        * Every result that is stored or retrieved becomes the most recently used one. Once the store holds more than
+          max_entries results, the least recently used ones are removed.
+        * The store can be shared by parallel runs, SQLite locks the file while a result is written.
+    """
+    def __init__(self, filename, max_entries=4096):
+        """
+        Initialisation
+
+        :param filename: The SQLite file (created if it does not exist).
+        :type filename: str<Path>
+        :param max_entries: The maximum number of results to keep.
+        :type max_entries: int (>0)
+        """
+        if type(max_entries) is not int or max_entries < 1:
+            raise ValueError(f"Expected max_entries as int>0, received {max_entries}")
+        # Only the tools that use a store need sqlite3
+        import sqlite3
+        self._max_entries = max_entries
+        self._connection = sqlite3.connect(filename, timeout=30)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, "
+                                     "memory BLOB NOT NULL, n_steps INTEGER NOT NULL, halt_reason TEXT, "
+                                     "last_used INTEGER NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, key):
+        """
+        Returns a stored result, or None if there is none.
+
+        :param key: The key of the result (see result_key).
+        :type key: str
+        :returns: The final memory, the number of steps and the halt reason (None if max_n was reached).
+        :rtype: tuple<bytes, int, str>
+        """
+        with self._connection:
+            result = self._connection.execute("SELECT memory, n_steps, halt_reason FROM results WHERE key = ?", 
+                                              (key,)).fetchone()
+            if result is not None:
+                self._connection.execute("UPDATE results SET last_used = (SELECT MAX(last_used) + 1 FROM results) "
+                                         "WHERE key = ?", (key,))
+        return (bytes(result[0]), result[1], result[2]) if result is not None else None
+
+    def put(self, key, memory, n_steps, halt_reason):
+        """
+        Stores a result, evicting the least recently used results past max_entries.
+
+        :param key: The key of the result (see result_key).
+        :type key: str
+        :param memory: The final memory.
+        :type memory: bytes-like
+        :param n_steps: The number of steps the program ran for.
+        :type n_steps: int
+        :param halt_reason: The reason the program halted, or None if it reached max_n.
+        :type halt_reason: str
+        """
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, "
+                                     "(SELECT COALESCE(MAX(last_used), 0) + 1 FROM results))", 
+                                     (key, bytes(memory), n_steps, halt_reason))
+            self._connection.execute("DELETE FROM results WHERE key IN "
+                                     "(SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)", 
+                                     (self._max_entries,))
@@ -22,7 +22,7 @@ copyright = '2020, Athanasios Anastasiou'
 author = 'Athanasios Anastasiou'
 
 # The full version, including alpha/beta/rc tags
-release = '1.0.4'
+from dgtools import __version__ as release
 
 
 # -- General configuration ---------------------------------------------------
@@ -1,10 +1,15 @@
 import sys
+import re
 
 from setuptools import setup, find_packages
 
+# The version is defined once, in dgtools/__init__.py
+with open('dgtools/__init__.py') as fd:
+    version = re.search(r'^__version__ = "([^"]+)"', fd.read(), re.M).group(1)
+
 setup(
     name='dgtools',
-    version='1.0.4',
+    version=version,
     description='An assembler and simulation toolchain for the Digirule2 series of hardware.',
     long_description=open('README.md').read(),
     long_description_content_type='text/markdown',
@@ -17,9 +22,11 @@ setup(
     scripts=['dgtools/dgasm.py', 'dgtools/dgsim.py', \
              'dgtools/dginspect.py', 'dgtools/dgui.py', \
              'dgtools/dgform.py', 'dgtools/dgbf.py', \
-             'dgtools/dgsust.py'],
+             'dgtools/dgsust.py', 'dgtools/dgbatch.py', \
+             'dgtools/dgprof.py'],
     package_data={'dgtools':['css_themes/*.css']},
     install_requires=['click', 'pyparsing', 'urwid', 'pygments', 'intelhex'],
+    extras_require={'batch':['numpy']},
     python_requires='>=3.6',
     classifiers=['Development Status :: 4 - Beta',
                  'Environment :: Console',
@@ -0,0 +1,66 @@
+"""
+
+Contains tests for the assembler.
+
+The tokenizer must parse every program exactly as the pyparsing grammar of the language does.
+"""
+
+from dgtools.assembler import DgAssembler, DgIncrementalAssembler
+from dgtools.digirule import Digirule, Digirule2U
+from dgtools.exceptions import DgtoolsErrorASMSyntaxError
+import pytest
+
+
+PROGRAM = """# Counts down from a constant
+.EQU start_value = 0x0A
+start:
+    COPYLR start_value counter  # Initialise
+loop:
+\tDECRJZ counter
+    JUMP loop
+    COPYLA 'A'
+    HALT
+counter:
+.DB 0, 0b101, -1, "AB", '#', counter
+"""
+
+
+@pytest.mark.parametrize("digirule_cls", [Digirule, Digirule2U])
+def test_tokenizer_matches_grammar(digirule_cls):
+    assembler = DgAssembler(digirule_cls)
+    # Programs that the tokenizer does not parse fall back to the grammar, they are parsed here to make sure the
+    # comparison is between the two parsers.
+    for asm_code_text in [PROGRAM, "HALT RETURN start: .DB 1,2 .EQU x=3", "x: .DB '\"', \"\"\""]:
+        statements = assembler.text_to_ast(asm_code_text)
+        assert statements == assembler._parse_with_grammar(asm_code_text)
+        assert assembler.asm_ast_to_obj(statements) == \
+               assembler.asm_ast_to_obj(assembler._parse_with_grammar(asm_code_text))
+
+
+def test_tokenizer_fallback():
+    assembler = DgAssembler(Digirule)
+    # Mnemonics and operands that are not separated are only understood by the grammar.
+    assert assembler.asm_ast_to_obj(assembler.text_to_ast("SPEED0 HALT"))["program"] == [2, 0, 0]
+    with pytest.raises(DgtoolsErrorASMSyntaxError):
+        assembler.text_to_ast("COPYLA @")
+
+
+def test_grammar_cache():
+    # Assemblers of the same model share one grammar, built once.
+    assert DgAssembler(Digirule2U).grammar is DgAssembler(Digirule2U).grammar
+    assert DgAssembler(Digirule).grammar is not DgAssembler(Digirule2U).grammar
+    with pytest.raises(ValueError):
+        DgAssembler.enable_packrat(0)
+
+
+def test_incremental_assembler():
+    assembler = DgIncrementalAssembler(Digirule)
+    compiled_program = assembler.assemble(PROGRAM)
+    assert compiled_program["changed"] == [(k, None, v) for k, v in enumerate(compiled_program["program"])]
+    # Inserting a line moves everything after it.
+    edited_text = PROGRAM.replace("    HALT\n", "    NOP\n    HALT\n")
+    edited_program = assembler.assemble(edited_text)
+    expected_program = DgAssembler(Digirule).asm_ast_to_obj(DgAssembler(Digirule).text_to_ast(edited_text))
+    assert {k:edited_program[k] for k in expected_program} == expected_program
+    assert edited_program["changed"][0] == (2, 10, 11)
+    assert assembler.assemble(edited_text)["changed"] == []
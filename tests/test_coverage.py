@@ -0,0 +1,51 @@
+"""
+
+Contains tests for execution coverage.
+
+Every byte of a program must be counted separately as executed, fetched as an operand, read and written, and the 
+counts must add up to the source lines that produced the bytes.
+"""
+
+from dgtools.assembler import DgAssembler
+from dgtools.digirule import Digirule
+from dgtools.dgb_archive import DGB_Archive
+from dgtools.dgsim import cover_program
+from dgtools.dgform import line_coverage, coverage_listing
+
+
+SOURCE = """start:
+    COPYRA value
+    COPYAR result
+    INCR result
+    HALT
+unused:
+.DB 0
+value:
+.DB 42
+result:
+.DB 0
+"""
+
+
+def test_cover_program():
+    assembler = DgAssembler(Digirule)
+    compiled_program = assembler.asm_ast_to_obj(assembler.text_to_ast(SOURCE))
+    program = DGB_Archive(compiled_program["program"], compiled_program["labels"], 
+                          source_map=compiled_program["source_map"])
+    machine, coverage = cover_program(program, max_n=100)
+    assert machine.mem_view[9] == 43
+    assert coverage["n_steps"] == 4 and coverage["halt_reason"] == "Program terminated at HALT instruction."
+    assert [an_addr for an_addr in range(256) if coverage["executed"][an_addr]] == [0, 2, 4, 6]
+    assert [an_addr for an_addr in range(256) if coverage["operand"][an_addr]] == [1, 3, 5]
+    assert coverage["read"][:10] == [0, 0, 0, 0, 0, 0, 0, 0, 1, 1]
+    assert coverage["written"][:10] == [0, 0, 0, 0, 0, 0, 0, 0, 0, 2]
+    assert coverage["unused"] == [7]
+
+    lines = line_coverage(compiled_program["source_map"], coverage)
+    assert [(a_line["line"], a_line["status"], a_line["executed"], a_line["read"], a_line["written"]) 
+            for a_line in lines] == [(2, "executed", 1, 0, 0), (3, "executed", 1, 0, 0), (4, "executed", 1, 0, 0), 
+                                     (5, "executed", 1, 0, 0), (7, "unused", 0, 0, 0), (9, "data", 0, 1, 0), 
+                                     (11, "data", 0, 1, 2)]
+    listing = coverage_listing("Coverage", SOURCE, lines, coverage)
+    assert listing.count("<tr class=\"executed\">") == 4 and listing.count("<tr class=\"unused\">") == 1
+    assert "Lines executed: 4, used as data: 2, unused: 1" in listing
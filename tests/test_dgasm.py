@@ -0,0 +1,58 @@
+"""
+
+Contains tests for dgasm, the command line assembler.
+
+A source that has been assembled before must be copied from the build cache, byte for byte, but only if everything
+that determines the output is the same.
+"""
+
+from click.testing import CliRunner
+from dgtools.dgasm import assemble_file, read_manifest, dgasm
+
+
+PROGRAM = """start:
+    COPYLR 0x0A counter
+loop:
+    DECRJZ counter
+    JUMP loop
+    HALT
+counter:
+.DB 0
+"""
+
+
+def test_build_cache(tmp_path):
+    input_file = tmp_path / "program.dsf"
+    input_file.write_text(PROGRAM)
+    cache_dir = tmp_path / "cache"
+    assert not assemble_file(input_file, tmp_path / "uncached.dgb", "2U")
+    assert not assemble_file(input_file, tmp_path / "first.dgb", "2U", cache_dir=cache_dir)
+    assert assemble_file(input_file, tmp_path / "second.dgb", "2U", cache_dir=cache_dir)
+    for an_extension in [".dgb", ".hex"]:
+        assert (tmp_path / f"second{an_extension}").read_bytes() == (tmp_path / f"first{an_extension}").read_bytes()
+        assert (tmp_path / f"second{an_extension}").read_bytes() == \
+               (tmp_path / f"uncached{an_extension}").read_bytes()
+    # Anything that changes the output misses the cache (once)
+    for a_variant in [{"with_source_map":False}, {"as_json":True}, {"target":"2A"}]:
+        parameters = {"target":"2U", "with_source_map":True, "cache_dir":cache_dir, "as_json":False, **a_variant}
+        assert not assemble_file(input_file, tmp_path / "variant.dgb", **parameters)
+        variant = (tmp_path / "variant.dgb").read_bytes()
+        assert variant != (tmp_path / "first.dgb").read_bytes()
+        assert assemble_file(input_file, tmp_path / "variant.dgb", **parameters)
+        assert (tmp_path / "variant.dgb").read_bytes() == variant
+
+
+def test_manifest(tmp_path):
+    for a_name in ["first", "second"]:
+        (tmp_path / f"{a_name}.dsf").write_text(PROGRAM)
+    (tmp_path / "bad.dsf").write_text("start:\n    JUMP nowhere_to_be_found 1\n")
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# Programs\nfirst.dsf\n\nbad.dsf\nsecond.dsf\n")
+    assert read_manifest(str(manifest)) == [str(tmp_path / "first.dsf"), str(tmp_path / "bad.dsf"), 
+                                            str(tmp_path / "second.dsf")]
+    result = CliRunner().invoke(dgasm, ["--manifest", str(manifest), "--jobs", "2"])
+    assert result.exit_code != 0
+    assert result.output.count("dgasm: File ") == 1 and f"dgasm: File {tmp_path / 'bad.dsf'}:" in result.output
+    assert "dgasm: 1 of 3 files failed." in result.output
+    assert (tmp_path / "first.dgb").exists() and (tmp_path / "second.dgb").exists()
+    assert not (tmp_path / "bad.dgb").exists()
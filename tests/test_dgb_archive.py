@@ -0,0 +1,47 @@
+"""
+
+Contains tests for DGB archives.
+
+An archive must load back to the same program, labels, model, source map and metadata from either of its formats.
+"""
+
+import pytest
+from dgtools.dgb_archive import DGB_Archive
+from dgtools.exceptions import DgtoolsErrorDgbarchiveCorrupted
+
+
+@pytest.mark.parametrize("as_json", [False, True])
+def test_archive_roundtrip(tmp_path, as_json):
+    filename = tmp_path / "program.dgb"
+    archive = DGB_Archive([3, 10, 8, 0] + [0] * 252, {"start":0, "counter":8}, "2U", [(1, 1)] * 2 + [(2, 5)] * 2,
+                          {"title":"Counter"})
+    archive.save(filename, as_json=as_json)
+    assert DGB_Archive.is_binary(filename) is not as_json
+    loaded = DGB_Archive.load(filename)
+    assert bytes(loaded.program) == bytes(archive.program)
+    assert loaded.labels == archive.labels
+    assert loaded.version == "2U"
+    assert loaded.source_map == archive.source_map
+    assert loaded.metadata == {"title":"Counter"}
+    assert loaded.source_position(3) == (2, 5)
+
+
+def test_corrupted_archive():
+    data = DGB_Archive([0] * 256, {"start":0}).to_bytes()
+    with pytest.raises(DgtoolsErrorDgbarchiveCorrupted):
+        DGB_Archive.from_bytes(data[:-1])
+    # Sections are only checked when they are decoded.
+    archive = DGB_Archive.from_bytes(data[:-3] + b"\xff\xff\xff")
+    assert archive.program == bytearray(256)
+    with pytest.raises(DgtoolsErrorDgbarchiveCorrupted):
+        archive.labels
+
+
+def test_derived_archives_share_sections():
+    archive = DGB_Archive([3, 10, 8, 0], {"start":0}, "2U", [(1, 1)] * 4)
+    memdump = archive.with_program(bytearray([3, 10, 8, 10]))
+    assert memdump.program == b"\x03\x0a\x08\x0a" and archive.program == b"\x03\x0a\x08\x00"
+    assert memdump.labels is archive.labels and memdump.source_map is archive.source_map
+    assert DGB_Archive.from_archive(archive).program is archive.program
+    with pytest.raises(TypeError):
+        archive.labels["end"] = 3
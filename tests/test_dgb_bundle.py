@@ -0,0 +1,51 @@
+"""
+
+Contains tests for bundles of DGB archives (.dgbz).
+
+Archives must be read back from a bundle as they were written, both by name and in the order they were written.
+"""
+
+import struct
+import pytest
+from dgtools.dgb_archive import DGB_Archive
+from dgtools.dgb_bundle import DGB_BundleWriter, DGB_BundleReader
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "lzma"])
+def test_bundle_roundtrip(tmp_path, compression):
+    filename = tmp_path / "corpus.dgbz"
+    program = DGB_Archive([3, 10, 8, 0], {"start":0, "counter":8}, "2A", [(1, 1)] * 4)
+    archives = {f"p{k}":program.with_program([3, k, 8, 0]) for k in range(10)}
+    archives["other"] = DGB_Archive([0] * 256, {"x":1}, "2U", metadata={"title":"Other"})
+    with DGB_BundleWriter(filename, compression) as bundle:
+        for a_name, an_archive in archives.items():
+            bundle.add(a_name, an_archive)
+        with pytest.raises(ValueError):
+            bundle.add("p0", program)
+
+    with DGB_BundleReader(filename) as bundle:
+        assert bundle.names == list(archives)
+        streamed = list(bundle)
+        assert [a_name for a_name, an_archive in streamed] == list(archives)
+        for a_name, an_archive in streamed + [(a_name, bundle[a_name]) for a_name in archives]:
+            assert an_archive.program == archives[a_name].program
+            assert an_archive.labels == archives[a_name].labels
+            assert an_archive.version == archives[a_name].version
+            assert an_archive.source_map == archives[a_name].source_map
+            assert an_archive.metadata == archives[a_name].metadata
+        # Archives with the same labels share them
+        assert bundle["p1"].labels is bundle["p9"].labels
+
+
+def test_unclosed_bundle(tmp_path):
+    filename = tmp_path / "corpus.dgbz"
+    with DGB_BundleWriter(filename) as bundle:
+        for k in range(4):
+            bundle.add(f"p{k}", DGB_Archive([k] * 256, {"start":0}))
+    # Without its footer, the archives that were written completely are still found.
+    data = filename.read_bytes()
+    (footer_offset,) = struct.unpack("<Q", data[-12:-4])
+    filename.write_bytes(data[:footer_offset - 5])
+    with DGB_BundleReader(filename) as bundle:
+        assert bundle.names == ["p0", "p1", "p2"]
+        assert bundle["p2"].program == bytes([2] * 256)
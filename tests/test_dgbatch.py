@@ -0,0 +1,55 @@
+"""
+
+Contains tests for dgbatch, the parallel simulator.
+
+Every program of the inputs (files and bundles) must be simulated once, its memdump written where its input is and
+its result reported, whether it succeeded or failed.
+"""
+
+import json
+from click.testing import CliRunner
+from dgtools import DGB_Archive, DGB_BundleReader, DGB_BundleWriter
+from dgtools.dgbatch import collect_inputs, dgbatch
+
+
+def test_dgbatch(tmp_path):
+    input_dir = tmp_path / "inputs"
+    (input_dir / "sub").mkdir(parents=True)
+    # COPYLR 10, 8 then HALT
+    DGB_Archive([3, 10, 8, 0], {"start":0}).save(input_dir / "good.dgb")
+    (input_dir / "bad.dgb").write_bytes(b"Not an archive")
+    # Memdumps of earlier runs are not simulated
+    DGB_Archive([0], {}).save(input_dir / "good_memdump.dgb")
+    with DGB_BundleWriter(input_dir / "sub" / "programs.dgbz") as bundle:
+        # COPYLR 20, 9 then HALT
+        bundle.add("halts", DGB_Archive([3, 20, 9, 0], {"start":0}))
+        # JUMP 0
+        bundle.add("loops", DGB_Archive([28, 0], {"start":0}))
+    assert collect_inputs([str(input_dir)]) == [str(input_dir / "bad.dgb"), str(input_dir / "good.dgb"), 
+                                                str(input_dir / "sub" / "programs.dgbz")]
+
+    output_dir = tmp_path / "outputs"
+    summary_file = tmp_path / "summary.json"
+    result = CliRunner().invoke(dgbatch, [str(input_dir), "--output-dir", str(output_dir), "--max-n", "10", 
+                                          "--jobs", "2", "--summary-file", str(summary_file)])
+    assert result.exit_code != 0
+    assert "dgbatch: Simulated 3 of 4 programs." in result.output
+
+    assert DGB_Archive.load(output_dir / "good_memdump.dgb").program[8] == 10
+    assert not (output_dir / "bad_memdump.dgb").exists()
+    with DGB_BundleReader(output_dir / "sub" / "programs_memdump.dgbz") as memdumps:
+        assert memdumps.names == ["halts", "loops"]
+        assert memdumps["halts"].program[9] == 20
+        assert memdumps["loops"].program == bytes([28, 0]) + bytes(254)
+
+    with open(summary_file, "rt") as fd:
+        summary = {an_entry["input_file"]:an_entry for an_entry in json.load(fd)}
+    assert list(summary) == [str(input_dir / "bad.dgb"), str(input_dir / "good.dgb"), 
+                             f"{input_dir / 'sub' / 'programs.dgbz'}:halts", 
+                             f"{input_dir / 'sub' / 'programs.dgbz'}:loops"]
+    assert summary[str(input_dir / "bad.dgb")]["error"] is not None
+    good = summary[str(input_dir / "good.dgb")]
+    assert (good["n_steps"], good["halt_reason"], good["error"]) == (2, "Program terminated at HALT instruction.", 
+                                                                     None)
+    loops = summary[f"{input_dir / 'sub' / 'programs.dgbz'}:loops"]
+    assert (loops["n_steps"], loops["halt_reason"], loops["error"]) == (10, None, None)
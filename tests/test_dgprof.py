@@ -0,0 +1,25 @@
+"""
+
+Contains tests for the execution profiler.
+
+Every executed instruction must be counted once, under its address, opcode, enclosing label and call stack.
+"""
+
+from dgtools.dgb_archive import DGB_Archive
+from dgtools.dgprof import profile_program
+
+
+def test_profile_program():
+    # start: CALL inc, CALL inc, HALT
+    # inc:   INCR 200, RETURN
+    program = DGB_Archive([29, 5, 29, 5, 0, 19, 200, 31], {"start":0, "inc":5})
+    profile, machine = profile_program(program, max_n=100)
+    assert profile.n_steps == 7 and profile.halt_reason == "Program terminated at HALT instruction."
+    assert machine.mem_view[200] == 2
+    assert profile.by_address == {0:1, 2:1, 4:1, 5:2, 7:2}
+    assert profile.by_opcode == {29:2, 0:1, 19:2, 31:2}
+    assert profile.by_label == {"start":3, "inc":4}
+    assert profile.calls == {"inc":2}
+    assert profile.by_stack == {("start",):3, ("start", "inc"):4}
+    assert profile.by_function == {"start":(3, 7), "inc":(4, 4)}
+    assert profile.collapsed_stacks() == "start 3\nstart;inc 4\n"
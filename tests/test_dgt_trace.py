@@ -0,0 +1,84 @@
+"""
+
+Contains tests for binary (.dgt) traces.
+
+The state that a trace reconstructs at any step must be the state the VM was in before executing that step.
+"""
+
+import random
+from dgtools.digirule import Digirule
+from dgtools.dgt_trace import DGT_TraceWriter, DGT_TraceReader, DGT_TraceIndex, index_filename, machine_state
+from dgtools.exceptions import DgtoolsError, DgtoolsErrorDgtTraceCorrupted
+import pytest
+
+
+def record(program, filename, keyframe_interval, max_n=300):
+    """
+    Records the execution of program and returns the states of the VM at every step.
+    """
+    vm = Digirule()
+    vm.load_program(program)
+    states = []
+    with DGT_TraceWriter(filename, keyframe_interval=keyframe_interval, labels={"start":0}) as trace:
+        for n in range(max_n):
+            states.append(machine_state(n, vm))
+            trace.write_state(vm)
+            try:
+                vm._exec_next()
+            except DgtoolsError as de:
+                trace.write_halt(str(de))
+                break
+    return states
+
+
+def test_dgt_trace_roundtrip(tmp_path):
+    rnd = random.Random(7)
+    # Random programs exercise memory writes, calls, returns and speed changes.
+    program = [rnd.randint(0, 255) if rnd.random() < 0.5 else rnd.randint(0, 30) for k in range(252)] + [0] * 4
+    for keyframe_interval in [1, 5, 64]:
+        filename = tmp_path / f"trace_{keyframe_interval}.dgt"
+        states = record(program, filename, keyframe_interval)
+        with DGT_TraceReader(filename) as trace:
+            assert trace.n_states == len(states)
+            assert trace.labels == {"start":0}
+            assert list(trace.iter_states()) == states
+            for a_step in rnd.sample(range(len(states)), len(states) // 2):
+                assert trace.state_at(a_step) == states[a_step]
+            vm = trace.machine_at(len(states) - 1)
+            assert (bytes(vm.mem_view), vm._pc, vm._acc) == (states[-1].mem, states[-1].pc, states[-1].acc)
+
+
+def test_dgt_trace_truncated(tmp_path):
+    filename = tmp_path / "trace.dgt"
+    # Counts up at address 200, forever.
+    states = record([19, 200, 28, 0], filename, 16, max_n=100)
+    with open(filename, "rb") as fd:
+        data = fd.read()
+    with open(filename, "wb") as fd:
+        fd.write(data[:len(data) // 2])
+    with DGT_TraceReader(filename) as trace:
+        assert 0 < trace.n_states < len(states)
+        assert list(trace.iter_states()) == states[:trace.n_states]
+    # A trace cut within its metadata, or with metadata that does not decode, cannot be read at all.
+    for corrupted_data in [data[:40], data[:30] + b"\xff" * 10 + data[40:]]:
+        with open(filename, "wb") as fd:
+            fd.write(corrupted_data)
+        with pytest.raises(DgtoolsErrorDgtTraceCorrupted):
+            DGT_TraceReader(filename, use_index=False)
+
+
+def test_dgt_trace_index(tmp_path):
+    filename = tmp_path / "trace.dgt"
+    states = record([19, 200, 28, 0], filename, 16, max_n=100)
+    index = DGT_TraceIndex.load(index_filename(filename))
+    with DGT_TraceReader(filename, use_index=False) as trace:
+        assert list(index.offsets) == [trace.record_offset(a_step) for a_step in range(len(states))]
+    # A trace that was cut short is indexed by scanning it, once.
+    with open(filename, "rb") as fd:
+        data = fd.read()
+    with open(filename, "wb") as fd:
+        fd.write(data[:len(data) // 2])
+    index = DGT_TraceIndex.build(filename)
+    with DGT_TraceReader(filename) as trace:
+        assert trace.n_states == len(index.offsets)
+        assert trace.state_at(trace.n_states - 1) == states[trace.n_states - 1]
@@ -0,0 +1,58 @@
+"""
+
+Contains tests for the lockstep (NumPy) Digirule engine.
+
+Every machine of a batch must end up in exactly the same state as a scalar Digirule that runs the same program
+with the same inputs.
+"""
+
+import random
+import pytest
+numpy = pytest.importorskip("numpy")
+
+from dgtools.digirule import Digirule, Digirule2U
+from dgtools.digirule_batch import DigiruleBatch, Digirule2UBatch, HALT_OUT_OF_MEMORY
+from dgtools.callbacks import DigiruleCallbackInputSequence
+
+
+@pytest.mark.parametrize("model, batch_model", [(Digirule, DigiruleBatch), (Digirule2U, Digirule2UBatch)])
+def test_batch_matches_scalar(model, batch_model):
+    """
+    Runs random programs with random button and COM input streams on a batch and on scalar machines.
+    """
+    rnd = random.Random(42)
+    n_machines = 32
+    max_n = 200
+    for a_program_n in range(8):
+        # Opcodes of instructions that are not reproducible (RANDA) are replaced by a NOP
+        program = [rnd.randint(0, 255) if rnd.random() < 0.5 else rnd.randint(0, 48) for k in range(256)]
+        program = [1 if a_value == 47 and model is Digirule2U else a_value for a_value in program]
+        bt_streams = [[rnd.randint(0, 255) for k in range(rnd.randint(0, 20))] for m in range(n_machines)]
+        comin_streams = [[rnd.randint(0, 255) for k in range(rnd.randint(0, 20))] for m in range(n_machines)]
+
+        batch = batch_model(n_machines, stack_depth=2)
+        batch.load_program(program)
+        batch.set_button_streams(bt_streams)
+        if model is Digirule2U:
+            batch.set_comin_streams(comin_streams)
+        n_steps = batch.run(max_n)
+
+        for m in range(n_machines):
+            vm = model()
+            vm.load_program(program)
+            vm.interactive_callback = DigiruleCallbackInputSequence(bt_streams[m])
+            if model is Digirule2U:
+                vm.comin_callback = DigiruleCallbackInputSequence(comin_streams[m])
+            try:
+                result = vm.run(max_n)
+                assert n_steps[m] == result.n_steps, f"Program {a_program_n}, machine {m}: steps differ"
+                assert type(batch.halt_reason(m)) is type(result.halt_reason), \
+                       f"Program {a_program_n}, machine {m}: halt reasons differ"
+                assert batch.pc[m] == vm._pc, f"Program {a_program_n}, machine {m}: pc differs"
+            except IndexError:
+                # Running off the end of memory is a halt reason of its own in a batch.
+                assert batch.halt_code[m] == HALT_OUT_OF_MEMORY
+            machine = batch.get_machine(m)
+            assert machine._mem == vm._mem, f"Program {a_program_n}, machine {m}: memory differs"
+            assert (machine._acc, machine._ppc, machine._speed_setting) == (vm._acc, vm._ppc, vm._speed_setting), \
+                   f"Program {a_program_n}, machine {m}: registers differ"
@@ -7,9 +7,11 @@ would cause errors not only to the code itself but more importantly, errors in t
 VM simulates.
 """
 
-from dgtools.digirule import Digirule
-from dgtools.exceptions import DgtoolsErrorProgramHalt
+from dgtools.digirule import Digirule, Digirule2U
+from dgtools.callbacks import DigiruleCallbackInputSequence, DigiruleCallbackOutputBase
+from dgtools.exceptions import DgtoolsErrorProgramHalt, DgtoolsErrorInfiniteLoop
 import types
+import random
 import base64
 import pytest
 
@@ -52,8 +54,7 @@ def get_vm_hash_after_exec(a_program, use_this_vm=None):
     else:
         vm = use_this_vm
         
-    with pytest.raises(DgtoolsErrorProgramHalt):
-        vm.run()
+    assert isinstance(vm.run().halt_reason, DgtoolsErrorProgramHalt)
     
     return get_vm_hash(vm)
 
@@ -524,8 +525,7 @@ def test_DECRJZ():
     # Notice here, we resume execution without reloading the program. That would reset the memory state.
     
     vm.goto(0)
-    with pytest.raises(DgtoolsErrorProgramHalt):
-        vm.run()
+    assert isinstance(vm.run().halt_reason, DgtoolsErrorProgramHalt)
     vm_hash = get_vm_hash(vm)
     vm_expected._mem[3] = 0x00
     vm_expected._mem[252] = 1
@@ -556,8 +556,7 @@ def test_INCRJZ():
     assert get_vm_hash(vm_expected) == vm_hash, "Failed to continue when condition not met."
     
     vm.goto(0)
-    with pytest.raises(DgtoolsErrorProgramHalt):
-        vm.run()
+    assert isinstance(vm.run().halt_reason, DgtoolsErrorProgramHalt)
     vm_hash = get_vm_hash(vm)
     vm_expected._mem[3] = 0x00
     vm_expected._mem[252] = 1
@@ -800,3 +799,167 @@ def test_ADDRPC():
     vm_expected._pc = 4
     
     assert vm_hash == get_vm_hash(vm_expected)
+
+
+def test_decode_cache_self_modifying_code():
+    """
+    The decode cache must be invalidated when a program overwrites an instruction that has already been decoded.
+    
+    The program below patches the operand of its first instruction (COPYLA 1 becomes COPYLA 7) and runs it again.
+    """
+    test_program = [4, 1, 5, 20, 3, 7, 1, 20, 21, 28, 0, 0] + [0] * 8 + [0, 2]
+    vm_hash = get_vm_hash_after_exec(test_program)
+    
+    vm = Digirule()
+    vm.use_decode_cache = True
+    vm.load_program(test_program)
+    vm_hash_cached = get_vm_hash_after_exec(test_program, vm)
+    
+    assert vm._mem[20] == 7
+    assert vm_hash_cached == vm_hash
+    
+    # The cache must follow the VM through fork() and stop invalidating once it is switched off.
+    forked = vm.fork()
+    assert forked.use_decode_cache and forked._wr_mem == forked._wr_mem_decoded
+    vm.use_decode_cache = False
+    assert "_exec_next" not in vm.__dict__ and "_wr_mem" not in vm.__dict__
+    vm.load_program(test_program)
+    vm.goto(0)
+    assert isinstance(vm.run().halt_reason, DgtoolsErrorProgramHalt) and vm._mem[20] == 7
+
+
+def test_memory_buffer():
+    """
+    Checks that memory is a byte buffer that programs of either list or bytes can be loaded to.
+    """
+    vm = Digirule()
+    vm.load_program([0x01, 0x1FF, -1])
+    assert bytes(vm.mem_view[:3]) == b"\x01\xff\xff", "List values not truncated to uint8."
+    vm.load_program(b"\x02\x03")
+    assert vm.mem_view[:4].tolist() == [2, 3, 0xFF, 0], "Bytes program not loaded."
+    with pytest.raises(TypeError):
+        vm.mem_view[0] = 1
+
+
+def test_run_step_budget():
+    """
+    Checks that run() executes exactly max_n instructions and reports why it stopped.
+    """
+    # An endless loop at address 0 (JUMP 0) and a HALT.
+    for engine in [None, "use_decode_cache", "use_block_compiler"]:
+        vm = Digirule()
+        if engine is not None:
+            setattr(vm, engine, True)
+        vm.load_program([0x1C, 0x00])
+        result = vm.run(max_n=101)
+        assert result.n_steps == 101 and result.halt_reason is None and result.pc == 0, f"Budget not honoured ({engine})."
+        
+        vm.load_program([0x1C, 0x02, 0x00])
+        result = vm.run(max_n=10)
+        assert result.n_steps == 2 and isinstance(result.halt_reason, DgtoolsErrorProgramHalt) and \
+               result.pc == 3, f"HALT not reported ({engine})."
+
+
+def test_block_compiler_self_modifying_code():
+    """
+    Compiled blocks must be invalidated when a program overwrites code that has already been compiled.
+    
+    The program is the same as in ``test_decode_cache_self_modifying_code``, the loop test is done via the 
+    status register (BCRSS on the zero flag) to exercise reading the status register from within a block.
+    """
+    test_program = [4, 1, 5, 20, 3, 7, 1, 18, 21, 27, 0, 252, 28, 0, 0] + [0] * 5 + [0, 2]
+    vm_hash = get_vm_hash_after_exec(test_program)
+    
+    vm = Digirule()
+    vm.use_block_compiler = True
+    vm.load_program(test_program)
+    vm_hash_compiled = get_vm_hash_after_exec(test_program, vm)
+    
+    assert vm._mem[20] == 7
+    assert vm_hash_compiled == vm_hash
+
+
+def test_snapshot_restore_fork():
+    """
+    Restoring (or forking from) a snapshot must replay exactly the same execution, including the inputs that the 
+    callbacks return from that point on.
+    """
+    # Adds every value read from the button register to address 200, forever.
+    test_program = [6, 253, 9, 200, 5, 200, 28, 0]
+    vm = Digirule()
+    vm.load_program(test_program)
+    vm.interactive_callback = DigiruleCallbackInputSequence(range(1, 100))
+    vm.run(max_n=20)
+    snap = vm.snapshot()
+    assert hash(snap) == hash(vm.snapshot())
+    
+    vm.run(max_n=40)
+    expected = vm.snapshot()
+    assert expected != snap
+    
+    forked = vm.fork(snap)
+    assert forked.snapshot() == snap
+    assert forked.run(max_n=40).n_steps == 40 and forked.snapshot() == expected
+    # The original VM is not affected by its fork.
+    assert vm.snapshot() == expected
+    
+    vm.restore(snap)
+    vm.run(max_n=40)
+    assert vm.snapshot() == expected
+
+
+def test_loop_detection():
+    """
+    Programs that never halt are stopped once they return to a state they have been in before.
+    """
+    for engine in [None, "use_decode_cache", "use_block_compiler"]:
+        for stride in [1, 64]:
+            vm = Digirule()
+            if engine is not None:
+                setattr(vm, engine, True)
+            vm.loop_detection_stride = stride
+            # Increments address 200 forever, the state repeats every 256 iterations of 2 instructions.
+            vm.load_program([19, 200, 28, 0])
+            result = vm.run(max_n=100000)
+            assert isinstance(result.halt_reason, DgtoolsErrorInfiniteLoop) and result.n_steps < 100000, \
+                   f"Loop not detected ({engine}, {stride})."
+            assert result.halt_reason.period == 512
+            # Programs that halt are not affected.
+            vm.load_program([0x1C, 0x02, 0x00])
+            vm.goto(0)
+            result = vm.run(max_n=10)
+            assert result.n_steps == 2 and isinstance(result.halt_reason, DgtoolsErrorProgramHalt)
+
+
+def test_loop_detection_nondeterministic():
+    """
+    Loops that draw random numbers are not reported as infinite and detecting a loop does not repeat its output.
+    """
+    for engine in [None, "use_decode_cache", "use_block_compiler"]:
+        for seed in range(200):
+            random.seed(seed)
+            vm = Digirule2U()
+            if engine is not None:
+                setattr(vm, engine, True)
+            vm.loop_detection_stride = 1
+            # RANDA, ANDLA 1, BCRSC 0, 252, JUMP 0, HALT: draws random numbers until an odd one.
+            vm.load_program([47, 23, 1, 38, 0, 252, 40, 0, 0])
+            result = vm.run(max_n=10000)
+            assert isinstance(result.halt_reason, DgtoolsErrorProgramHalt), f"Seed {seed} did not halt ({engine})."
+
+    class OutputRecorder(DigiruleCallbackOutputBase):
+        def __init__(self):
+            super().__init__("Recorder")
+            self._value = []
+
+        def on_new_data(self, a_value):
+            self._value.append(a_value)
+
+    vm = Digirule2U()
+    vm.comout_callback = OutputRecorder()
+    vm.loop_detection_stride = 1
+    # COMOUT, JUMP 0
+    vm.load_program([192, 40, 0])
+    result = vm.run(max_n=1000)
+    assert isinstance(result.halt_reason, DgtoolsErrorInfiniteLoop) and result.halt_reason.period == 2
+    assert len(vm.comout_callback.value) == (result.n_steps + 1) // 2
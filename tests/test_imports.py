@@ -0,0 +1,39 @@
+"""
+
+Contains tests for the lazy imports of the dgtools package.
+
+Importing dgtools must not import the heavy third party packages that only some of its tools need, these are
+imported the first time one of the names that depend on them is accessed.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+
+CHECK_IMPORTS = """
+import json, sys
+import dgtools
+heavy = ["pygments", "pyparsing", "urwid", "intelhex"]
+before = [a_module for a_module in heavy if a_module in sys.modules]
+lazy_before = "DigiruleASMLexer" in vars(dgtools)
+lexer = dgtools.DigiruleASMLexer
+print(json.dumps({"before":before,
+                  "lazy_before":lazy_before,
+                  "lexer":f"{lexer.__module__}.{lexer.__name__}",
+                  "lazy_after":"DigiruleASMLexer" in vars(dgtools),
+                  "pygments_after":"pygments" in sys.modules}))
+"""
+
+
+def test_lazy_imports():
+    # Run from the root of the repository, so that the package is importable without being installed.
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", CHECK_IMPORTS], capture_output=True, text=True, check=True, 
+                            cwd=repo_root)
+    imports = json.loads(result.stdout)
+    assert imports["before"] == [], "Heavy packages imported by dgtools."
+    assert not imports["lazy_before"]
+    assert imports["lexer"] == "dgtools.lexer.DigiruleASMLexer"
+    assert imports["lazy_after"] and imports["pygments_after"]
@@ -0,0 +1,75 @@
+"""
+
+Contains tests for the HTML trace of a program.
+
+A paged trace must write every step exactly once, across pages that link to each other and to an index page whose
+links all resolve to a page and an anchor within it.
+"""
+
+import os
+import re
+
+from dgtools.assembler import DgAssembler
+from dgtools.digirule import Digirule
+from dgtools.dgb_archive import DGB_Archive
+from dgtools.dgsim import trace_program
+
+
+SOURCE = """start:
+    COPYLR 5 count
+loop:
+    DECRJZ count
+    JUMP loop
+    HALT
+count:
+.DB 0
+"""
+
+
+def get_program():
+    assembler = DgAssembler(Digirule)
+    compiled_program = assembler.asm_ast_to_obj(assembler.text_to_ast(SOURCE))
+    return DGB_Archive(compiled_program["program"], compiled_program["labels"],
+                       source_map=compiled_program["source_map"])
+
+
+def test_trace_program_paged(tmp_path):
+    index_file = tmp_path / "trace.html"
+    machine, n, halt_reason = trace_program(get_program(), str(index_file), max_n=100, page_size=4)
+    assert n == 11
+
+    # 11 steps (0..10) at 4 steps per page.
+    page_files = [f"trace_{page:04d}.html" for page in range(3)]
+    assert sorted(os.listdir(tmp_path)) == ["trace.html"] + page_files
+    pages = [(tmp_path / a_file).read_text() for a_file in page_files]
+
+    anchors = [re.findall(r"<a id=\"(\w+)\"></a>", a_page) for a_page in pages]
+    steps = [an_anchor for page_anchors in anchors for an_anchor in page_anchors if an_anchor != "program_halt"]
+    assert steps == [f"n{a_step}" for a_step in range(11)]
+    assert [len(page_anchors) for page_anchors in anchors] == [4, 4, 4]
+    assert "program_halt" in anchors[2] and "Program terminated at HALT instruction." in pages[2]
+
+    for page, a_page in enumerate(pages):
+        assert "<a href=\"trace.html\">Index</a>" in a_page
+        assert ("Previous</a>" in a_page) == (page > 0)
+        if page > 0:
+            assert f"<a href=\"{page_files[page - 1]}\">Previous</a>" in a_page
+        assert ("Next</a>" in a_page) == (page < 2)
+        if page < 2:
+            assert f"<a href=\"{page_files[page + 1]}\">Next</a>" in a_page
+
+    index = index_file.read_text()
+    links = re.findall(r"<a href=\"([\w.]+)#(\w+)\">", index)
+    assert len(links) == 12
+    for a_file, an_anchor in links:
+        assert an_anchor in anchors[page_files.index(a_file)]
+    assert "Program stopped at n=10" in index
+
+
+def test_trace_program_single_file(tmp_path):
+    trace_file = tmp_path / "trace.html"
+    trace_program(get_program(), str(trace_file), max_n=100)
+    assert os.listdir(tmp_path) == ["trace.html"]
+    trace = trace_file.read_text()
+    assert re.findall(r"<a id=\"(\w+)\"></a>", trace) == [f"n{a_step}" for a_step in range(11)] + ["program_halt"]
+    assert "<nav>" not in trace
@@ -0,0 +1,64 @@
+"""
+
+Contains tests for the cache of simulation results.
+
+Archives that hold the same image must have the same content hash and a program that has been run before must be
+served from the cache.
+"""
+
+from dgtools.dgb_archive import DGB_Archive
+from dgtools.result_cache import DGB_ResultCache, DGB_ResultStore, result_key
+from dgtools.dgsim import run_program
+
+
+def test_content_hash(tmp_path):
+    archive = DGB_Archive([3, 10, 8, 0], {"start":0}, "2A", [(1, 1)] * 4, {"title":"Counter"})
+    archive.save(tmp_path / "program.dgb", as_json=True)
+    same_image = DGB_Archive.load(tmp_path / "program.dgb").with_program(bytearray([3, 10, 8, 0]))
+    assert same_image.content_hash == archive.content_hash
+    assert DGB_Archive([3, 10, 8, 0], {}).content_hash == archive.content_hash
+    assert DGB_Archive([3, 10, 8, 0], {}, "2U").content_hash != archive.content_hash
+    assert archive.with_program([3, 11, 8, 0]).content_hash != archive.content_hash
+
+
+def test_cached_results(tmp_path):
+    cache = DGB_ResultCache(tmp_path / "cache")
+    # COPYLR 10, 8 then HALT
+    program = DGB_Archive([3, 10, 8, 0], {"start":0})
+    result = run_program(program, max_n=10, result_cache=cache)
+    assert result[0][8] == 10 and result[1:] == (2, "Program terminated at HALT instruction.")
+    assert cache.get(result_key(program, 10)) == result
+    assert cache.get(result_key(program, 11)) is None
+    assert cache.get(result_key(program, 10, input_streams={"button":[1, 2]})) is None
+    # A program with the same image is not simulated again
+    cache.put(result_key(program, 10), bytes(256), 5, None)
+    assert run_program(DGB_Archive([3, 10, 8, 0], {"other":1}), max_n=10, result_cache=cache) == (bytes(256), 5, None)
+
+
+def test_result_store(tmp_path):
+    # COPYRA 253 (the button register), COPYAR 8, then HALT
+    program = DGB_Archive([6, 253, 5, 8, 0], {})
+    with DGB_ResultStore(tmp_path / "results.db", max_entries=2) as store:
+        results = [run_program(program, max_n=10, input_streams={"button":[k]}, result_cache=store) 
+                   for k in range(3)]
+        assert [a_result[0][8] for a_result in results] == [0, 1, 2]
+        # The least recently used result is evicted
+        assert len(store) == 2
+        assert store.get(result_key(program, 10, input_streams={"button":[0]})) is None
+        assert store.get(result_key(program, 10, input_streams={"button":[1]})) == results[1]
+        store.put(result_key(program, 20), bytes(256), 3, None)
+        assert store.get(result_key(program, 10, input_streams={"button":[2]})) is None
+    with DGB_ResultStore(tmp_path / "results.db") as store:
+        assert run_program(program, max_n=10, input_streams={"button":[1]}, result_cache=store) == results[1]
+
+
+def test_random_results_not_cached(tmp_path):
+    cache = DGB_ResultCache(tmp_path / "cache")
+    # RANDA, COPYAR 8 then HALT
+    program = DGB_Archive([47, 7, 8, 0], {}, "2U")
+    run_program(program, max_n=10, result_cache=cache)
+    assert cache.get(result_key(program, 10)) is None
+    # Programs that hold the opcode of RANDA without executing it are cached
+    program = DGB_Archive([3, 47, 8, 0], {})
+    result = run_program(program, max_n=10, result_cache=cache)
+    assert cache.get(result_key(program, 10)) == result